@@ -0,0 +1,307 @@
+"""
+Batch Extract - Process a directory or manifest of treatment plan PDFs
+
+Runs process_pdf for many plans across an ExtractorWorkerPool and writes one
+NDJSON line per plan. Every finished plan is also recorded in a checkpoint
+file; rerunning the same command skips plans that already completed, so an
+interrupted backfill resumes where it stopped.
+
+Input is either a directory (plan ID = file name without .pdf, patient ID =
+--patient-id or the name of the containing directory) or a manifest:
+- CSV with a header row: pdf_path,patient_id,treatment_plan_id[,start_date,default_points]
+- JSONL with the same keys, one object per line
+Relative pdf_path values are resolved against the manifest's directory.
+
+Usage:
+    python batch_extract.py archive/ --output results.ndjson --workers 4
+    python batch_extract.py --manifest plans.csv --output results.ndjson
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator, Set
+
+from worker_pool import ExtractorWorkerPool
+from serialization import dumps_compact
+
+logger = logging.getLogger(__name__)
+
+
+def plans_from_directory(
+    directory: str,
+    patient_id: Optional[str] = None,
+    recursive: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """Yield one plan per PDF file under directory, in a stable order"""
+    root = Path(directory)
+    pattern = '**/*.pdf' if recursive else '*.pdf'
+    for path in sorted(p for p in root.glob(pattern) if p.is_file()):
+        yield {
+            'pdf_path': str(path),
+            'patient_id': patient_id or path.parent.name,
+            'treatment_plan_id': path.stem
+        }
+
+
+def plans_from_manifest(manifest: str) -> Iterator[Dict[str, Any]]:
+    """Yield plans from a CSV or JSONL manifest"""
+    manifest = Path(manifest)
+    with open(manifest, encoding='utf-8', newline='') as f:
+        if manifest.suffix in ('.jsonl', '.ndjson'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        
+        for line_number, row in enumerate(rows, 1):
+            missing = [key for key in ('pdf_path', 'patient_id', 'treatment_plan_id') if not row.get(key)]
+            if missing:
+                raise ValueError(f"{manifest}: entry {line_number} is missing {', '.join(missing)}")
+            
+            pdf_path = Path(row['pdf_path'])
+            if not pdf_path.is_absolute():
+                pdf_path = manifest.parent / pdf_path
+            plan = {
+                'pdf_path': str(pdf_path),
+                'patient_id': str(row['patient_id']),
+                'treatment_plan_id': str(row['treatment_plan_id'])
+            }
+            if row.get('start_date'):
+                plan['start_date'] = date.fromisoformat(str(row['start_date']))
+            if row.get('default_points'):
+                plan['default_points'] = int(row['default_points'])
+            yield plan
+
+
+def plan_key(plan: Dict[str, Any]) -> str:
+    """Checkpoint key of a plan"""
+    return f"{plan['patient_id']}/{plan['treatment_plan_id']}"
+
+
+def load_checkpoint(path: Path, retry_failed: bool = False) -> Set[str]:
+    """Keys of plans that need no further work"""
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from a killed run
+            if entry['status'] == 'ok' or not retry_failed:
+                done.add(entry['key'])
+            else:
+                done.discard(entry['key'])
+    return done
+
+
+class BatchProgress:
+    """Progress and throughput reporting for a batch run"""
+    
+    def __init__(self, total: int, skipped: int, interval: float = 10.0):
+        self.total = total
+        self.skipped = skipped
+        self.interval = interval
+        self.succeeded = 0
+        self.failed = 0
+        self.pages = 0
+        self._started = time.monotonic()
+        self._last_report = self._started
+    
+    def record(self, ok: bool, pages: int = 0):
+        if ok:
+            self.succeeded += 1
+            self.pages += pages
+        else:
+            self.failed += 1
+        if time.monotonic() - self._last_report >= self.interval:
+            self.report()
+    
+    def report(self):
+        self._last_report = time.monotonic()
+        elapsed = self._last_report - self._started
+        done = self.succeeded + self.failed
+        remaining = self.total - self.skipped - done
+        rate = done / elapsed if elapsed else 0.0
+        eta = f"{remaining / rate:.0f}s" if rate else '?'
+        logger.info(
+            "%d/%d plans done (%d failed, %d skipped), %.2f plans/s, %.1f pages/s, ETA %s",
+            done + self.skipped,
+            self.total,
+            self.failed,
+            self.skipped,
+            rate,
+            self.pages / elapsed if elapsed else 0.0,
+            eta
+        )
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started
+        done = self.succeeded + self.failed
+        return {
+            'total': self.total,
+            'skipped': self.skipped,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'plans_per_second': round(done / elapsed, 3) if elapsed else None,
+            'pages_per_second': round(self.pages / elapsed, 3) if elapsed else None
+        }
+
+
+def run_batch(
+    plans: List[Dict[str, Any]],
+    output_path: str,
+    checkpoint_path: Optional[str] = None,
+    num_workers: Optional[int] = None,
+    nlp_model: str = 'en_core_web_sm',
+    timeout: Optional[float] = None,
+    retry_failed: bool = False,
+    progress_interval: float = 10.0,
+    cache_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Process plans on a worker pool, appending results to output_path
+    
+    Each output line is {'key', 'pdf_path', 'patient_id', 'treatment_plan_id',
+    'status': 'ok' | 'error', 'result' | 'error'}. A line is written before
+    its checkpoint entry, so a crash in between can only duplicate a line on
+    resume, never lose one.
+    
+    Args:
+        plans: Plans as produced by plans_from_directory / plans_from_manifest
+        output_path: NDJSON file to append to
+        checkpoint_path: Checkpoint file (defaults to output_path + '.checkpoint')
+        num_workers: Worker processes (defaults to CPU count)
+        nlp_model: spaCy model name or path
+        timeout: Per-plan timeout in seconds, counted from when a worker
+            starts the plan (the worker is then replaced)
+        retry_failed: Reprocess plans that failed in an earlier run
+        progress_interval: Seconds between progress log lines
+        cache_dir: Result cache directory, so duplicate PDFs are analysed once
+        
+    Returns:
+        Run summary (counts and throughput)
+    """
+    checkpoint = Path(checkpoint_path or f"{output_path}.checkpoint")
+    done = load_checkpoint(checkpoint, retry_failed)
+    todo = [plan for plan in plans if plan_key(plan) not in done]
+    progress = BatchProgress(len(plans), len(plans) - len(todo), progress_interval)
+    
+    if not todo:
+        logger.info("Nothing to do: all %d plans are in the checkpoint", len(plans))
+        return progress.summary()
+    
+    num_workers = num_workers or os.cpu_count() or 1
+    # Keep a bounded number of jobs in flight rather than queueing the whole archive
+    max_in_flight = num_workers * 2
+    pending = iter(todo)
+    in_flight: Dict[concurrent.futures.Future, Dict[str, Any]] = {}
+    job_ids: Dict[concurrent.futures.Future, str] = {}
+    
+    with open(output_path, 'ab') as output, \
+            open(checkpoint, 'a', encoding='utf-8') as checkpoint_file, \
+            ExtractorWorkerPool(num_workers=num_workers, nlp_model=nlp_model, cache_dir=cache_dir) as pool:
+        
+        def fill():
+            for plan in pending:
+                # Timed by the pool from when a worker starts the plan; an
+                # overrunning worker is replaced
+                job_id = pool.submit(**plan, job_timeout=timeout)
+                future = pool.future(job_id)
+                in_flight[future] = plan
+                job_ids[future] = job_id
+                if len(in_flight) >= max_in_flight:
+                    break
+        
+        def finish(future, plan, record):
+            output.write(dumps_compact(record) + b'\n')
+            output.flush()
+            checkpoint_file.write(json.dumps({'key': record['key'], 'status': record['status']}) + '\n')
+            checkpoint_file.flush()
+            in_flight.pop(future)
+            job_ids.pop(future)
+        
+        fill()
+        while in_flight:
+            finished, _ = concurrent.futures.wait(
+                in_flight, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                plan = in_flight[future]
+                record = {'key': plan_key(plan), **plan}
+                try:
+                    result = pool.result(job_ids[future], timeout=0)
+                    record.update(status='ok', result=result)
+                    progress.record(True, result['metadata'].get('total_pages', 0))
+                except Exception as e:
+                    record.update(status='error', error=f"{type(e).__name__}: {e}")
+                    progress.record(False)
+                    logger.warning("%s failed: %s", record['key'], record['error'])
+                finish(future, plan, record)
+            
+            fill()
+    
+    progress.report()
+    return progress.summary()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('directory', nargs='?', help='directory of PDFs')
+    source.add_argument('--manifest', help='CSV or JSONL manifest of plans')
+    parser.add_argument('--output', required=True, help='NDJSON file to append results to')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: OUTPUT.checkpoint)')
+    parser.add_argument('--patient-id', help='patient ID for all PDFs in directory mode')
+    parser.add_argument('--no-recursive', action='store_true', help='only the top level of the directory')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    parser.add_argument('--timeout', type=float, help='per-plan timeout in seconds')
+    parser.add_argument('--retry-failed', action='store_true', help='reprocess plans that failed before')
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='seconds between progress lines')
+    parser.add_argument('--cache-dir', help='result cache directory (duplicate PDFs are analysed once)')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    if args.manifest:
+        plans = list(plans_from_manifest(args.manifest))
+    else:
+        plans = list(plans_from_directory(args.directory, args.patient_id, not args.no_recursive))
+    
+    keys = [plan_key(plan) for plan in plans]
+    if len(set(keys)) != len(keys):
+        print("Duplicate patient/plan IDs in input; each plan needs a unique key", file=sys.stderr)
+        return 2
+    
+    try:
+        summary = run_batch(
+            plans,
+            args.output,
+            args.checkpoint,
+            args.workers,
+            args.model,
+            args.timeout,
+            args.retry_failed,
+            args.progress_interval,
+            args.cache_dir
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
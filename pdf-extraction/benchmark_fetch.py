@@ -0,0 +1,210 @@
+"""
+Fetch Benchmark - Serial download-then-extract vs. prefetched downloads
+
+Serves synthetic treatment-plan PDFs from a local stand-in for object
+storage (an HTTP/1.1 keep-alive server with configurable per-request latency
+and a rate of transient 503 errors), then processes them twice:
+- serial:   download one PDF, extract it, download the next (what the
+            reprocess endpoint did with download_from_storage)
+- prefetch: PDFFetcher.prefetch() downloads ahead over pooled connections
+            while the extractor works through the buffers
+
+Both runs extract from memory buffers, so the difference is the download
+time that prefetching hides behind extraction.
+
+The stand-in server can also be run on its own, e.g. to feed pdf_url jobs
+to job_queue.py consumers:
+    python benchmark_fetch.py serve fixtures/ --port 8765 --latency 0.2
+
+Usage:
+    python benchmark_fetch.py run --documents 20 --latency 0.15 --failure-rate 0.05
+"""
+
+import argparse
+import http.server
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from pdf_fetcher import PDFFetcher
+from synthetic_pdf import generate_plan_pdf
+
+
+class StandInStorage(http.server.ThreadingHTTPServer):
+    """
+    Local object storage stand-in: GET /<file name> serves a file from directory
+    
+    Every response is delayed by latency seconds (network round trip plus
+    storage time to first byte), and a failure_rate fraction of requests
+    gets a 503 so retries are exercised. Connections are kept alive.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, directory: str, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.1, failure_rate: float = 0.0, seed: int = 0):
+        super().__init__((host, port), _StorageHandler)
+        self.directory = Path(directory)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'connections': 0, 'failures_injected': 0}
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def count(self, name: str):
+        with self.lock:
+            self.counts[name] += 1
+    
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.failure_rate
+    
+    def start(self) -> 'StandInStorage':
+        threading.Thread(target=self.serve_forever, name='stand-in-storage', daemon=True).start()
+        return self
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _StorageHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: StandInStorage
+    
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+    
+    def do_GET(self):
+        self.server.count('requests')
+        time.sleep(self.server.latency)
+        path = self.server.directory / Path(self.path.lstrip('/')).name
+        if self.server.should_fail():
+            self.server.count('failures_injected')
+            self._send(503, b'injected failure')
+        elif not path.is_file():
+            self._send(404, b'not found')
+        else:
+            self._send(200, path.read_bytes(), 'application/pdf')
+    
+    def _send(self, status: int, body: bytes, content_type: str = 'text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def run_benchmark(
+    documents: int,
+    latency: float,
+    failure_rate: float,
+    max_connections: int,
+    nlp_model: str,
+    fixtures_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    from main_extractor import PDFTreatmentPlanExtractor
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(fixtures_dir or tmp)
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(documents):
+            generate_plan_pdf(str(directory / f"plan-{i}.pdf"), exercises=6, pages=2, seed=i)
+        
+        extractor = PDFTreatmentPlanExtractor(nlp_model=nlp_model).warm_up()
+        storage = StandInStorage(str(directory), latency=latency, failure_rate=failure_rate).start()
+        urls = [f"{storage.base_url}/plan-{i}.pdf" for i in range(documents)]
+        report = {'documents': documents, 'latency_s': latency, 'failure_rate': failure_rate}
+        try:
+            # Serial: one connection, next download starts after the extraction
+            with PDFFetcher(max_connections=1, backoff=0.05) as fetcher:
+                started = time.perf_counter()
+                failures = 0
+                for i, url in enumerate(urls):
+                    try:
+                        pdf = fetcher.fetch(url)
+                    except Exception:
+                        failures += 1
+                        continue
+                    extractor.process_pdf(pdf, 'benchmark', f"plan-{i}")
+                report['serial'] = {'seconds': round(time.perf_counter() - started, 3), 'failures': failures,
+                                    **fetcher.stats()}
+            
+            with PDFFetcher(max_connections=max_connections, backoff=0.05) as fetcher:
+                started = time.perf_counter()
+                failures = 0
+                for i, pdf in fetcher.prefetch(range(documents), url=lambda i: urls[i]):
+                    if isinstance(pdf, Exception):
+                        failures += 1
+                        continue
+                    extractor.process_pdf(pdf, 'benchmark', f"plan-{i}")
+                report['prefetch'] = {'seconds': round(time.perf_counter() - started, 3), 'failures': failures,
+                                      **fetcher.stats()}
+            report['server'] = dict(storage.counts)
+        finally:
+            storage.stop()
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{report['documents']} documents, {report['latency_s'] * 1000:.0f} ms storage latency, "
+          f"{report['failure_rate']:.0%} injected 503s")
+    for mode in ('serial', 'prefetch'):
+        run = report[mode]
+        print(f"  {mode:<9} {run['seconds']:>7.2f} s  "
+              f"({report['documents'] / run['seconds']:.1f} docs/s, {run['failures']} failed, "
+              f"{run['opened']} connections opened, {run['reused']} reused)")
+    print(f"  speedup   {report['serial']['seconds'] / report['prefetch']['seconds']:.2f}x")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    run = commands.add_parser('run', help='compare serial and prefetched processing')
+    run.add_argument('--documents', type=int, default=20)
+    run.add_argument('--max-connections', type=int, default=8)
+    run.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    run.add_argument('--fixtures-dir', help='keep the generated PDFs in this directory')
+    
+    serve = commands.add_parser('serve', help='run the stand-in storage server')
+    serve.add_argument('directory', help='directory of PDFs to serve')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    
+    for command in (run, serve):
+        command.add_argument('--latency', type=float, default=0.1, help='seconds per request')
+        command.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered 503')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'serve':
+        storage = StandInStorage(args.directory, args.host, args.port, args.latency, args.failure_rate)
+        print(f"Serving {args.directory} at {storage.base_url}/<file name>")
+        try:
+            storage.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    report = run_benchmark(args.documents, args.latency, args.failure_rate, args.max_connections,
+                           args.model, args.fixtures_dir)
+    print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Pipeline Benchmark - Per-stage latency and throughput on synthetic plans
+
+Generates treatment-plan PDFs with synthetic_pdf.py for a set of scenarios
+(short plan, long plan with boilerplate, partly scanned plan, ...) and times
+each pipeline stage on its own:
+- extract_text: PDFParser.extract_text
+- clean_text:   PDFParser.clean_text
+- sections:     PDFParser.identify_sections
+- nlp:          NLPExtractor.extract_all
+- missions:     MissionGenerator.generate_missions
+
+Results (p50/p90/p99 latency, throughput) are saved as JSON. The compare
+command checks a run against a stored baseline and exits non-zero if a
+stage got slower than the allowed threshold.
+
+Usage:
+    python benchmark_pipeline.py run --iterations 20 --output bench.json
+    python benchmark_pipeline.py run --baseline baseline.json
+    python benchmark_pipeline.py compare baseline.json bench.json --threshold 0.15
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from pdf_parser import PDFParser
+from nlp_extractor import NLPExtractor
+from mission_generator import MissionGenerator
+from synthetic_pdf import generate_plan_pdf
+
+STAGES = ['extract_text', 'clean_text', 'sections', 'nlp', 'missions']
+
+# Scenario name -> synthetic_pdf.generate_plan_pdf arguments
+SCENARIOS = {
+    'short': {'exercises': 4, 'boilerplate': 0},
+    'typical': {'exercises': 10, 'pages': 3, 'boilerplate': 2},
+    'long': {'exercises': 30, 'pages': 20, 'boilerplate': 6},
+    'scanned': {'exercises': 8, 'pages': 2, 'scanned_pages': 4, 'boilerplate': 2},
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """q-th percentile (0-100) with linear interpolation"""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples_ms: List[float], pages: int) -> Dict[str, float]:
+    """Latency percentiles and throughput for one stage"""
+    mean = statistics.fmean(samples_ms)
+    return {
+        'samples': len(samples_ms),
+        'mean_ms': round(mean, 3),
+        'min_ms': round(min(samples_ms), 3),
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p90_ms': round(percentile(samples_ms, 90), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'max_ms': round(max(samples_ms), 3),
+        'docs_per_second': round(1000 / mean, 3) if mean else None,
+        'pages_per_second': round(pages * 1000 / mean, 3) if mean else None
+    }
+
+
+def run_iteration(
+    pdf_path: str,
+    parser: PDFParser,
+    nlp_extractor: NLPExtractor,
+    start_date: date
+) -> Dict[str, float]:
+    """Run every stage once on one document and return per-stage ms"""
+    timings = {}
+    
+    started = time.perf_counter()
+    pdf_data = parser.extract_text(pdf_path)
+    timings['extract_text'] = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    cleaned = parser.clean_text(pdf_data['full_text'])
+    timings['clean_text'] = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    parser.identify_sections(cleaned)
+    timings['sections'] = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    extracted = nlp_extractor.extract_all(cleaned)
+    timings['nlp'] = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    MissionGenerator(start_date).generate_missions(extracted, 'bench-plan', 'bench-patient')
+    timings['missions'] = (time.perf_counter() - started) * 1000
+    
+    return timings
+
+
+def run_benchmark(
+    scenarios: Optional[List[str]] = None,
+    iterations: int = 10,
+    warmup: int = 1,
+    nlp_model: str = 'en_core_web_sm',
+    fixtures_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Run the benchmark
+    
+    Args:
+        scenarios: Scenario names from SCENARIOS (default: all)
+        iterations: Timed iterations per scenario
+        warmup: Untimed iterations per scenario
+        nlp_model: spaCy model name or path
+        fixtures_dir: Where to write the synthetic PDFs (default: a
+            temporary directory that is removed afterwards)
+            
+    Returns:
+        Report in the format written by the run command
+    """
+    scenarios = scenarios or list(SCENARIOS)
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(unknown)}")
+    
+    parser = PDFParser()
+    started = time.perf_counter()
+    nlp_extractor = NLPExtractor(nlp_model).load()
+    model_load_ms = (time.perf_counter() - started) * 1000
+    start_date = date(2025, 1, 6)
+    
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'model': nlp_model,
+        'model_load_ms': round(model_load_ms, 3),
+        'iterations': iterations,
+        'scenarios': {}
+    }
+    
+    with tempfile.TemporaryDirectory(prefix='pdf-bench-') as tmp:
+        directory = Path(fixtures_dir or tmp)
+        directory.mkdir(parents=True, exist_ok=True)
+        
+        for name in scenarios:
+            document = generate_plan_pdf(str(directory / f"{name}.pdf"), **SCENARIOS[name])
+            
+            for _ in range(warmup):
+                run_iteration(document['path'], parser, nlp_extractor, start_date)
+            
+            samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+            for _ in range(iterations):
+                for stage, elapsed_ms in run_iteration(document['path'], parser, nlp_extractor, start_date).items():
+                    samples[stage].append(elapsed_ms)
+            
+            totals = [sum(run) for run in zip(*samples.values())]
+            report['scenarios'][name] = {
+                'document': {k: v for k, v in document.items() if k != 'path'},
+                'stages': {
+                    stage: summarize(values, document['total_pages'])
+                    for stage, values in samples.items()
+                },
+                'total': summarize(totals, document['total_pages'])
+            }
+    
+    return report
+
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.15,
+    metric: str = 'p50_ms',
+    min_delta_ms: float = 1.0
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Compare two reports stage by stage
+    
+    A stage regresses when metric grew by more than threshold (relative)
+    and by more than min_delta_ms (absolute, so sub-millisecond stages do
+    not flap on timer noise).
+    
+    Returns:
+        {'regressions': [...], 'improvements': [...], 'unchanged': [...]}
+    """
+    outcome = {'regressions': [], 'improvements': [], 'unchanged': []}
+    
+    for scenario, current_data in current['scenarios'].items():
+        baseline_data = baseline['scenarios'].get(scenario)
+        if baseline_data is None:
+            continue
+        stages = dict(current_data['stages'], total=current_data['total'])
+        baseline_stages = dict(baseline_data['stages'], total=baseline_data['total'])
+        
+        for stage, stats in stages.items():
+            if stage not in baseline_stages:
+                continue
+            before, after = baseline_stages[stage][metric], stats[metric]
+            entry = {
+                'scenario': scenario,
+                'stage': stage,
+                'baseline': before,
+                'current': after,
+                'change': round((after - before) / before, 4) if before else None
+            }
+            if after - before > min_delta_ms and after > before * (1 + threshold):
+                outcome['regressions'].append(entry)
+            elif before - after > min_delta_ms and after < before * (1 - threshold):
+                outcome['improvements'].append(entry)
+            else:
+                outcome['unchanged'].append(entry)
+    
+    return outcome
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"Model: {report['model']} (loaded in {report['model_load_ms']:.0f} ms), "
+          f"{report['iterations']} iterations per scenario")
+    for name, data in report['scenarios'].items():
+        document = data['document']
+        print(f"\n{name}: {document['total_pages']} pages ({document['scanned_pages']} scanned), "
+              f"{document['exercises']} exercises")
+        print(f"  {'stage':<14}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'docs/s':>10}")
+        for stage, stats in list(data['stages'].items()) + [('total', data['total'])]:
+            print(f"  {stage:<14}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+                  f"{stats['p99_ms']:>10.2f}{stats['docs_per_second']:>10.1f}")
+
+
+def print_comparison(outcome: Dict[str, List[Dict[str, Any]]], metric: str):
+    for label in ('regressions', 'improvements'):
+        if not outcome[label]:
+            continue
+        print(f"\n{label.capitalize()} ({metric}):")
+        for entry in outcome[label]:
+            print(f"  {entry['scenario']}/{entry['stage']}: {entry['baseline']:.2f} -> "
+                  f"{entry['current']:.2f} ms ({entry['change']:+.0%})")
+    if not outcome['regressions']:
+        print(f"\nNo regressions ({len(outcome['unchanged'])} stages unchanged)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    run = commands.add_parser('run', help='run the benchmark')
+    run.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                     help='scenario to run (repeatable; default: all)')
+    run.add_argument('--iterations', type=int, default=10)
+    run.add_argument('--warmup', type=int, default=1)
+    run.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    run.add_argument('--fixtures-dir', help='keep the generated PDFs in this directory')
+    run.add_argument('--output', help='write the JSON report here')
+    run.add_argument('--baseline', help='compare against this report and fail on regressions')
+    
+    compare = commands.add_parser('compare', help='compare a report against a baseline')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    
+    for command in (run, compare):
+        command.add_argument('--threshold', type=float, default=0.15,
+                             help='allowed relative slowdown (default 0.15 = 15%%)')
+        command.add_argument('--metric', default='p50_ms', choices=['mean_ms', 'p50_ms', 'p90_ms', 'p99_ms'])
+        command.add_argument('--min-delta-ms', type=float, default=1.0,
+                             help='ignore changes smaller than this many ms')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'run':
+        report = run_benchmark(args.scenario, args.iterations, args.warmup, args.model, args.fixtures_dir)
+        print_report(report)
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf-8')
+            print(f"\nReport written to {args.output}")
+        if not args.baseline:
+            return 0
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+    else:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        report = json.loads(Path(args.current).read_text(encoding='utf-8'))
+    
+    outcome = compare_reports(baseline, report, args.threshold, args.metric, args.min_delta_ms)
+    print_comparison(outcome, args.metric)
+    return 1 if outcome['regressions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
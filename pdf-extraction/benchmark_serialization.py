@@ -0,0 +1,119 @@
+"""
+Serialization Benchmark - Size and encode/decode time of result formats
+
+Builds a realistic result from example_output.json's extracted data (missions
+regenerated with MissionGenerator for a full plan) and, optionally, scales the
+mission list up to mimic long plans or batch exports. Each format in
+serialization.FORMATS is written and read back --repeat times.
+
+Usage:
+    python benchmark_serialization.py
+    python benchmark_serialization.py --scale 20 --repeat 5 --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, Any
+
+from mission_generator import MissionGenerator
+from serialization import FORMATS, MSGPACK_AVAILABLE, ORJSON_AVAILABLE, write_results, load_results
+
+EXAMPLE_OUTPUT = Path(__file__).resolve().parent / 'example_output.json'
+
+
+def build_results(scale: int = 1) -> Dict[str, Any]:
+    """A process_pdf-shaped result with the missions repeated scale times"""
+    example = json.loads(EXAMPLE_OUTPUT.read_text(encoding='utf-8'))
+    generator = MissionGenerator(date(2025, 1, 6))
+    missions = generator.generate_missions(example['extracted_data'], 'plan-123', 'patient-456')
+    calendar_events = generator.generate_calendar_events(missions)
+    
+    scaled_missions, scaled_events = [], []
+    for copy in range(scale):
+        plan_id = f'plan-{123 + copy}'
+        scaled_missions.extend(dict(m, treatment_plan_id=plan_id) for m in missions)
+        scaled_events.extend(calendar_events)
+    
+    metadata = dict(example['metadata'], missions_generated=len(scaled_missions))
+    return {
+        'extracted_data': example['extracted_data'],
+        'missions': scaled_missions,
+        'calendar_events': scaled_events,
+        'metadata': metadata
+    }
+
+
+def run_benchmark(scale: int = 1, repeat: int = 5) -> Dict[str, Any]:
+    """Measure every available format and return a report"""
+    results = build_results(scale)
+    report = {
+        'missions': len(results['missions']),
+        'calendar_events': len(results['calendar_events']),
+        'orjson': ORJSON_AVAILABLE,
+        'formats': {}
+    }
+    
+    with tempfile.TemporaryDirectory(prefix='pdf-serialization-') as tmp:
+        for format in FORMATS:
+            if format == 'msgpack' and not MSGPACK_AVAILABLE:
+                report['formats'][format] = None
+                continue
+            path = os.path.join(tmp, f'results.{format}')
+            
+            encode, decode = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                write_results(results, path, format)
+                encode.append((time.perf_counter() - started) * 1000)
+                
+                started = time.perf_counter()
+                loaded = load_results(path, format)
+                decode.append((time.perf_counter() - started) * 1000)
+            
+            if len(loaded['missions']) != len(results['missions']):
+                raise RuntimeError(f"{format}: round trip lost missions")
+            
+            report['formats'][format] = {
+                'size_bytes': os.path.getsize(path),
+                'encode_ms': round(statistics.median(encode), 3),
+                'decode_ms': round(statistics.median(decode), 3)
+            }
+    
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help='repeat the plan\'s missions this many times')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per format (median is reported)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    
+    report = run_benchmark(args.scale, args.repeat)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    
+    print(f"{report['missions']} missions, {report['calendar_events']} calendar events "
+          f"(orjson {'available' if report['orjson'] else 'not installed'})")
+    baseline = report['formats']['json']
+    print(f"{'format':<14}{'size':>12}{'vs json':>9}{'encode ms':>12}{'decode ms':>12}")
+    for format, stats in report['formats'].items():
+        if stats is None:
+            print(f"{format:<14}  (not installed)")
+            continue
+        print(f"{format:<14}{stats['size_bytes']:>12,}{stats['size_bytes'] / baseline['size_bytes']:>8.0%} "
+              f"{stats['encode_ms']:>11.2f}{stats['decode_ms']:>12.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Startup Benchmark - Measures import and model-load time of the extractor
+
+Every measurement runs in a fresh interpreter so module caches from earlier
+runs do not hide regressions. Reports:
+- time to `import main_extractor`
+- time to construct PDFTreatmentPlanExtractor()
+- time for warm_up() (spaCy import + model load)
+- which heavy dependencies the plain import pulled in (should be none)
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --repeat 5 --max-import-ms 300 --json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Any, List
+
+# Modules that must not be imported by `import main_extractor`
+HEAVY_MODULES = ['spacy', 'pdfplumber', 'PyPDF2', 'pytesseract', 'PIL', 'dateparser', 'dateutil']
+
+_PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import main_extractor
+t1 = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+extractor = main_extractor.PDFTreatmentPlanExtractor(nlp_model={model!r})
+t2 = time.perf_counter()
+load_error = None
+if {load!r}:
+    try:
+        extractor.warm_up()
+    except Exception as e:
+        load_error = f"{{type(e).__name__}}: {{e}}"
+t3 = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (t1 - t0) * 1000,
+    'construct_ms': (t2 - t1) * 1000,
+    'model_load_ms': (t3 - t2) * 1000 if {load!r} and load_error is None else None,
+    'heavy_modules_after_import': heavy,
+    'load_error': load_error,
+}}))
+'''
+
+
+def run_probe(model: str, load_model: bool) -> Dict[str, Any]:
+    """Run one measurement in a fresh interpreter"""
+    code = _PROBE.format(heavy=HEAVY_MODULES, model=model, load=load_model)
+    proc = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Min/median/max of a list of timings"""
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'max': max(values)
+    }
+
+
+def run_benchmark(model: str = 'en_core_web_sm', repeat: int = 3, load_model: bool = True) -> Dict[str, Any]:
+    """Run the startup benchmark and return a summary report"""
+    runs = [run_probe(model, load_model) for _ in range(repeat)]
+    
+    report = {
+        'python': sys.version.split()[0],
+        'model': model,
+        'repeat': repeat,
+        'import_ms': summarize([r['import_ms'] for r in runs]),
+        'construct_ms': summarize([r['construct_ms'] for r in runs]),
+        'heavy_modules_after_import': sorted({m for r in runs for m in r['heavy_modules_after_import']}),
+        'load_error': runs[-1]['load_error']
+    }
+    
+    load_times = [r['model_load_ms'] for r in runs if r['model_load_ms'] is not None]
+    report['model_load_ms'] = summarize(load_times) if load_times else None
+    
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model to load')
+    parser.add_argument('--repeat', type=int, default=3, help='number of fresh-interpreter runs')
+    parser.add_argument('--skip-model', action='store_true', help='only measure import and construction')
+    parser.add_argument('--max-import-ms', type=float, help='fail if median import time exceeds this')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    
+    report = run_benchmark(args.model, args.repeat, not args.skip_model)
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import main_extractor:  {report['import_ms']['median']:8.1f} ms (median of {args.repeat})")
+        print(f"construct extractor:    {report['construct_ms']['median']:8.1f} ms")
+        if report['model_load_ms']:
+            print(f"warm_up() (model load): {report['model_load_ms']['median']:8.1f} ms")
+        elif report['load_error']:
+            print(f"warm_up() failed: {report['load_error']}")
+        print(f"Heavy modules imported eagerly: {', '.join(report['heavy_modules_after_import']) or 'none'}")
+    
+    failed = False
+    if report['heavy_modules_after_import']:
+        print("FAIL: heavy dependencies are imported at module import time", file=sys.stderr)
+        failed = True
+    if args.max_import_ms is not None and report['import_ms']['median'] > args.max_import_ms:
+        print(
+            f"FAIL: median import time {report['import_ms']['median']:.1f} ms "
+            f"exceeds {args.max_import_ms:.1f} ms",
+            file=sys.stderr
+        )
+        failed = True
+    
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+"""
+Bulk Regenerate - Re-run mission generation for every stored plan
+
+When MissionGenerator's rules change (default times, due offsets, points),
+every stored plan's missions must be regenerated from its saved
+extracted_data. Parsing and NLP are not repeated; only mission and calendar
+event generation is, for all plans, in parallel:
+
+- Stored extractions are streamed line by line from NDJSON files: either
+  batch_extract.py output ({'key', 'patient_id', 'treatment_plan_id',
+  'status', 'result': {...}}) or plain records ({'patient_id',
+  'treatment_plan_id', 'extracted_data', 'start_date'}); '-' reads stdin
+- Lines are sharded (--shard-size plans per task) across a process pool.
+  Workers parse their lines and generate; the parent only moves bytes
+- Output is written per shard: NDJSON lines (one per plan, encoded in the
+  workers) or a SQLiteMissionStore, one transaction per shard. The store is
+  synced (MissionStore.sync_plans(), see mission_diff.py): only changed
+  missions are written and completed missions keep their status. --replace
+  rewrites every plan's missions wholesale from rows built in the workers
+  instead, which is faster for a first load
+- Every plan is checkpointed with MissionGenerator.VERSION after its output
+  is written. Rerunning the same command skips plans already regenerated
+  with the current version, so an interrupted run resumes, and bumping the
+  version regenerates everything
+
+Each plan keeps its original start date: the stored record's start_date, or
+else the earliest scheduled_date among its stored missions.
+
+Usage:
+    python bulk_regenerate.py results.ndjson --output missions.ndjson --workers 8
+    python bulk_regenerate.py results.ndjson --store missions.db --shard-size 200
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from datetime import date
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Set, Tuple
+
+from mission_generator import MissionGenerator
+from mission_store import plan_rows
+from serialization import dumps_compact, loads
+
+logger = logging.getLogger(__name__)
+
+# Plans already regenerated with the current generator version (set per worker)
+_done: Set[str] = set()
+
+# (status, key, payload, mission count) of one input line
+ShardResult = Tuple[str, Optional[str], Any, int]
+
+
+def plan_from_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Regeneration input of a stored extraction record (None for failed
+    extractions)
+    
+    Raises:
+        ValueError: The record has no extracted_data or plan IDs
+    """
+    if record.get('status', 'ok') != 'ok':
+        return None
+    result = record.get('result') or {}
+    extracted_data = record.get('extracted_data', result.get('extracted_data'))
+    if extracted_data is None or 'patient_id' not in record or 'treatment_plan_id' not in record:
+        raise ValueError("record needs patient_id, treatment_plan_id and extracted_data")
+    
+    start_date = record.get('start_date')
+    if not start_date:
+        scheduled = [mission['scheduled_date'] for mission in result.get('missions', ()) if mission.get('scheduled_date')]
+        scheduled += [series['dtstart'] for series in result.get('recurring_missions', ())]
+        start_date = min(scheduled) if scheduled else None
+    return {
+        'key': record.get('key') or f"{record['patient_id']}/{record['treatment_plan_id']}",
+        'patient_id': record['patient_id'],
+        'treatment_plan_id': record['treatment_plan_id'],
+        'start_date': start_date,
+        'default_points': record.get('default_points') or 50,
+        'extracted_data': extracted_data
+    }
+
+
+def load_checkpoint(path: Path, version: str, retry_failed: bool = False) -> Set[str]:
+    """Keys of plans regenerated (or failed, unless retry_failed) with version"""
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from a killed run
+            if entry.get('version') != version:
+                continue
+            if entry['status'] == 'ok' or not retry_failed:
+                done.add(entry['key'])
+            else:
+                done.discard(entry['key'])
+    return done
+
+
+def _init_worker(done: Set[str]):
+    global _done
+    _done = done
+
+
+def _regenerate_shard(lines: List[bytes], output: str) -> List[ShardResult]:
+    """
+    Regenerate the plans of a shard (runs in a worker process)
+    
+    Args:
+        lines: The shard's stored extraction records
+        output: Payload of regenerated plans: 'ndjson' (encoded line),
+            'rows' (MissionStore.write_rows() input) or 'missions'
+            (MissionStore.sync_plans() input)
+            
+    Returns:
+        (status, key, payload, missions) per line: 'ok' with the payload and
+        the mission count; 'error' with a message; 'skipped' (already done,
+        or a failed extraction) with None
+    """
+    results = []
+    for line in lines:
+        key = None
+        try:
+            plan = plan_from_record(loads(line))
+            if plan is None or plan['key'] in _done:
+                results.append(('skipped', plan and plan['key'], None, 0))
+                continue
+            key = plan['key']
+            start_date = date.fromisoformat(plan['start_date']) if plan['start_date'] else None
+            generator = MissionGenerator(start_date)
+            missions, calendar_events = generator.generate_missions_and_events(
+                plan['extracted_data'],
+                plan['treatment_plan_id'],
+                plan['patient_id'],
+                plan['default_points']
+            )
+        except Exception as e:
+            results.append(('error', key, f"{type(e).__name__}: {e}", 0))
+            continue
+        if output == 'ndjson':
+            payload = dumps_compact({
+                'key': key,
+                'patient_id': plan['patient_id'],
+                'treatment_plan_id': plan['treatment_plan_id'],
+                'start_date': generator.start_date.isoformat(),
+                'generator_version': MissionGenerator.VERSION,
+                'status': 'ok',
+                'missions': missions,
+                'calendar_events': calendar_events
+            }) + b'\n'
+        elif output == 'rows':
+            payload = (plan['treatment_plan_id'], *plan_rows(plan['treatment_plan_id'], missions))
+        else:
+            payload = (plan['treatment_plan_id'], missions)
+        results.append(('ok', key, payload, len(missions)))
+    return results
+
+
+def iter_lines(paths: Iterable[str]) -> Iterator[bytes]:
+    """Non-blank lines of NDJSON files ('-' is stdin)"""
+    for path in paths:
+        f = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            for line in f:
+                if line.strip():
+                    yield line
+        finally:
+            if f is not sys.stdin.buffer:
+                f.close()
+
+
+class RegenerationProgress:
+    """Counts and throughput of a regeneration run"""
+    
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.missions = 0
+        # Store writes of synced plans (inserts, updates, deletes, unchanged)
+        self.sync: Dict[str, int] = {}
+        self._started = time.monotonic()
+        self._last_report = self._started
+    
+    def record(self, status: str, missions: int = 0):
+        if status == 'ok':
+            self.succeeded += 1
+            self.missions += missions
+        elif status == 'error':
+            self.failed += 1
+        else:
+            self.skipped += 1
+    
+    def record_sync(self, counts: Dict[str, int]):
+        for name, count in counts.items():
+            self.sync[name] = self.sync.get(name, 0) + count
+    
+    def maybe_report(self):
+        if time.monotonic() - self._last_report >= self.interval:
+            self.report()
+    
+    def report(self):
+        self._last_report = time.monotonic()
+        elapsed = self._last_report - self._started
+        done = self.succeeded + self.failed
+        logger.info(
+            "%d plans regenerated (%d failed, %d skipped), %.1f plans/s, %.0f missions/s",
+            done,
+            self.failed,
+            self.skipped,
+            done / elapsed if elapsed else 0.0,
+            self.missions / elapsed if elapsed else 0.0
+        )
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started
+        done = self.succeeded + self.failed
+        summary = {
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'missions': self.missions,
+            'elapsed_seconds': round(elapsed, 3),
+            'plans_per_second': round(done / elapsed, 1) if elapsed else None
+        }
+        if self.sync:
+            summary['sync'] = dict(self.sync)
+        return summary
+
+
+def run_regeneration(
+    lines: Iterable[bytes],
+    output_path: Optional[str] = None,
+    store=None,
+    checkpoint_path: Optional[str] = None,
+    num_workers: Optional[int] = None,
+    shard_size: int = 100,
+    retry_failed: bool = False,
+    progress_interval: float = 10.0,
+    replace: bool = False
+) -> Dict[str, Any]:
+    """
+    Regenerate the missions of stored extractions on a process pool
+    
+    A shard's output is written (and flushed or committed) before its
+    checkpoint entries, so a crash in between can only repeat work on
+    resume, never lose it.
+    
+    Args:
+        lines: Stored extraction records, one NDJSON line each
+        output_path: NDJSON file to append regenerated plans to
+        store: MissionStore to sync missions to instead
+        checkpoint_path: Checkpoint file (defaults to the output or
+            database path + '.checkpoint')
+        num_workers: Worker processes (defaults to CPU count)
+        shard_size: Plans per worker task
+        retry_failed: Regenerate plans that failed in an earlier run
+        progress_interval: Seconds between progress log lines
+        replace: Replace each plan's stored missions instead of syncing
+            them (store only; resets mission statuses)
+            
+    Returns:
+        Run summary (counts and plans per second)
+    """
+    if (output_path is None) == (store is None):
+        raise ValueError("Pass exactly one of output_path and store")
+    checkpoint = Path(checkpoint_path or f"{output_path or store.path}.checkpoint")
+    done = load_checkpoint(checkpoint, MissionGenerator.VERSION, retry_failed)
+    progress = RegenerationProgress(progress_interval)
+    
+    num_workers = num_workers or os.cpu_count() or 1
+    max_in_flight = num_workers * 2
+    lines = iter(lines)
+    shards = iter(lambda: list(islice(lines, shard_size)), [])
+    start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    in_flight: Set[concurrent.futures.Future] = set()
+    shard_output = 'ndjson' if output_path else ('rows' if replace else 'missions')
+    
+    output = open(output_path, 'ab') if output_path else None
+    try:
+        with open(checkpoint, 'a', encoding='utf-8') as checkpoint_file, \
+                concurrent.futures.ProcessPoolExecutor(
+                    num_workers,
+                    mp_context=multiprocessing.get_context(start_method),
+                    initializer=_init_worker,
+                    initargs=(done,)
+                ) as pool:
+            
+            def fill():
+                for shard in shards:
+                    in_flight.add(pool.submit(_regenerate_shard, shard, shard_output))
+                    if len(in_flight) >= max_in_flight:
+                        break
+            
+            fill()
+            while in_flight:
+                finished, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    in_flight.discard(future)
+                    results = future.result()
+                    _write_shard(results, output, store, replace, progress)
+                    for status, key, payload, _ in results:
+                        if status != 'skipped' and key is not None:
+                            checkpoint_file.write(json.dumps(
+                                {'key': key, 'status': status, 'version': MissionGenerator.VERSION}
+                            ) + '\n')
+                        if status == 'error':
+                            logger.warning("%s failed: %s", key, payload)
+                    checkpoint_file.flush()
+                progress.maybe_report()
+                fill()
+    finally:
+        if output is not None:
+            output.close()
+    
+    progress.report()
+    return progress.summary()
+
+
+def _write_shard(results: List[ShardResult], output, store, replace: bool, progress: RegenerationProgress):
+    """Write a shard's regenerated plans with one write (or one transaction)"""
+    ok = [payload for status, _, payload, _ in results if status == 'ok']
+    if output is not None:
+        errors = [
+            dumps_compact({'key': key, 'status': 'error', 'error': payload}) + b'\n'
+            for status, key, payload, _ in results if status == 'error'
+        ]
+        output.write(b''.join(ok + errors))
+        output.flush()
+    elif ok and replace:
+        store.write_rows(ok)
+    elif ok:
+        progress.record_sync(store.sync_plans(ok))
+    for status, _, _, missions in results:
+        progress.record(status, missions)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('inputs', nargs='+', help="NDJSON files of stored extractions ('-' for stdin)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help='NDJSON file to append regenerated missions to')
+    target.add_argument('--store', help='SQLite mission database to write to (see mission_store.py)')
+    parser.add_argument('--replace', action='store_true',
+                        help="replace stored missions instead of syncing them (resets statuses)")
+    parser.add_argument('--checkpoint', help='checkpoint file (default: OUTPUT.checkpoint / STORE.checkpoint)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--shard-size', type=int, default=100, help='plans per worker task')
+    parser.add_argument('--retry-failed', action='store_true', help='regenerate plans that failed before')
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='seconds between progress lines')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    store = None
+    if args.store:
+        from mission_store import SQLiteMissionStore
+        store = SQLiteMissionStore(args.store)
+    
+    try:
+        summary = run_regeneration(
+            iter_lines(args.inputs),
+            args.output,
+            store,
+            args.checkpoint,
+            args.workers,
+            args.shard_size,
+            args.retry_failed,
+            args.progress_interval,
+            args.replace
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
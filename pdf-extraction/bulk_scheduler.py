@@ -0,0 +1,334 @@
+"""
+Bulk Scheduler - Vectorized mission schedules for many plans at once
+
+MissionGenerator expands one occurrence at a time in Python (timedelta
+arithmetic, isoformat() per mission). Regenerating schedules for tens of
+thousands of patients spends nearly all of its time in that loop. The bulk
+scheduler instead takes the generator's recurring mission records (one per
+exercise, check item and appointment series, see recurrence.py) for any
+number of plans and computes every occurrence with NumPy datetime64 arrays:
+    
+    scheduled_date     = dtstart + index * interval            (datetime64[D])
+    scheduled_datetime = scheduled_date + scheduled_time       (datetime64[s])
+    due_datetime       = scheduled_date + due_time             (datetime64[s])
+
+Results are columnar (a Schedule): one array per column, one element per
+occurrence, in exactly the order and with exactly the dates of
+generate_missions() / expand_missions(). Schedule.to_missions() rebuilds the
+mission dicts when a consumer needs them.
+
+Requires numpy (optional dependency: pip install numpy).
+
+Usage:
+    plans = [(extracted_data, start_date, plan_id, patient_id), ...]
+    schedule = schedule_plans(plans)
+    schedule.columns['due_datetime']        # datetime64[s] array
+    schedule.iso_columns()['scheduled_date'] # ISO strings, as in mission dicts
+    
+    python bulk_scheduler.py extraction.json --plans 20000 --verify
+"""
+
+import argparse
+import json
+import sys
+import time as timer
+from datetime import date, timedelta
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Union
+
+from mission_generator import MissionGenerator
+from recurrence import RecurrenceRule, copy_template
+
+NUMPY_AVAILABLE = find_spec('numpy') is not None
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# Columns of a Schedule, one element per occurrence
+COLUMNS = ('plan', 'record', 'occurrence', 'scheduled_date', 'scheduled_datetime', 'due_datetime')
+
+# Fixed dtstart for parsing rules independently of their start date
+_EPOCH = date(1970, 1, 1)
+
+PlanRow = Tuple[Dict[str, Any], Union[str, date], str, str]
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("bulk scheduling requires the numpy package (pip install numpy)")
+
+
+@lru_cache(maxsize=1024)
+def _rule_parts(rrule: str) -> Tuple[int, int, Optional[int]]:
+    """(interval, count, until as days since 1970-01-01) of an RRULE, cached"""
+    rule = RecurrenceRule.parse(rrule, _EPOCH)
+    until = (rule.until - _EPOCH).days if rule.until is not None else None
+    return rule.interval, rule.count, until
+
+
+@lru_cache(maxsize=1024)
+def _seconds(value: Optional[str]) -> int:
+    """Seconds since midnight of an HH:MM[:SS] string; -1 if missing or malformed"""
+    if not isinstance(value, str):
+        return -1
+    try:
+        parts = [int(part) for part in value.split(':')]
+    except ValueError:
+        return -1
+    if not 2 <= len(parts) <= 3:
+        return -1
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def _timedelta_seconds(seconds: 'np.ndarray') -> 'np.ndarray':
+    """Seconds as timedelta64[s], with -1 as NaT"""
+    offsets = seconds.astype('timedelta64[s]')
+    offsets[seconds < 0] = np.timedelta64('NaT')
+    return offsets
+
+
+def _iso(values: 'np.ndarray', unit: str) -> 'np.ndarray':
+    """ISO strings of datetime64 values, formatting each distinct value once"""
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return np.datetime_as_string(distinct, unit=unit)[inverse.reshape(values.shape)]
+
+
+def _datetime(value: Any) -> 'np.datetime64':
+    try:
+        return np.datetime64(value, 's')
+    except (TypeError, ValueError):
+        return np.datetime64('NaT')
+
+
+class Schedule:
+    """
+    Columnar occurrences of recurring mission records
+    
+    Attributes:
+        records: The recurring mission records, in input order
+        record_plans: Plan index of each record
+        columns: COLUMNS -> NumPy array, one element per occurrence:
+            plan and record (indices), occurrence (1-based number within the
+            record's rule), scheduled_date, scheduled_datetime, due_datetime
+    """
+    
+    def __init__(self, records: List[Dict[str, Any]], record_plans: 'np.ndarray', columns: Dict[str, 'np.ndarray']):
+        self.records = records
+        self.record_plans = record_plans
+        self.columns = columns
+    
+    def __len__(self) -> int:
+        return len(self.columns['record'])
+    
+    def iso_columns(self) -> Dict[str, 'np.ndarray']:
+        """Date columns as ISO strings, formatted as in mission dicts"""
+        return {
+            'scheduled_date': _iso(self.columns['scheduled_date'], 'D'),
+            'scheduled_datetime': _iso(self.columns['scheduled_datetime'], 's'),
+            'due_datetime': _iso(self.columns['due_datetime'], 's')
+        }
+    
+    def plan_slices(self) -> List[slice]:
+        """Occurrence range of each plan (occurrences are grouped by plan)"""
+        plans = self.columns['plan']
+        count = int(self.record_plans.max()) + 1 if len(self.record_plans) else 0
+        bounds = np.searchsorted(plans, np.arange(count + 1))
+        return [slice(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+    
+    def to_missions(self, occurrences: Optional[slice] = None) -> List[Dict[str, Any]]:
+        """
+        Mission dicts of the occurrences (all by default), equal to
+        expand_missions() of the records
+        """
+        occurrences = occurrences or slice(None)
+        record_column = self.columns['record'][occurrences].tolist()
+        numbers = self.columns['occurrence'][occurrences].tolist()
+        scheduled_dates = _iso(self.columns['scheduled_date'][occurrences], 'D').tolist()
+        due = _iso(self.columns['due_datetime'][occurrences], 's').tolist()
+        
+        missions = []
+        for i, record_index in enumerate(record_column):
+            record = self.records[record_index]
+            mission = copy_template(record['template'])
+            mission['scheduled_date'] = scheduled_dates[i]
+            if record.get('due_time'):
+                mission['due_datetime'] = due[i]
+            for field, pattern in record.get('numbered', {}).items():
+                mission[field] = pattern.replace('{n}', str(numbers[i]))
+            missions.append(mission)
+        return missions
+
+
+def schedule_records(
+    records: List[Dict[str, Any]],
+    record_plans: Optional[Iterable[int]] = None
+) -> Schedule:
+    """
+    Compute all occurrences of recurring mission records
+    
+    Only the per-record fields are read in Python (cached per distinct RRULE
+    and time string); every per-occurrence value is computed with array
+    operations.
+    
+    Args:
+        records: Recurring mission records (recurrence.py format)
+        record_plans: Plan index of each record, non-decreasing (default: 0)
+        
+    Returns:
+        Schedule with the occurrences in record order
+    """
+    _require_numpy()
+    n = len(records)
+    plans = np.fromiter(record_plans, dtype=np.int64, count=n) if record_plans is not None else np.zeros(n, np.int64)
+    
+    intervals = np.empty(n, np.int64)
+    counts = np.empty(n, np.int64)
+    untils = np.full(n, np.iinfo(np.int64).max)
+    due_seconds = np.empty(n, np.int64)
+    scheduled_seconds = np.empty(n, np.int64)
+    exdates = []
+    for i, record in enumerate(records):
+        interval, count, until = _rule_parts(record['rrule'])
+        intervals[i] = interval
+        counts[i] = count if count is not None else np.iinfo(np.int64).max
+        if until is not None:
+            untils[i] = until
+        due_seconds[i] = _seconds(record.get('due_time'))
+        scheduled_seconds[i] = _seconds(record['template'].get('scheduled_time'))
+        for exdate in record.get('exdates', ()):
+            exdates.append((i, exdate))
+    starts = np.array([record['dtstart'] for record in records], dtype='datetime64[D]')
+    
+    # UNTIL bounds the count arithmetically: the last index with start + k * interval <= until
+    start_days = starts.astype(np.int64)
+    bounded = untils != np.iinfo(np.int64).max
+    counts[bounded] = np.minimum(counts[bounded], (untils[bounded] - start_days[bounded]) // intervals[bounded] + 1)
+    counts = np.maximum(counts, 0)
+    
+    # Occurrence k of every record: repeat each record count times, then number within it
+    record_index = np.repeat(np.arange(n), counts)
+    first = np.cumsum(counts) - counts
+    index = np.arange(len(record_index)) - np.repeat(first, counts)
+    days = start_days[record_index] + index * intervals[record_index]
+    
+    if exdates:
+        excluded = np.array([i for i, _ in exdates], np.int64)
+        excluded_days = np.array([day for _, day in exdates], dtype='datetime64[D]').astype(np.int64)
+        keep = ~np.isin(record_index * 2 ** 32 + days, excluded * 2 ** 32 + excluded_days)
+        record_index, index, days = record_index[keep], index[keep], days[keep]
+    
+    scheduled_date = days.astype('datetime64[D]')
+    midnight = scheduled_date.astype('datetime64[s]')
+    due = midnight + _timedelta_seconds(due_seconds)[record_index]
+    if (due_seconds < 0).any():
+        # Without a due_time every occurrence keeps the template's due_datetime
+        fixed_due = np.array([_datetime(record['template'].get('due_datetime')) for record in records])
+        due = np.where(due_seconds[record_index] < 0, fixed_due[record_index], due)
+    
+    columns = {
+        'plan': plans[record_index],
+        'record': record_index,
+        'occurrence': index + 1,
+        'scheduled_date': scheduled_date,
+        'scheduled_datetime': midnight + _timedelta_seconds(scheduled_seconds)[record_index],
+        'due_datetime': due
+    }
+    return Schedule(records, plans, columns)
+
+
+def schedule_plans(
+    plans: Iterable[PlanRow],
+    default_points: int = 50,
+    generator_class=MissionGenerator
+) -> Schedule:
+    """
+    Schedule many plans in one vectorized pass
+    
+    Args:
+        plans: (extracted_data, start_date, treatment_plan_id, patient_id) rows
+        default_points: As for MissionGenerator.generate_missions()
+        generator_class: MissionGenerator (or a subclass with other rules)
+        
+    Returns:
+        Schedule whose plan column indexes into plans
+    """
+    records = []
+    record_plans = []
+    for plan_index, (extracted_data, start_date, plan_id, patient_id) in enumerate(plans):
+        if isinstance(start_date, str):
+            start_date = date.fromisoformat(start_date)
+        generator = generator_class(start_date)
+        plan_records = generator.generate_recurring_missions(extracted_data, plan_id, patient_id, default_points)
+        records.extend(plan_records)
+        record_plans.extend([plan_index] * len(plan_records))
+    return schedule_records(records, record_plans)
+
+
+def _benchmark(extracted_data: Dict[str, Any], plans: int, verify: bool) -> Dict[str, Any]:
+    base = date.today()
+    rows = [(extracted_data, base + timedelta(days=i % 90), f"plan-{i}", f"patient-{i}") for i in range(plans)]
+    
+    started = timer.perf_counter()
+    per_mission = [MissionGenerator(start).generate_missions(data, plan_id, patient_id)
+                   for data, start, plan_id, patient_id in rows]
+    per_mission_seconds = timer.perf_counter() - started
+    
+    started = timer.perf_counter()
+    records = []
+    record_plans = []
+    for plan_index, (data, start, plan_id, patient_id) in enumerate(rows):
+        plan_records = MissionGenerator(start).generate_recurring_missions(data, plan_id, patient_id)
+        records.extend(plan_records)
+        record_plans.extend([plan_index] * len(plan_records))
+    records_seconds = timer.perf_counter() - started
+    schedule = schedule_records(records, record_plans)
+    iso = schedule.iso_columns()
+    bulk_seconds = timer.perf_counter() - started
+    
+    report = {
+        'plans': plans,
+        'missions': len(schedule),
+        'per_mission_seconds': round(per_mission_seconds, 3),
+        'bulk_seconds': round(bulk_seconds, 3),
+        'records_seconds': round(records_seconds, 3)
+    }
+    if verify:
+        missions = [mission for plan_missions in per_mission for mission in plan_missions]
+        report['identical'] = (
+            iso['scheduled_date'].tolist() == [mission['scheduled_date'] for mission in missions]
+            and iso['due_datetime'].tolist() == [mission['due_datetime'] for mission in missions]
+            and schedule.to_missions() == missions
+        )
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('extraction', help="result JSON (or its extracted_data) to schedule repeatedly")
+    parser.add_argument('--plans', type=int, default=10000, help='number of plans (start dates vary)')
+    parser.add_argument('--verify', action='store_true', help='check the output against generate_missions()')
+    args = parser.parse_args(argv)
+    _require_numpy()
+    
+    with open(args.extraction) as f:
+        extracted_data = json.load(f)
+    extracted_data = extracted_data.get('extracted_data', extracted_data)
+    
+    report = _benchmark(extracted_data, args.plans, args.verify)
+    print(f"{report['plans']} plans, {report['missions']} missions")
+    print(f"  per-mission  {report['per_mission_seconds']:>7.2f} s")
+    print(f"  bulk         {report['bulk_seconds']:>7.2f} s  "
+          f"({report['per_mission_seconds'] / report['bulk_seconds']:.1f}x; "
+          f"{report['records_seconds']:.2f} s of it building recurring records)")
+    if args.verify:
+        print(f"  identical:   {report['identical']}")
+    return 0 if report.get('identical', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
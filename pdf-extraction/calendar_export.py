@@ -0,0 +1,257 @@
+"""
+Calendar Export - Streaming iCalendar (.ics) feeds from recurring missions
+
+A patient calendar feed built from calendar_events has one VEVENT per
+occurrence: 8 weeks of twice-weekly physiotherapy is 16 events, and every
+plan change rewrites all of them. The exporter works on recurring mission
+records instead (MissionGenerator.generate_recurring_missions(), see
+recurrence.py) and writes one VEVENT per series, with the series' RRULE and
+EXDATEs, so a feed is a few dozen lines per plan and cheap to regenerate.
+
+- Events start at the mission's scheduled_time on each occurrence and last
+  duration_minutes (60 if unset), in floating local time like the missions
+- Reminders: one VALARM per calendar event reminder (1 day and 1 hour before)
+- UIDs are stable per plan and series, so calendar clients update events in
+  place when a feed is regenerated
+- Fields numbered per occurrence ("Physiotherapy session {n}") are exported
+  without the number, since a recurring event has one description
+
+By default only the mission types that get calendar events are exported;
+include_all=True adds every mission (exercises, check items) as well.
+
+Lines are produced one at a time (folded at 75 octets, CRLF-terminated), so
+a feed can be streamed straight into an HTTP response or file.
+
+Usage:
+    records = generator.generate_recurring_missions(extracted_data, plan_id, patient_id)
+    with open('patient-123.ics', 'w', newline='') as f:
+        write_ics(records, f, calendar_name='My treatment plan')
+    
+    python calendar_export.py results.json patient-123.ics [--include-all]
+"""
+
+import argparse
+import json
+import sys
+import uuid
+from datetime import date, datetime, time, timezone
+from typing import Dict, Any, List, Optional, Iterable, Iterator, TextIO
+
+from mission_generator import MissionGenerator
+from recurrence import RecurrenceRule
+
+PRODID = '-//pdf-extraction//Treatment Plan Missions//EN'
+
+# Namespace of the stable event UIDs
+_UID_NAMESPACE = uuid.UUID('9a3b1f52-6c1e-4b8e-9f0c-2d4f3f0d7a61')
+
+# Reminder offsets (minutes before start), as on generated calendar events
+REMINDER_MINUTES = (1440, 60)
+
+_DEFAULT_DURATION_MINUTES = 60
+
+
+def escape_text(value: str) -> str:
+    """Escape a TEXT property value (RFC 5545 3.3.11)"""
+    return (
+        value.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold_line(line: str) -> str:
+    """Content line folded at 75 octets, CRLF-terminated"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while len(encoded) > limit:
+        cut = limit
+        # Don't split a UTF-8 sequence
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        # Continuation lines start with a space, which counts against the limit
+        limit = 74
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _format_datetime(value: datetime) -> str:
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _format_duration(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return 'PT' + (f'{hours}H' if hours else '') + (f'{minutes}M' if minutes or not hours else '')
+
+
+def _format_trigger(minutes_before: int) -> str:
+    if minutes_before % 1440 == 0:
+        return f'-P{minutes_before // 1440}D'
+    return f'-{_format_duration(minutes_before)}'
+
+
+def _ics_rrule(rule: RecurrenceRule, start: Optional[time]) -> str:
+    """RRULE value; UNTIL takes the value type of DTSTART (RFC 5545 3.3.10)"""
+    parts = []
+    for part in rule.to_rrule().split(';'):
+        if part.startswith('UNTIL=') and start is not None:
+            part = f"UNTIL={_format_datetime(datetime.combine(rule.until, time(23, 59, 59)))}"
+        parts.append(part)
+    return ';'.join(parts)
+
+
+def event_uid(record: Dict[str, Any], index: int) -> str:
+    """Stable UID of a record's series: plan, position in the plan and title"""
+    template = record['template']
+    name = f"{template.get('treatment_plan_id')}/{index}/{template.get('title')}"
+    return f"{uuid.uuid5(_UID_NAMESPACE, name)}@pdf-extraction"
+
+
+def _unnumbered(pattern: str) -> str:
+    return pattern.replace(' {n}', '').replace('{n}', '').strip()
+
+
+def iter_vevent_lines(
+    record: Dict[str, Any],
+    index: int,
+    dtstamp: str,
+    include_all: bool = False
+) -> Iterator[str]:
+    """
+    Unfolded content lines of one recurring record's VEVENT (none if the
+    record's mission type is not exported)
+    """
+    mission = dict(record['template'])
+    if not include_all and mission.get('mission_type') not in MissionGenerator.CALENDAR_EVENT_TYPES:
+        return
+    for field, pattern in record.get('numbered', {}).items():
+        mission[field] = _unnumbered(pattern)
+    
+    rule = RecurrenceRule.parse(record['rrule'], record['dtstart'], record.get('exdates', ()))
+    if len(rule) == 0:
+        return
+    start = time.fromisoformat(mission['scheduled_time']) if mission.get('scheduled_time') else None
+    
+    yield 'BEGIN:VEVENT'
+    yield f"UID:{event_uid(record, index)}"
+    yield f"DTSTAMP:{dtstamp}"
+    if start is None:
+        # Untimed missions are all-day events
+        yield f"DTSTART;VALUE=DATE:{rule.dtstart.strftime('%Y%m%d')}"
+        yield 'DURATION:P1D'
+    else:
+        yield f"DTSTART:{_format_datetime(datetime.combine(rule.dtstart, start))}"
+        yield f"DURATION:{_format_duration(mission.get('duration_minutes') or _DEFAULT_DURATION_MINUTES)}"
+    if rule.count != 1:
+        yield f"RRULE:{_ics_rrule(rule, start)}"
+    for exdate in sorted(rule.exdates):
+        if start is None:
+            yield f"EXDATE;VALUE=DATE:{exdate.strftime('%Y%m%d')}"
+        else:
+            yield f"EXDATE:{_format_datetime(datetime.combine(exdate, start))}"
+    yield f"SUMMARY:{escape_text(str(mission.get('title', '')))}"
+    if mission.get('description'):
+        yield f"DESCRIPTION:{escape_text(str(mission['description']))}"
+    yield f"CATEGORIES:{escape_text(str(mission.get('mission_type', '')))}"
+    for minutes in REMINDER_MINUTES:
+        yield 'BEGIN:VALARM'
+        yield 'ACTION:DISPLAY'
+        yield f"DESCRIPTION:{escape_text(str(mission.get('title', '')))}"
+        yield f"TRIGGER:{_format_trigger(minutes)}"
+        yield 'END:VALARM'
+    yield 'END:VEVENT'
+
+
+def iter_ics(
+    records: Iterable[Dict[str, Any]],
+    calendar_name: Optional[str] = None,
+    include_all: bool = False
+) -> Iterator[str]:
+    """
+    A VCALENDAR for recurring mission records, one folded line at a time
+    
+    Args:
+        records: Recurring mission records; may span several plans and is
+            consumed lazily
+        calendar_name: X-WR-CALNAME shown by calendar clients
+        include_all: Export every mission type, not only calendar event types
+    """
+    dtstamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN']
+    if calendar_name:
+        header.append(f"X-WR-CALNAME:{escape_text(calendar_name)}")
+    for line in header:
+        yield fold_line(line)
+    
+    # Series index within each plan, for the stable UIDs
+    positions: Dict[Any, int] = {}
+    for record in records:
+        plan_id = record['template'].get('treatment_plan_id')
+        index = positions.get(plan_id, 0)
+        positions[plan_id] = index + 1
+        for line in iter_vevent_lines(record, index, dtstamp, include_all):
+            yield fold_line(line)
+    yield fold_line('END:VCALENDAR')
+
+
+def write_ics(
+    records: Iterable[Dict[str, Any]],
+    f: TextIO,
+    calendar_name: Optional[str] = None,
+    include_all: bool = False
+) -> int:
+    """
+    Stream a VCALENDAR to a text file (open it with newline='')
+    
+    Returns:
+        Number of VEVENTs written
+    """
+    events = 0
+    for line in iter_ics(records, calendar_name, include_all):
+        f.write(line)
+        if line == 'BEGIN:VEVENT\r\n':
+            events += 1
+    return events
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('results', help="process_pdf result JSON (recurring_missions or extracted_data)")
+    parser.add_argument('output', help=".ics file to write ('-' for stdout)")
+    parser.add_argument('--patient-id', default='patient')
+    parser.add_argument('--plan-id', default='plan')
+    parser.add_argument('--start-date', type=date.fromisoformat, help='plan start (default: today)')
+    parser.add_argument('--name', help='calendar name')
+    parser.add_argument('--include-all', action='store_true', help='export every mission, not only appointments')
+    args = parser.parse_args(argv)
+    
+    with open(args.results) as f:
+        results = json.load(f)
+    records = results.get('recurring_missions')
+    if records is None:
+        generator = MissionGenerator(args.start_date)
+        records = generator.generate_recurring_missions(
+            results.get('extracted_data', results), args.plan_id, args.patient_id
+        )
+    
+    if args.output == '-':
+        write_ics(records, sys.stdout, args.name, args.include_all)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            events = write_ics(records, f, args.name, args.include_all)
+        print(f"Wrote {events} recurring events for {len(records)} recurring missions to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
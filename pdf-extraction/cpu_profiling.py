@@ -0,0 +1,188 @@
+"""
+CPU Profiling - On-demand statistical profiling of single pipeline runs
+
+A sampler thread records the call stack of the thread running the pipeline
+every few milliseconds. Samples are tagged with the treatment plan ID and the
+pipeline stage they fell into, and written in the collapsed-stack format
+understood by flamegraph.pl, speedscope and inferno:
+
+    plan:plan_456;stage:nlp;main_extractor.py:_run_stages;nlp_extractor.py:extract_all;... 42
+
+Profiling is enabled per call (process_pdf(..., profile_cpu=True)) or for a
+random fraction of runs through the environment:
+
+    PDF_EXTRACTION_CPU_PROFILE_RATE         fraction of runs to profile (0-1)
+    PDF_EXTRACTION_CPU_PROFILE_DIR          where to write .collapsed files
+    PDF_EXTRACTION_CPU_PROFILE_INTERVAL_MS  sampling interval (default 5)
+
+When it is off no sampler thread exists and a run pays one comparison.
+"""
+
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Iterator
+
+logger = logging.getLogger(__name__)
+
+ENV_RATE = 'PDF_EXTRACTION_CPU_PROFILE_RATE'
+ENV_DIR = 'PDF_EXTRACTION_CPU_PROFILE_DIR'
+ENV_INTERVAL_MS = 'PDF_EXTRACTION_CPU_PROFILE_INTERVAL_MS'
+
+DEFAULT_INTERVAL_MS = 5.0
+MAX_STACK_DEPTH = 128
+
+_profile_ids = itertools.count(1)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Ignoring invalid %s=%r", name, value)
+        return default
+
+
+def profile_rate_from_env() -> float:
+    """Fraction of runs to profile, from PDF_EXTRACTION_CPU_PROFILE_RATE"""
+    return min(max(_env_float(ENV_RATE, 0.0), 0.0), 1.0)
+
+
+def profile_dir_from_env() -> Optional[str]:
+    """Output directory for sampled profiles, from PDF_EXTRACTION_CPU_PROFILE_DIR"""
+    return os.environ.get(ENV_DIR) or None
+
+
+def interval_from_env() -> float:
+    """Sampling interval in seconds, from PDF_EXTRACTION_CPU_PROFILE_INTERVAL_MS"""
+    return max(_env_float(ENV_INTERVAL_MS, DEFAULT_INTERVAL_MS), 0.1) / 1000
+
+
+def should_profile(rate: float) -> bool:
+    """Decide whether to profile one run, given the sampling rate"""
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def _frame_name(code) -> str:
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+def _sanitize(value: str) -> str:
+    # ';' separates frames and ' ' separates the count in collapsed stacks
+    return str(value).replace(';', '_').replace(' ', '_')
+
+
+class SamplingProfiler:
+    """
+    Statistical CPU profile of one pipeline run
+    
+    Used as a StageTimer hook so samples are attributed to stages. start()
+    must be called on the thread that runs the pipeline.
+    
+    Samples are taken while the sampler holds the GIL, so time spent in C
+    code that never releases it is attributed to the Python frame that
+    called into it.
+    """
+    
+    def __init__(self, tag: str = '', interval: float = DEFAULT_INTERVAL_MS / 1000):
+        """
+        Args:
+            tag: Label for the root frame (e.g. the treatment plan ID)
+            interval: Seconds between samples
+        """
+        self.tag = tag
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stage = 'setup'
+        self._target_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._duration = 0.0
+        self.path: Optional[str] = None
+    
+    def start(self):
+        """Start sampling the calling thread"""
+        self._target_thread = threading.get_ident()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='cpu-profiler', daemon=True)
+        self._sampler.start()
+    
+    def stop(self):
+        """Stop sampling and wait for the sampler thread"""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self._duration = time.perf_counter() - self._started
+    
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        previous, self._stage = self._stage, name
+        try:
+            yield
+        finally:
+            self._stage = previous
+    
+    def _run(self):
+        target = self._target_thread
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                break
+            self.samples[(self._stage, self._stack(frame))] += 1
+            del frame
+    
+    @staticmethod
+    def _stack(frame) -> Tuple[str, ...]:
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            names.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        return tuple(reversed(names))
+    
+    def collapsed(self) -> str:
+        """The profile in collapsed-stack format, one stack per line"""
+        root = f"plan:{_sanitize(self.tag)}" if self.tag else 'plan:unknown'
+        lines = []
+        for (stage, stack), count in sorted(self.samples.items()):
+            frames = [root, f"stage:{stage}"] + [_sanitize(name) for name in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return '\n'.join(lines) + '\n' if lines else ''
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """Summary in the metadata['cpu_profile'] format"""
+        stage_samples: Counter = Counter()
+        for (stage, _), count in self.samples.items():
+            stage_samples[stage] += count
+        return {
+            'samples': sum(stage_samples.values()),
+            'interval_ms': round(self.interval * 1000, 3),
+            'duration_ms': round(self._duration * 1000, 3),
+            'stage_samples': dict(stage_samples)
+        }
+
+
+def write_collapsed(profiler: SamplingProfiler, path: str) -> str:
+    """Write a profile in collapsed-stack format and return the path"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(profiler.collapsed(), encoding='utf-8')
+    return str(path)
+
+
+def default_profile_path(directory: str, tag: str) -> str:
+    """Unique file name for a sampled run's profile in directory"""
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+    return str(Path(directory) / f"{_sanitize(tag) or 'run'}-{stamp}-{os.getpid()}-{next(_profile_ids)}.collapsed")
@@ -8,12 +8,16 @@ This script demonstrates how to use the extraction pipeline to:
 """
 
 from main_extractor import PDFTreatmentPlanExtractor
+from synthetic_pdf import generate_plan_pdf
 from datetime import date
+from pathlib import Path
 import json
+import logging
 
 
 def main():
     """Example usage"""
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
     
     # Initialize extractor
     print("Initializing PDF Treatment Plan Extractor...")
@@ -21,6 +25,10 @@ def main():
     
     # Example: Process a treatment plan PDF
     pdf_path = "example_treatment_plan.pdf"  # Replace with actual PDF path
+    if not Path(pdf_path).exists():
+        # No real plan at hand: generate a synthetic one to run against
+        generate_plan_pdf(pdf_path, exercises=6)
+        print(f"Generated synthetic treatment plan: {pdf_path}")
     patient_id = "patient-123"
     treatment_plan_id = "plan-456"
     start_date = date.today()
@@ -113,7 +121,7 @@ def main():
             print(f"  - {rec['user_name']}: {rec['lobby_suggestion']}")
             print(f"    Similarity: {rec['similarity_score']:.2%}")
             print(f"    Common missions: {rec['common_mission_count']}")
-        
+    
     except FileNotFoundError:
         print(f"Error: PDF file not found: {pdf_path}")
         print("\nTo use this script:")
@@ -0,0 +1,523 @@
+"""
+Extraction Service - Standalone daemon that runs extraction jobs for the API tier
+
+Instead of importing the pipeline into API handlers, run this service next to
+the API and let handlers submit jobs and poll for results. Extraction load
+then stays out of the API processes, and the service applies admission
+control: at most workers + max_queue jobs are accepted at a time; beyond that
+a submission is rejected with 503 and a Retry-After estimate, so callers defer
+instead of piling up work.
+
+HTTP API (JSON bodies; over TCP or a Unix socket):
+    POST /jobs          {"pdf_path", "patient_id", "treatment_plan_id",
+                         "start_date"?, "default_points"?}
+                        -> 202 {"job_id", "status"} or 503 when saturated
+    GET  /jobs/<id>     -> {"job_id", "status", "result" | "error"};
+                           ?wait=SECONDS blocks until the job finishes
+    GET  /health        -> pool health, queue depth, latency summary
+    GET  /metrics       -> Prometheus text format
+
+Finished jobs are kept for result_ttl seconds, then forgotten.
+
+The service only opens PDFs under the directory given with --pdf-root:
+pdf_path is resolved against it (symlinks included), and a path that lands
+outside it is rejected with 400. Clients store the PDF there first and
+submit its path, absolute or relative to the root.
+
+Usage:
+    python extraction_service.py --pdf-root /srv/plans --port 8500 --workers 4 --max-queue 32
+    python extraction_service.py --pdf-root /srv/plans --socket /run/pdf-extraction.sock
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import math
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from worker_pool import ExtractorWorkerPool, PoolClosedError
+from instrumentation import METRICS, MetricsRegistry
+from serialization import dumps_compact
+
+logger = logging.getLogger(__name__)
+
+# Longest ?wait a single poll may block for
+MAX_POLL_WAIT = 60.0
+
+
+class ServiceSaturatedError(RuntimeError):
+    """Raised when a job is submitted while the service is at capacity"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__(f"Extraction service saturated; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = ('job_id', 'request', 'future', 'status', 'result', 'error', 'submitted', 'finished', 'done')
+    
+    def __init__(self, job_id: str, request: Dict[str, Any]):
+        self.job_id = job_id
+        self.request = request
+        self.future = None
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+        self.done = threading.Event()
+    
+    def as_dict(self) -> Dict[str, Any]:
+        if self.status == 'queued' and self.future is not None and self.future.running():
+            self.status = 'running'
+        status = {'job_id': self.job_id, 'status': self.status}
+        if self.status == 'succeeded':
+            status['result'] = self.result
+        elif self.status == 'failed':
+            status['error'] = self.error
+        return status
+
+
+class ExtractionService:
+    """
+    Bounded job queue in front of an ExtractorWorkerPool
+    
+    Transport-independent: ExtractionHTTPServer exposes it over HTTP, and
+    tests or embedding code can call submit()/status() directly.
+    """
+    
+    def __init__(
+        self,
+        pool: ExtractorWorkerPool,
+        pdf_root: str,
+        max_queue: int = 32,
+        result_ttl: float = 600.0,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        """
+        Args:
+            pool: Warm worker pool that runs the jobs
+            pdf_root: Directory the submitted PDFs must be in
+            max_queue: Jobs accepted beyond those the workers are running
+            result_ttl: Seconds a finished job stays retrievable
+            metrics: Registry for service metrics (defaults to the pool's)
+        """
+        self.pool = pool
+        self.pdf_root = Path(pdf_root).resolve()
+        if not self.pdf_root.is_dir():
+            raise ValueError(f"PDF root {pdf_root} is not a directory")
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.metrics = metrics if metrics is not None else pool.metrics
+        
+        self._jobs: Dict[str, _Job] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._outstanding = 0
+        self._mean_job_seconds: Optional[float] = None
+        
+        self._queue_depth = self.metrics.gauge('service_queue_depth', 'Jobs accepted but not yet running')
+        self._in_flight = self.metrics.gauge('service_jobs_in_flight', 'Jobs accepted and not yet finished')
+        self._submissions = self.metrics.counter(
+            'service_submissions_total', 'Job submissions by outcome', ('outcome',)
+        )
+        self._latency = self.metrics.histogram(
+            'service_job_seconds', 'Time from submission to result', ('status',)
+        )
+        self._queue_wait = self.metrics.histogram('service_queue_wait_seconds', 'Time jobs spent queued')
+    
+    @property
+    def capacity(self) -> int:
+        """Jobs that can be outstanding at once"""
+        return self.pool.num_workers + self.max_queue
+    
+    def resolve_pdf_path(self, pdf_path: str) -> Path:
+        """
+        Resolve a submitted pdf_path against pdf_root
+        
+        Raises:
+            ValueError: If the path is outside pdf_root
+        """
+        # resolve() follows symlinks and '..', so the check sees the real file
+        path = (self.pdf_root / pdf_path).resolve()
+        if not path.is_relative_to(self.pdf_root):
+            raise ValueError(f"pdf_path must be under {self.pdf_root}")
+        return path
+    
+    def submit(self, request: Dict[str, Any]) -> str:
+        """
+        Accept a job
+        
+        Args:
+            request: pdf_path, patient_id, treatment_plan_id and optionally
+                start_date (ISO string or date) and default_points
+                
+        Returns:
+            Job ID for status()
+            
+        Raises:
+            ValueError: If the request is malformed or pdf_path is outside pdf_root
+            ServiceSaturatedError: If the service is at capacity
+        """
+        missing = [key for key in ('pdf_path', 'patient_id', 'treatment_plan_id') if not request.get(key)]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        pdf_path = self.resolve_pdf_path(str(request['pdf_path']))
+        start_date = request.get('start_date')
+        if isinstance(start_date, str):
+            start_date = date.fromisoformat(start_date)
+        default_points = int(request.get('default_points', 50))
+        
+        with self._lock:
+            self._expire()
+            if self._outstanding >= self.capacity:
+                self._submissions.inc(outcome='rejected')
+                raise ServiceSaturatedError(self._retry_after())
+            job = _Job(f"svc-{next(self._ids)}", request)
+            self._jobs[job.job_id] = job
+            self._outstanding += 1
+            self._update_gauges()
+        
+        try:
+            pool_job_id = self.pool.submit(
+                str(pdf_path),
+                str(request['patient_id']),
+                str(request['treatment_plan_id']),
+                start_date,
+                default_points
+            )
+        except Exception:
+            with self._lock:
+                del self._jobs[job.job_id]
+                self._outstanding -= 1
+                self._update_gauges()
+            raise
+        
+        self._submissions.inc(outcome='accepted')
+        job.future = self.pool.future(pool_job_id)
+        job.future.add_done_callback(
+            lambda future: self._on_done(job, pool_job_id)
+        )
+        return job.job_id
+    
+    def status(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Job state (None for unknown or expired jobs), waiting up to wait seconds for it to finish"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if wait > 0:
+            job.done.wait(min(wait, MAX_POLL_WAIT))
+        with self._lock:
+            return job.as_dict()
+    
+    def health(self) -> Dict[str, Any]:
+        """Pool health plus queue depth and latency"""
+        pool = self.pool.health()
+        with self._lock:
+            self._expire()
+            outstanding = self._outstanding
+            mean = self._mean_job_seconds
+        latency = self._latency.snapshot(status='succeeded')
+        return {
+            'healthy': pool['healthy'],
+            'outstanding_jobs': outstanding,
+            'queued_jobs': max(outstanding - self.pool.num_workers, 0),
+            'capacity': self.capacity,
+            'saturated': outstanding >= self.capacity,
+            'mean_job_seconds': round(mean, 3) if mean is not None else None,
+            'completed_jobs': latency['count'],
+            'pool': pool
+        }
+    
+    def _on_done(self, job: _Job, pool_job_id: str):
+        try:
+            result, error = self.pool.result(pool_job_id, timeout=0), None
+        except Exception as e:
+            result, error = None, e
+        self._finish(job, result, error)
+    
+    def _finish(self, job: _Job, result: Optional[Dict[str, Any]], error: Optional[BaseException]):
+        now = time.monotonic()
+        elapsed = now - job.submitted
+        with self._lock:
+            job.finished = now
+            if error is None:
+                job.status, job.result = 'succeeded', result
+            else:
+                job.status, job.error = 'failed', f"{type(error).__name__}: {error}"
+            self._outstanding -= 1
+            # Exponentially weighted, for Retry-After estimates
+            if self._mean_job_seconds is None:
+                self._mean_job_seconds = elapsed
+            else:
+                self._mean_job_seconds = 0.8 * self._mean_job_seconds + 0.2 * elapsed
+            self._update_gauges()
+        job.done.set()
+        
+        self._latency.observe(elapsed, status=job.status)
+        if result is not None:
+            run_seconds = result['metadata']['timings']['total']['wall_ms'] / 1000
+            self._queue_wait.observe(max(elapsed - run_seconds, 0.0))
+    
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely to free up (caller holds the lock)"""
+        mean = self._mean_job_seconds or 1.0
+        queued = max(self._outstanding - self.pool.num_workers, 0)
+        return max(1, math.ceil(mean * (queued + 1) / self.pool.num_workers))
+    
+    def _update_gauges(self):
+        self._in_flight.set(self._outstanding)
+        self._queue_depth.set(max(self._outstanding - self.pool.num_workers, 0))
+    
+    def _expire(self):
+        """Drop finished jobs older than result_ttl (caller holds the lock)"""
+        cutoff = time.monotonic() - self.result_ttl
+        for job_id in [j.job_id for j in self._jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'pdf-extraction-service'
+    protocol_version = 'HTTP/1.1'
+    
+    @property
+    def service(self) -> ExtractionService:
+        return self.server.service
+    
+    def log_message(self, format, *args):
+        # BaseHTTPRequestHandler logs to stderr with the client address, which
+        # Unix socket clients do not have
+        logger.debug("%s %s", self.requestline, format % args)
+    
+    def _send(self, status: int, body, content_type: str = 'application/json', headers=()):
+        payload = body if isinstance(body, bytes) else dumps_compact(body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def do_POST(self):
+        if urlsplit(self.path).path != '/jobs':
+            return self._send(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            job_id = self.service.submit(request)
+        except ServiceSaturatedError as e:
+            return self._send(503, {'error': str(e)}, headers=[('Retry-After', str(e.retry_after))])
+        except PoolClosedError as e:
+            return self._send(503, {'error': str(e)})
+        except (ValueError, TypeError) as e:
+            return self._send(400, {'error': str(e)})
+        self._send(202, {'job_id': job_id, 'status': 'queued'}, headers=[('Location', f'/jobs/{job_id}')])
+    
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            health = self.service.health()
+            return self._send(200 if health['healthy'] else 503, health)
+        if url.path == '/metrics':
+            return self._send(200, self.service.metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+        if url.path.startswith('/jobs/'):
+            try:
+                wait = float(parse_qs(url.query).get('wait', ['0'])[0])
+            except ValueError:
+                return self._send(400, {'error': 'wait must be a number'})
+            status = self.service.status(url.path[len('/jobs/'):], wait)
+            if status is None:
+                return self._send(404, {'error': 'unknown or expired job'})
+            return self._send(200, status)
+        self._send(404, {'error': 'not found'})
+
+
+class ExtractionHTTPServer(ThreadingHTTPServer):
+    """HTTP front end for an ExtractionService on a TCP port"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address: Tuple[str, int], service: ExtractionService):
+        self.service = service
+        super().__init__(address, _Handler)
+
+
+class ExtractionUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP front end for an ExtractionService on a Unix socket"""
+    
+    daemon_threads = True
+    
+    def __init__(self, path: str, service: ExtractionService):
+        self.service = service
+        if os.path.exists(path):
+            os.unlink(path)  # Stale socket from a previous run
+        super().__init__(path, _Handler)
+    
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('unix', 0)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class ExtractionServiceClient:
+    """
+    Minimal client for the API tier: submit, then poll
+    
+    Usage:
+        client = ExtractionServiceClient('http://127.0.0.1:8500')
+        # or ExtractionServiceClient(unix_socket='/run/pdf-extraction.sock')
+        job_id = client.submit(pdf_path, patient_id, plan_id)
+        results = client.wait(job_id, timeout=120)
+    """
+    
+    def __init__(self, base_url: str = 'http://127.0.0.1:8500', unix_socket: Optional[str] = None, timeout: float = 90.0):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.unix_socket = unix_socket
+        self.timeout = timeout
+    
+    def _request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None):
+        if self.unix_socket:
+            conn = _UnixHTTPConnection(self.unix_socket, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            payload = dumps_compact(body) if body is not None else None
+            headers = {'Content-Type': 'application/json'} if payload else {}
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            return response.status, response.getheader('Retry-After'), json.loads(response.read() or b'null')
+        finally:
+            conn.close()
+    
+    def submit(
+        self,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date] = None,
+        default_points: int = 50
+    ) -> str:
+        """
+        Submit a job
+        
+        Returns:
+            Job ID
+            
+        Raises:
+            ServiceSaturatedError: If the service is at capacity (see retry_after)
+        """
+        body = {
+            'pdf_path': pdf_path,
+            'patient_id': patient_id,
+            'treatment_plan_id': treatment_plan_id,
+            'default_points': default_points
+        }
+        if start_date:
+            body['start_date'] = start_date.isoformat()
+        status, retry_after, payload = self._request('POST', '/jobs', body)
+        if status == 503:
+            raise ServiceSaturatedError(int(retry_after or 1))
+        if status != 202:
+            raise RuntimeError(f"Submission failed ({status}): {payload.get('error')}")
+        return payload['job_id']
+    
+    def status(self, job_id: str, wait: float = 0.0) -> Dict[str, Any]:
+        """Current job state (see ExtractionService.status)"""
+        status, _, payload = self._request('GET', f'/jobs/{job_id}?wait={wait:g}')
+        if status != 200:
+            raise KeyError(f"{job_id}: {payload.get('error')}")
+        return payload
+    
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Poll until the job finishes
+        
+        Returns:
+            The process_pdf result
+            
+        Raises:
+            RuntimeError: If the job failed
+            TimeoutError: If timeout expires first
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = deadline - time.monotonic() if deadline is not None else MAX_POLL_WAIT
+            if remaining <= 0:
+                raise TimeoutError(f"{job_id} did not finish within {timeout}s")
+            state = self.status(job_id, wait=min(remaining, MAX_POLL_WAIT, self.timeout / 2))
+            if state['status'] == 'succeeded':
+                return state['result']
+            if state['status'] == 'failed':
+                raise RuntimeError(f"{job_id} failed: {state['error']}")
+    
+    def health(self) -> Dict[str, Any]:
+        return self._request('GET', '/health')[2]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8500, help='TCP port')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--pdf-root', required=True, help='directory submitted PDFs must be in')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--max-queue', type=int, default=32, help='jobs accepted beyond the running ones')
+    parser.add_argument('--result-ttl', type=float, default=600.0, help='seconds finished jobs stay retrievable')
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    parser.add_argument('--cache-dir', help='result cache directory shared by the workers')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    with ExtractorWorkerPool(num_workers=args.workers, nlp_model=args.model, cache_dir=args.cache_dir) as pool:
+        service = ExtractionService(pool, args.pdf_root, max_queue=args.max_queue, result_ttl=args.result_ttl, metrics=METRICS)
+        if args.socket:
+            server = ExtractionUnixServer(args.socket, service)
+            where = args.socket
+        else:
+            server = ExtractionHTTPServer((args.host, args.port), service)
+            where = f"http://{args.host}:{server.server_address[1]}"
+        
+        # serve_forever runs in this thread, so SIGTERM shuts down from another
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        logger.info("Extraction service listening on %s (%d workers, queue %d)", where, pool.num_workers, args.max_queue)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.unlink(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Instrumentation - Per-stage timers, counters and latency histograms
+
+Every process_pdf run records wall and CPU time for each pipeline stage
+(returned as metadata['timings']) and feeds a MetricsRegistry that can be
+exported in the Prometheus text format. Recording a run costs a handful of
+clock reads and one lock acquisition, so it stays on in production.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, Optional, Tuple, Iterator, Sequence
+
+# Latency buckets in seconds, from fast stages (cleaning) to slow ones (NLP)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+    
+    def expose(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Gauge(Counter):
+    """Value that can go up and down (queue depth, jobs in flight)"""
+    
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+    
+    def expose(self) -> str:
+        return super().expose().replace(f'# TYPE {self.name} counter', f'# TYPE {self.name} gauge', 1)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def snapshot(self, **labels) -> Dict[str, Any]:
+        """Count, sum and cumulative bucket counts for one label set"""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(key, [[0] * (len(self.buckets) + 1), 0.0])
+            counts = list(counts)
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return {
+            'count': running,
+            'sum': total,
+            'buckets': dict(zip(self.buckets + (float('inf'),), cumulative))
+        }
+    
+    def expose(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{labels} {running}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {running}')
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+    """
+    Named collection of counters and histograms
+    
+    PDFTreatmentPlanExtractor records into the module-level METRICS registry
+    unless given its own. Results produced in other processes (worker pool,
+    batch runs) can be folded in with record_run(result['metadata']).
+    """
+    
+    def __init__(self, namespace: str = 'pdf_extraction'):
+        self.namespace = namespace
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        
+        self.runs = self.counter('runs_total', 'Pipeline runs by outcome', ('status',))
+        self.stage_seconds = self.histogram(
+            'stage_seconds', 'Wall-clock time per pipeline stage', ('stage',)
+        )
+        self.stage_cpu_seconds = self.counter(
+            'stage_cpu_seconds_total', 'CPU time spent per pipeline stage', ('stage',)
+        )
+        self.run_seconds = self.histogram('run_seconds', 'Wall-clock time per pipeline run')
+        self.items = self.counter('items_total', 'Items processed by kind', ('kind',))
+        self.cache_lookups = self.counter('cache_lookups_total', 'Result cache lookups by outcome', ('result',))
+    
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Get or create a counter (name is prefixed with the namespace)"""
+        return self._get_or_create(Counter, name, help_text, labelnames)
+    
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        """Get or create a gauge (name is prefixed with the namespace)"""
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+    
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Get or create a histogram (name is prefixed with the namespace)"""
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+    
+    def _get_or_create(self, cls, name, help_text, labelnames, *args):
+        full_name = f'{self.namespace}_{name}' if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, help_text, tuple(labelnames), *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {full_name} already registered as {type(metric).__name__}")
+            return metric
+    
+    def record_run(self, metadata: Dict[str, Any], status: str = 'success'):
+        """
+        Record one finished run from its result metadata
+        
+        Only successful runs feed the latency and item metrics; failed and
+        cancelled runs are counted by status. Full cache hits are counted as
+        runs and cache lookups, but not as processed items.
+        """
+        self.runs.inc(status=status)
+        if status != 'success':
+            return
+        
+        timings = metadata.get('timings') or {}
+        for stage, timing in timings.get('stages', {}).items():
+            self.stage_seconds.observe(timing['wall_ms'] / 1000, stage=stage)
+            self.stage_cpu_seconds.inc(timing['cpu_ms'] / 1000, stage=stage)
+        if 'total' in timings:
+            self.run_seconds.observe(timings['total']['wall_ms'] / 1000)
+        
+        # A full cache hit processed nothing: its counts are not throughput
+        if metadata.get('cache') != 'full_hit':
+            for kind, count in (metadata.get('counts') or {}).items():
+                if count:
+                    self.items.inc(count, kind=kind)
+        
+        if metadata.get('cache'):
+            self.cache_lookups.inc(result=metadata['cache'])
+    
+    def cache_hit_rate(self) -> Optional[float]:
+        """Share of cache lookups that avoided re-running parsing and NLP"""
+        hits = self.cache_lookups.value(result='full_hit') + self.cache_lookups.value(result='document_hit')
+        total = hits + self.cache_lookups.value(result='miss')
+        return hits / total if total else None
+    
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        return '\n'.join(metric.expose() for metric in metrics) + '\n'
+
+
+# Default registry shared by all extractors in the process
+METRICS = MetricsRegistry()
+
+
+class StageTimer:
+    """
+    Wall and CPU timer for the stages of one pipeline run
+    
+    CPU time is per thread (time.thread_time), so concurrent runs on a
+    thread pool do not count each other's work. Optional hooks (objects
+    with a stage(name) context manager, such as the memory profiler) are
+    entered around each stage, outside the timed region.
+    
+    Usage:
+        timer = StageTimer()
+        with timer.stage('extract_text'):
+            ...
+        metadata['timings'] = timer.as_dict()
+    """
+    
+    def __init__(self, hooks: Sequence[Any] = ()):
+        self.hooks = list(hooks)
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.current_stage: Optional[str] = None
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.thread_time()
+    
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        with ExitStack() as hooks:
+            for hook in self.hooks:
+                hooks.enter_context(hook.stage(name))
+            
+            wall, cpu = time.perf_counter(), time.thread_time()
+            self.current_stage = name
+            try:
+                yield
+            finally:
+                self.current_stage = None
+                entry = self.stages.setdefault(name, {'wall_ms': 0.0, 'cpu_ms': 0.0})
+                entry['wall_ms'] += (time.perf_counter() - wall) * 1000
+                entry['cpu_ms'] += (time.thread_time() - cpu) * 1000
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """Timings in the metadata['timings'] format"""
+        return {
+            'stages': {
+                name: {'wall_ms': round(t['wall_ms'], 3), 'cpu_ms': round(t['cpu_ms'], 3)}
+                for name, t in self.stages.items()
+            },
+            'total': {
+                'wall_ms': round((time.perf_counter() - self._started_wall) * 1000, 3),
+                'cpu_ms': round((time.thread_time() - self._started_cpu) * 1000, 3)
+            }
+        }
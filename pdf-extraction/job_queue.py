@@ -0,0 +1,568 @@
+"""
+Job Queue - Durable SQLite queue of process_pdf jobs for reprocessing backlogs
+
+Jobs are identified by an idempotent key (by default patient/plan, as in
+batch_extract.py): enqueueing a key that is already queued or running is a
+no-op. Consumers lease jobs for a visibility timeout and extend the lease
+with heartbeats while a job runs; a consumer that dies simply lets its
+leases expire, and the jobs are picked up again by whoever leases next.
+Failed jobs are retried with exponential backoff; after max_attempts they
+are moved to the dead-letter state for inspection.
+
+Any number of consumers (threads or processes, on one machine) can share a
+queue file. Results are stored in the queue, so a crash never loses
+finished work, and restarting a consumer resumes the backlog.
+
+Usage:
+    python job_queue.py enqueue queue.db --manifest plans.csv
+    python job_queue.py work queue.db --workers 4 --stage-store stages/
+    python job_queue.py stats queue.db
+    python job_queue.py dead queue.db            # list dead letters
+    python job_queue.py retry-dead queue.db      # give them another round
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+
+from serialization import dumps_compact, loads
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('pending', 'leased', 'done', 'dead')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    result BLOB,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+
+class LeaseLostError(RuntimeError):
+    """Raised when a consumer reports on a job it no longer holds the lease for"""
+
+
+class Job:
+    """A leased job"""
+    
+    __slots__ = ('key', 'payload', 'attempts', 'max_attempts', 'lease_owner', 'lease_expires')
+    
+    def __init__(self, key, payload, attempts, max_attempts, lease_owner, lease_expires):
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.lease_owner = lease_owner
+        self.lease_expires = lease_expires
+    
+    def process_pdf_kwargs(self) -> Dict[str, Any]:
+        """Payload as process_pdf keyword arguments"""
+        kwargs = dict(self.payload)
+        if kwargs.get('start_date'):
+            kwargs['start_date'] = date.fromisoformat(kwargs['start_date'])
+        return kwargs
+
+
+def default_owner() -> str:
+    """Consumer name used for leases: host, process and thread"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue
+    
+    Each thread gets its own connection; write transactions use BEGIN
+    IMMEDIATE, so leasing is atomic across threads and processes.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        visibility_timeout: float = 300.0,
+        max_attempts: int = 5,
+        backoff_base: float = 30.0,
+        backoff_max: float = 3600.0
+    ):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            visibility_timeout: Seconds a lease lasts unless extended
+            max_attempts: Attempts before a job is dead-lettered (per-job
+                override in enqueue)
+            backoff_base: Delay before the first retry; doubles per attempt
+            backoff_max: Upper bound for the retry delay
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+    
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            # WAL lets readers (stats, results) run alongside a leasing consumer
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+    
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+    
+    def enqueue(
+        self,
+        key: str,
+        payload: Dict[str, Any],
+        max_attempts: Optional[int] = None,
+        requeue_finished: bool = False
+    ) -> bool:
+        """
+        Add a job unless its key is already known
+        
+        Args:
+            key: Idempotency key
+            payload: process_pdf keyword arguments (JSON-serializable; dates
+                are stored as ISO strings)
+            max_attempts: Override the queue's max_attempts for this job
+            requeue_finished: Reset a done or dead job with this key to
+                pending (for reprocessing after an extractor update)
+                
+        Returns:
+            True if the job was added or requeued
+        """
+        return self.enqueue_many([(key, payload)], max_attempts, requeue_finished) == 1
+    
+    def enqueue_many(
+        self,
+        jobs: Iterable,
+        max_attempts: Optional[int] = None,
+        requeue_finished: bool = False
+    ) -> int:
+        """enqueue for (key, payload) pairs in one transaction; returns how many were added or requeued"""
+        now = time.time()
+        max_attempts = max_attempts or self.max_attempts
+        added = 0
+        with self._transaction() as db:
+            for key, payload in jobs:
+                encoded = dumps_compact(payload).decode('utf-8')
+                cursor = db.execute(
+                    'INSERT OR IGNORE INTO jobs (key, payload, max_attempts, available_at, created_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, encoded, max_attempts, now, now, now)
+                )
+                if cursor.rowcount == 0 and requeue_finished:
+                    cursor = db.execute(
+                        "UPDATE jobs SET status = 'pending', payload = ?, attempts = 0, max_attempts = ?, "
+                        "available_at = ?, last_error = NULL, result = NULL, updated_at = ? "
+                        "WHERE key = ? AND status IN ('done', 'dead')",
+                        (encoded, max_attempts, now, now, key)
+                    )
+                added += cursor.rowcount
+        return added
+    
+    def lease(self, owner: Optional[str] = None, limit: int = 1, visibility_timeout: Optional[float] = None) -> List[Job]:
+        """
+        Lease up to limit jobs that are due (pending, or with an expired lease)
+        
+        Expired leases count as failed attempts: a job whose consumers keep
+        dying is dead-lettered like one that keeps raising.
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        expires = now + (visibility_timeout or self.visibility_timeout)
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'dead', lease_owner = NULL, lease_expires = NULL, updated_at = ?, "
+                "last_error = COALESCE(last_error, 'lease expired') "
+                "WHERE status = 'leased' AND lease_expires <= ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            rows = db.execute(
+                "SELECT key FROM jobs WHERE (status = 'pending' AND available_at <= ?) "
+                "OR (status = 'leased' AND lease_expires <= ?) ORDER BY available_at LIMIT ?",
+                (now, now, limit)
+            ).fetchall()
+            jobs = []
+            for row in rows:
+                db.execute(
+                    "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires = ?, updated_at = ? WHERE key = ?",
+                    (owner, expires, now, row['key'])
+                )
+                job = db.execute(
+                    'SELECT key, payload, attempts, max_attempts FROM jobs WHERE key = ?', (row['key'],)
+                ).fetchone()
+                jobs.append(Job(job['key'], loads(job['payload']), job['attempts'], job['max_attempts'], owner, expires))
+        return jobs
+    
+    def heartbeat(self, job: Job, visibility_timeout: Optional[float] = None):
+        """
+        Extend a lease
+        
+        Raises:
+            LeaseLostError: If the lease expired and the job was re-leased
+        """
+        expires = time.time() + (visibility_timeout or self.visibility_timeout)
+        with self._transaction() as db:
+            self._update_owned(db, job, 'lease_expires = ?', (expires,))
+        job.lease_expires = expires
+    
+    def complete(self, job: Job, result: Optional[Dict[str, Any]] = None):
+        """
+        Mark a leased job done and store its result
+        
+        Raises:
+            LeaseLostError: If the lease was lost (another consumer owns the job now)
+        """
+        encoded = dumps_compact(result) if result is not None else None
+        with self._transaction() as db:
+            self._update_owned(
+                db, job,
+                "status = 'done', result = ?, last_error = NULL, lease_owner = NULL, lease_expires = NULL",
+                (encoded,)
+            )
+    
+    def fail(self, job: Job, error: str):
+        """
+        Record a failed attempt: retry after a backoff, or dead-letter the job
+        
+        Raises:
+            LeaseLostError: If the lease was lost
+        """
+        if job.attempts >= job.max_attempts:
+            changes, params = "status = 'dead'", ()
+        else:
+            changes, params = "status = 'pending', available_at = ?", (time.time() + self.retry_delay(job.attempts),)
+        with self._transaction() as db:
+            self._update_owned(
+                db, job,
+                f"{changes}, last_error = ?, lease_owner = NULL, lease_expires = NULL",
+                params + (error,)
+            )
+    
+    def _update_owned(self, db: sqlite3.Connection, job: Job, changes: str, params: tuple):
+        cursor = db.execute(
+            f"UPDATE jobs SET {changes}, updated_at = ? "
+            "WHERE key = ? AND status = 'leased' AND lease_owner = ? AND attempts = ?",
+            params + (time.time(), job.key, job.lease_owner, job.attempts)
+        )
+        if cursor.rowcount == 0:
+            raise LeaseLostError(f"Lease on {job.key} (attempt {job.attempts}) is no longer held by {job.lease_owner}")
+    
+    def retry_delay(self, attempts: int) -> float:
+        """Backoff before the next attempt: exponential, capped, with jitter"""
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        # Jitter spreads out retries of jobs that failed together
+        return delay * random.uniform(0.5, 1.0)
+    
+    def retry_dead(self, keys: Optional[List[str]] = None) -> int:
+        """Move dead-lettered jobs (all, or the given keys) back to pending; returns how many"""
+        now = time.time()
+        query = (
+            "UPDATE jobs SET status = 'pending', attempts = 0, available_at = ?, last_error = NULL, updated_at = ? "
+            "WHERE status = 'dead'"
+        )
+        params: tuple = (now, now)
+        if keys is not None:
+            query += f" AND key IN ({','.join('?' * len(keys))})"
+            params += tuple(keys)
+        with self._transaction() as db:
+            return db.execute(query, params).rowcount
+    
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """Dead-lettered jobs with their last error"""
+        rows = self._connection().execute(
+            "SELECT key, payload, attempts, last_error, updated_at FROM jobs WHERE status = 'dead' ORDER BY updated_at"
+        ).fetchall()
+        return [{**dict(row), 'payload': loads(row['payload'])} for row in rows]
+    
+    def result(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored result of a done job"""
+        row = self._connection().execute(
+            "SELECT result FROM jobs WHERE key = ? AND status = 'done'", (key,)
+        ).fetchone()
+        return loads(row['result']) if row and row['result'] is not None else None
+    
+    def next_due_in(self) -> Optional[float]:
+        """
+        Seconds until a job can next be leased (0 if one is due now), or None
+        if no job is pending or leased
+        
+        Leased jobs count as due when their lease expires: their consumer
+        may die, and then they are picked up again.
+        """
+        row = self._connection().execute(
+            "SELECT MIN(CASE WHEN status = 'pending' THEN available_at ELSE lease_expires END) "
+            "FROM jobs WHERE status IN ('pending', 'leased')"
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+    
+    def stats(self) -> Dict[str, Any]:
+        """Job counts by status, plus how many pending jobs are due now and expired leases"""
+        db = self._connection()
+        now = time.time()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        counts['due'] = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'pending' AND available_at <= ?", (now,)
+        ).fetchone()[0]
+        counts['expired_leases'] = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_expires <= ?", (now,)
+        ).fetchone()[0]
+        return counts
+
+
+def run_consumer(
+    queue: JobQueue,
+    pool,
+    owner: Optional[str] = None,
+    max_in_flight: Optional[int] = None,
+    job_timeout: Optional[float] = None,
+    poll_interval: float = 2.0,
+    exit_when_idle: bool = True,
+    stage_store_dir: Optional[str] = None,
+    stop_event: Optional[threading.Event] = None,
+    fetcher=None
+) -> Dict[str, int]:
+    """
+    Lease jobs and run them on an ExtractorWorkerPool until the queue is drained
+    
+    Leases are heartbeated while their job runs. Several consumers (this
+    function in other processes or on other pools) can share one queue.
+    
+    Jobs whose payload has a pdf_url instead of a pdf_path are downloaded
+    first (pdf_fetcher.py). Downloads start as soon as the job is leased, so
+    with max_in_flight above the worker count they run ahead of extraction.
+    
+    Args:
+        queue: Queue to consume
+        pool: ExtractorWorkerPool that runs the jobs
+        owner: Lease owner name (defaults to host:pid:thread)
+        max_in_flight: Jobs leased at once (defaults to 2x the pool's workers)
+        job_timeout: Fail a job that runs longer than this many seconds,
+            counted from when a pool worker starts it (downloads and the
+            pool queue do not count); the worker is replaced, so a retry
+            never runs alongside the original
+        poll_interval: Seconds between polls when nothing is due
+        exit_when_idle: Return once no job is pending or leased; jobs
+            waiting out a retry backoff, or leased by other consumers, are
+            waited for (otherwise keep polling until stop_event is set)
+        stage_store_dir: Reprocess incrementally against this StageStore
+        stop_event: Stop leasing new jobs once set; running jobs finish
+        fetcher: PDFFetcher for pdf_url jobs (default: one with 8
+            connections, created on the first such job)
+            
+    Returns:
+        Counts of completed, failed and lost (lease expired) jobs
+    """
+    owner = owner or default_owner()
+    max_in_flight = max_in_flight or pool.num_workers * 2
+    options = {}
+    if stage_store_dir:
+        from stage_store import StageStore
+        options['stage_store'] = StageStore(stage_store_dir)
+    
+    counts = {'completed': 0, 'failed': 0, 'lost': 0}
+    in_flight: Dict[concurrent.futures.Future, Dict[str, Any]] = {}
+    heartbeat_every = queue.visibility_timeout / 3
+    owns_fetcher = False
+    
+    def extract(entry):
+        entry['job_id'] = pool.submit(**entry['kwargs'], **options, job_timeout=job_timeout)
+        in_flight[pool.future(entry['job_id'])] = entry
+    
+    def settle(future, outcome, report):
+        entry = in_flight.pop(future)
+        try:
+            report(entry['job'])
+            counts[outcome] += 1
+        except LeaseLostError as e:
+            logger.warning("%s", e)
+            counts['lost'] += 1
+    
+    while True:
+        stopping = stop_event is not None and stop_event.is_set()
+        if not stopping and len(in_flight) < max_in_flight:
+            for job in queue.lease(owner, max_in_flight - len(in_flight)):
+                kwargs = job.process_pdf_kwargs()
+                url = kwargs.pop('pdf_url', None)
+                entry = {'job': job, 'kwargs': kwargs, 'heartbeat': time.monotonic()}
+                if url is None:
+                    extract(entry)
+                    continue
+                if fetcher is None:
+                    from pdf_fetcher import PDFFetcher
+                    fetcher = PDFFetcher()
+                    owns_fetcher = True
+                entry['fetching'] = True
+                in_flight[fetcher.submit(url)] = entry
+        if not in_flight:
+            if owns_fetcher:
+                fetcher.close()
+                fetcher, owns_fetcher = None, False
+            if stopping:
+                return counts
+            wait = poll_interval
+            if exit_when_idle:
+                wait = queue.next_due_in()
+                if wait is None:
+                    return counts
+            # Poll at least every poll_interval: new jobs may be enqueued meanwhile
+            time.sleep(min(wait, poll_interval))
+            continue
+        
+        finished, _ = concurrent.futures.wait(
+            list(in_flight), timeout=min(poll_interval, heartbeat_every), return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in finished:
+            entry = in_flight[future]
+            if entry.pop('fetching', False):
+                try:
+                    entry['kwargs']['pdf_path'] = future.result()
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    logger.warning("%s download failed (attempt %d): %s", entry['job'].key, entry['job'].attempts, error)
+                    settle(future, 'failed', lambda job: queue.fail(job, error))
+                else:
+                    in_flight.pop(future)
+                    extract(entry)
+                continue
+            try:
+                result = pool.result(entry['job_id'], timeout=0)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning("%s failed (attempt %d): %s", entry['job'].key, entry['job'].attempts, error)
+                settle(future, 'failed', lambda job: queue.fail(job, error))
+            else:
+                settle(future, 'completed', lambda job: queue.complete(job, result))
+        
+        now = time.monotonic()
+        for future, entry in list(in_flight.items()):
+            if now - entry['heartbeat'] >= heartbeat_every:
+                try:
+                    queue.heartbeat(entry['job'])
+                    entry['heartbeat'] = now
+                except LeaseLostError as e:
+                    logger.warning("%s", e)
+                    in_flight.pop(future)
+                    counts['lost'] += 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    enqueue = commands.add_parser('enqueue', help='add plans to the queue')
+    enqueue.add_argument('queue', help='queue database file')
+    source = enqueue.add_mutually_exclusive_group(required=True)
+    source.add_argument('--directory', help='directory of PDFs (see batch_extract.py)')
+    source.add_argument('--manifest', help='CSV or JSONL manifest of plans')
+    enqueue.add_argument('--patient-id', help='patient ID for all PDFs in directory mode')
+    enqueue.add_argument('--max-attempts', type=int, help='attempts before dead-lettering')
+    enqueue.add_argument('--requeue', action='store_true', help='also requeue plans that are done or dead')
+    
+    work = commands.add_parser('work', help='consume the queue')
+    work.add_argument('queue', help='queue database file')
+    work.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    work.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    work.add_argument('--visibility-timeout', type=float, default=300.0, help='lease length in seconds')
+    work.add_argument('--job-timeout', type=float, help='fail jobs running longer than this')
+    work.add_argument('--stage-store', help='reprocess incrementally against this stage store directory')
+    work.add_argument('--cache-dir', help='result cache directory shared by the workers')
+    work.add_argument('--follow', action='store_true', help='keep polling for new jobs instead of exiting when idle')
+    work.add_argument('--fetch-connections', type=int, default=8, help='concurrent downloads for pdf_url jobs')
+    
+    for name, help_text in (('stats', 'job counts by status'), ('dead', 'list dead-lettered jobs'),
+                            ('retry-dead', 'requeue dead-lettered jobs')):
+        commands.add_parser(name, help=help_text).add_argument('queue', help='queue database file')
+    
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    if args.command == 'enqueue':
+        from batch_extract import plan_key, plans_from_directory, plans_from_manifest
+        queue = JobQueue(args.queue)
+        plans = plans_from_manifest(args.manifest) if args.manifest else plans_from_directory(args.directory, args.patient_id)
+        added = queue.enqueue_many(((plan_key(plan), plan) for plan in plans), args.max_attempts, args.requeue)
+        print(f"{added} jobs added")
+        return 0
+    
+    if args.command == 'work':
+        from pdf_fetcher import PDFFetcher
+        from worker_pool import ExtractorWorkerPool
+        queue = JobQueue(args.queue, visibility_timeout=args.visibility_timeout)
+        with ExtractorWorkerPool(num_workers=args.workers, nlp_model=args.model, cache_dir=args.cache_dir) as pool, \
+                PDFFetcher(max_connections=args.fetch_connections) as fetcher:
+            try:
+                counts = run_consumer(
+                    queue,
+                    pool,
+                    job_timeout=args.job_timeout,
+                    exit_when_idle=not args.follow,
+                    stage_store_dir=args.stage_store,
+                    fetcher=fetcher
+                )
+            except KeyboardInterrupt:
+                # Leases of running jobs expire and the jobs are picked up on the next run
+                print("\nInterrupted; rerun to resume", file=sys.stderr)
+                return 130
+        print(json.dumps({**counts, 'queue': queue.stats()}, indent=2))
+        return 0
+    
+    queue = JobQueue(args.queue)
+    if args.command == 'stats':
+        print(json.dumps(queue.stats(), indent=2))
+    elif args.command == 'dead':
+        for entry in queue.dead_letters():
+            print(f"{entry['key']}\tattempts={entry['attempts']}\t{entry['last_error']}")
+    else:
+        print(f"{queue.retry_dead()} jobs requeued")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Latency Budget - Choose extraction strategies that fit a deadline
+
+process_pdf(latency_budget=...) estimates how long a full-quality run of the
+document would take and, if that exceeds the budget, degrades step by step
+(cheapest quality loss first) until the estimate fits:
+
+1. fast_pdf_engine:       PyPDF2 instead of pdfplumber for text extraction
+                          (no layout analysis; an order of magnitude faster)
+2. skip_pos_instructions: exercise instructions are the whole paragraph
+                          instead of the imperative sentences found by POS
+                          tagging, so spaCy's tagger/parser never run
+3. leading_pages:         only the first pages that fit are processed
+
+The estimate uses per-page costs learned from recent runs (seeded with
+typical values). The budget is checked again before NLP, so a slow parse can
+still trigger skip_pos_instructions. Degradations are listed in
+metadata['degradations'] and lower metadata['confidence']; callers can queue
+a full-quality pass for degraded results.
+"""
+
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+# Confidence lost per degradation (see PDFTreatmentPlanExtractor._calculate_confidence)
+CONFIDENCE_PENALTIES = {
+    'fast_pdf_engine': 0.03,
+    'skip_pos_instructions': 0.05,
+    'leading_pages': 0.15
+}
+
+
+class QualityPlan:
+    """Strategies for one run, plus its deadline"""
+    
+    __slots__ = ('pdf_engine', 'use_pos', 'max_pages', 'deadline', 'degradations')
+    
+    def __init__(self, deadline: Optional[float] = None):
+        self.pdf_engine = 'pdfplumber'
+        self.use_pos = True
+        self.max_pages: Optional[int] = None
+        self.deadline = deadline
+        self.degradations: List[str] = []
+    
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (None without one)"""
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+    
+    def degrade(self, degradation: str):
+        if degradation == 'fast_pdf_engine':
+            self.pdf_engine = 'pypdf2'
+        elif degradation == 'skip_pos_instructions':
+            self.use_pos = False
+        if degradation not in self.degradations:
+            self.degradations.append(degradation)
+
+
+class LatencyPlanner:
+    """
+    Per-page cost model and degradation policy
+    
+    Costs are exponentially weighted averages of observed stage times per
+    page, so the planner adapts to the host and the document mix. Shared by
+    all runs of an extractor; updates are locked.
+    """
+    
+    # Seconds per page, measured on typical plans with en_core_web_sm
+    DEFAULT_COSTS = {
+        'extract_text:pdfplumber': 0.04,
+        'extract_text:pypdf2': 0.004,
+        'nlp:full': 0.05,
+        'nlp:fast': 0.002
+    }
+    # Per-run cost independent of page count (sections, missions, bookkeeping)
+    FIXED_SECONDS = 0.05
+    
+    def __init__(self, smoothing: float = 0.2):
+        """
+        Args:
+            smoothing: Weight of the newest observation in the cost averages
+        """
+        self.smoothing = smoothing
+        self._costs = dict(self.DEFAULT_COSTS)
+        self._lock = threading.Lock()
+    
+    def costs(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._costs)
+    
+    def estimate(self, pages: int, pdf_engine: str = 'pdfplumber', use_pos: bool = True) -> float:
+        """Estimated seconds for a run over pages pages with the given strategies"""
+        costs = self.costs()
+        per_page = costs[f'extract_text:{pdf_engine}'] + costs['nlp:full' if use_pos else 'nlp:fast']
+        return self.FIXED_SECONDS + pages * per_page
+    
+    def plan(self, page_count: Optional[int], budget: float) -> QualityPlan:
+        """
+        Cheapest set of degradations whose estimate fits budget
+        
+        Args:
+            page_count: Pages in the document (None if unknown: no up-front
+                degradation, only the check before NLP)
+            budget: Seconds available for the run
+        """
+        plan = QualityPlan(time.monotonic() + budget)
+        if not page_count:
+            return plan
+        
+        for degradation in ('fast_pdf_engine', 'skip_pos_instructions'):
+            if self.estimate(page_count, plan.pdf_engine, plan.use_pos) <= budget:
+                return plan
+            plan.degrade(degradation)
+        
+        if self.estimate(page_count, plan.pdf_engine, plan.use_pos) > budget:
+            per_page = self.estimate(1, plan.pdf_engine, plan.use_pos) - self.FIXED_SECONDS
+            pages = max(1, int((budget - self.FIXED_SECONDS) / per_page))
+            if pages < page_count:
+                plan.max_pages = pages
+                plan.degrade('leading_pages')
+        return plan
+    
+    def check_before_nlp(self, plan: QualityPlan, pages: int):
+        """Skip POS tagging if full NLP no longer fits the time left"""
+        remaining = plan.remaining()
+        if remaining is None or not plan.use_pos or not pages:
+            return
+        full_nlp = pages * self.costs()['nlp:full'] + self.FIXED_SECONDS
+        if full_nlp > remaining:
+            plan.degrade('skip_pos_instructions')
+    
+    def observe(self, plan: QualityPlan, pages: int, timings: Dict[str, Any]):
+        """Update the per-page costs from a finished run's stage timings"""
+        if not pages:
+            return
+        stages = timings.get('stages', {})
+        samples = {}
+        if 'extract_text' in stages:
+            samples[f'extract_text:{plan.pdf_engine}'] = stages['extract_text']['wall_ms'] / 1000 / pages
+        if 'nlp' in stages:
+            samples['nlp:full' if plan.use_pos else 'nlp:fast'] = stages['nlp']['wall_ms'] / 1000 / pages
+        with self._lock:
+            for key, value in samples.items():
+                self._costs[key] += self.smoothing * (value - self._costs[key])
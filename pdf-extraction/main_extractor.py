@@ -3,14 +3,34 @@ Main Treatment Plan Extractor - Orchestrates the entire extraction pipeline
 """
 
 from typing import Dict, Any, Optional
-from pathlib import Path
-import json
+from concurrent.futures import Executor, ThreadPoolExecutor
+import asyncio
+import logging
+import threading
+import weakref
 from datetime import date
 
 from pdf_parser import PDFParser
 from nlp_extractor import NLPExtractor
 from mission_generator import MissionGenerator
+from recurrence import occurrence_count
 from user_matcher import UserMatcher
+from instrumentation import METRICS, MetricsRegistry, StageTimer
+from memory_profiling import MemoryProfiler, write_memory_report
+import cpu_profiling
+from serialization import write_results
+from result_cache import ResultCache, file_digest
+from stage_store import StageStore, StageRecord, content_digest
+from latency_budget import CONFIDENCE_PENALTIES, LatencyPlanner, QualityPlan
+
+logger = logging.getLogger(__name__)
+
+# Bump when a change alters extraction output, so cached analyses are not reused
+EXTRACTOR_VERSION = '1.1'
+
+
+class ExtractionCancelledError(RuntimeError):
+    """Raised when a pipeline run is cancelled between stages"""
 
 
 class PDFTreatmentPlanExtractor:
@@ -20,14 +40,75 @@ class PDFTreatmentPlanExtractor:
     2. NLP-based structured data extraction
     3. Mission generation
     4. Calendar event creation
+    
+    process_pdf is synchronous; aprocess_pdf runs it on an executor so
+    async callers (FastAPI handlers) do not block their event loop.
+    
+    Thread safety: process_pdf is re-entrant. Per-call state (the
+    MissionGenerator with its start_date) lives on the call stack; the
+    shared components are stateless (PDFParser, UserMatcher) or only read
+    after a locked one-time model load (NLPExtractor). Sharing the spaCy
+    pipeline between threads is verified per model with
+    stress_concurrency.py, not guaranteed by spaCy (see NLPExtractor).
     """
     
-    def __init__(self, nlp_model: str = 'en_core_web_sm'):
-        """Initialize the extractor with all components"""
+    def __init__(
+        self,
+        nlp_model: str = 'en_core_web_sm',
+        max_concurrency: int = 1,
+        executor: Optional[Executor] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        profile_memory: bool = False,
+        cpu_profile_rate: Optional[float] = None,
+        cache: Optional[ResultCache] = None
+    ):
+        """
+        Initialize the extractor with all components
+        
+        Args:
+            nlp_model: spaCy model name or path
+            max_concurrency: Maximum number of aprocess_pdf runs executing at once
+            executor: Executor for aprocess_pdf (defaults to a thread pool
+                of max_concurrency workers owned by this extractor)
+            metrics: Registry for run metrics (defaults to the process-wide
+                instrumentation.METRICS)
+            profile_memory: Record a per-stage tracemalloc profile for every
+                run (see memory_profiling.py; can also be set per call)
+            cpu_profile_rate: Fraction of runs to CPU-profile (defaults to
+                PDF_EXTRACTION_CPU_PROFILE_RATE, normally 0; see cpu_profiling.py)
+            cache: Result cache for re-submitted PDFs (see result_cache.py);
+                None disables caching
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        
         self.pdf_parser = PDFParser()
         self.nlp_extractor = NLPExtractor(nlp_model)
-        self.mission_generator = None  # Initialized with start_date later
         self.user_matcher = UserMatcher()
+        self.metrics = metrics if metrics is not None else METRICS
+        self.profile_memory = profile_memory
+        self.cache = cache
+        self.latency_planner = LatencyPlanner()
+        self.cpu_profile_rate = (
+            cpu_profiling.profile_rate_from_env() if cpu_profile_rate is None else cpu_profile_rate
+        )
+        
+        self.max_concurrency = max_concurrency
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._executor_lock = threading.Lock()
+        # asyncio semaphores are bound to one event loop, so keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+    
+    def warm_up(self) -> 'PDFTreatmentPlanExtractor':
+        """
+        Load the spaCy model now instead of on the first process_pdf call
+        
+        Heavy dependencies are imported lazily, so constructing the
+        extractor is cheap; long-lived workers call this once at startup.
+        """
+        self.nlp_extractor.load()
+        return self
     
     def process_pdf(
         self,
@@ -35,85 +116,651 @@ class PDFTreatmentPlanExtractor:
         patient_id: str,
         treatment_plan_id: str,
         start_date: Optional[date] = None,
-        default_points: int = 50
+        default_points: int = 50,
+        profile_memory: Optional[bool] = None,
+        memory_report_path: Optional[str] = None,
+        profile_cpu: Optional[bool] = None,
+        cpu_profile_path: Optional[str] = None,
+        stage_store: Optional[StageStore] = None,
+        latency_budget: Optional[float] = None,
+        recurring_missions: bool = False
     ) -> Dict[str, Any]:
         """
         Process a treatment plan PDF and generate missions
         
         Args:
-            pdf_path: Path to PDF file
+            pdf_path: Path to PDF file, or a seekable binary file object
+                such as a pdf_fetcher.py download (no temporary file needed)
             patient_id: ID of the patient
             treatment_plan_id: ID of the treatment plan
             start_date: Start date for missions (defaults to today)
             default_points: Default points per mission
-            
+            profile_memory: Record a per-stage memory profile in
+                metadata['memory_profile'] (defaults to the extractor setting)
+            memory_report_path: Also write the memory profile to this file
+                (.json for JSON, anything else for a text report); implies
+                profile_memory
+            profile_cpu: Sample the run's call stacks (defaults to a random
+                draw against the extractor's cpu_profile_rate)
+            cpu_profile_path: Write the CPU profile here in collapsed-stack
+                format (defaults to PDF_EXTRACTION_CPU_PROFILE_DIR); implies
+                profile_cpu
+            stage_store: Reprocess incrementally: reuse this plan's stored
+                stage outputs whose logic version and input are unchanged and
+                re-run only the rest (see stage_store.py). The result cache
+                is bypassed.
+            latency_budget: Seconds the run may take. If a full-quality run
+                is not expected to fit, cheaper strategies are used; they are
+                listed in metadata['degradations'] and lower the confidence
+                (see latency_budget.py). Ignored with stage_store.
+            recurring_missions: Return the missions as compact recurring
+                records in 'recurring_missions' (one per series, see
+                recurrence.py) instead of the expanded 'missions' list
+                
         Returns:
             Dictionary containing:
             - extracted_data: Raw extracted structured data
-            - missions: Generated missions
+            - missions: Generated missions (or recurring_missions)
             - calendar_events: Generated calendar events
-            - metadata: Processing metadata
+            - metadata: Processing metadata, including per-stage
+              'timings' (wall/CPU ms) and item 'counts'
         """
-        # Step 1: Extract text from PDF
-        print(f"Step 1: Extracting text from PDF: {pdf_path}")
-        pdf_data = self.pdf_parser.extract_text(pdf_path)
-        full_text = pdf_data['full_text']
+        return self._run_pipeline(
+            pdf_path,
+            patient_id,
+            treatment_plan_id,
+            start_date,
+            default_points,
+            profile_memory=profile_memory,
+            memory_report_path=memory_report_path,
+            profile_cpu=profile_cpu,
+            cpu_profile_path=cpu_profile_path,
+            stage_store=stage_store,
+            latency_budget=latency_budget,
+            recurring_missions=recurring_missions
+        )
+    
+    async def aprocess_pdf(
+        self,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date] = None,
+        default_points: int = 50,
+        timeout: Optional[float] = None,
+        **options
+    ) -> Dict[str, Any]:
+        """
+        Async counterpart of process_pdf
         
-        # Clean text
-        cleaned_text = self.pdf_parser.clean_text(full_text)
+        The pipeline runs on the extractor's executor, with at most
+        max_concurrency runs in flight; further callers wait for a slot.
+        If the awaiting task is cancelled or the timeout expires, a run that
+        has not started is dropped and a running one stops at the next stage
+        boundary. The slot is only freed once the run has actually stopped.
         
-        # Step 2: Extract structured data using NLP
-        print("Step 2: Extracting structured data using NLP...")
-        extracted_data = self.nlp_extractor.extract_all(cleaned_text)
+        Args:
+            timeout: Seconds to wait for the result, including time spent
+                waiting for a slot (None waits indefinitely)
+            options: Further process_pdf keyword arguments
+            (other arguments as for process_pdf)
+            
+        Returns:
+            The same dictionary as process_pdf
+            
+        Raises:
+            asyncio.TimeoutError: If the timeout expires
+        """
+        return await asyncio.wait_for(
+            self._aprocess_pdf(pdf_path, patient_id, treatment_plan_id, start_date, default_points, options),
+            timeout
+        )
+    
+    async def _aprocess_pdf(
+        self,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date],
+        default_points: int,
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        
+        await semaphore.acquire()
+        cancel_event = threading.Event()
+        try:
+            job = self._get_executor().submit(
+                self._run_pipeline,
+                pdf_path,
+                patient_id,
+                treatment_plan_id,
+                start_date,
+                default_points,
+                cancel_event,
+                **options
+            )
+        except BaseException:
+            semaphore.release()
+            raise
         
-        # Step 3: Generate missions
-        print("Step 3: Generating missions from extracted data...")
+        def release_slot(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass  # Event loop already closed
+        
+        job.add_done_callback(release_slot)
+        
+        try:
+            return await asyncio.wrap_future(job)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            job.cancel()
+            raise
+    
+    def _get_executor(self) -> Executor:
+        """Return the executor for aprocess_pdf, creating the default one lazily"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        thread_name_prefix='pdf-extractor'
+                    )
+        return self._executor
+    
+    def shutdown(self, wait: bool = True):
+        """Shut down the executor created for aprocess_pdf (a passed-in executor is left alone)"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._owns_executor:
+            executor.shutdown(wait=wait)
+    
+    def _run_pipeline(
+        self,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date],
+        default_points: int,
+        cancel_event: Optional[threading.Event] = None,
+        profile_memory: Optional[bool] = None,
+        memory_report_path: Optional[str] = None,
+        profile_cpu: Optional[bool] = None,
+        cpu_profile_path: Optional[str] = None,
+        stage_store: Optional[StageStore] = None,
+        latency_budget: Optional[float] = None,
+        recurring_missions: bool = False
+    ) -> Dict[str, Any]:
+        """Run all pipeline stages, checking cancel_event between stages"""
         start_date = start_date or date.today()
-        self.mission_generator = MissionGenerator(start_date)
+        if profile_memory is None:
+            profile_memory = self.profile_memory
+        memory_profiler = MemoryProfiler() if profile_memory or memory_report_path else None
         
-        missions = self.mission_generator.generate_missions(
-            extracted_data,
+        if profile_cpu is None:
+            profile_cpu = cpu_profiling.should_profile(self.cpu_profile_rate)
+        cpu_profiler = None
+        if profile_cpu or cpu_profile_path:
+            cpu_profiler = cpu_profiling.SamplingProfiler(
+                treatment_plan_id,
+                interval=cpu_profiling.interval_from_env()
+            )
+        
+        hooks = [hook for hook in (memory_profiler, cpu_profiler) if hook]
+        timer = StageTimer(hooks=hooks)
+        for hook in hooks:
+            hook.start()
+        try:
+            result = self._run_stages(
+                timer,
+                pdf_path,
+                patient_id,
+                treatment_plan_id,
+                start_date,
+                default_points,
+                cancel_event,
+                stage_store,
+                latency_budget,
+                recurring_missions
+            )
+        except ExtractionCancelledError:
+            self.metrics.record_run({}, status='cancelled')
+            raise
+        except Exception:
+            self.metrics.record_run({}, status='error')
+            raise
+        finally:
+            for hook in reversed(hooks):
+                hook.stop()
+            if cpu_profiler:
+                self._write_cpu_profile(cpu_profiler, cpu_profile_path, treatment_plan_id)
+        
+        if memory_profiler:
+            profile = memory_profiler.as_dict()
+            result['metadata']['memory_profile'] = profile
+            if memory_report_path:
+                write_memory_report(profile, memory_report_path, title=f"{treatment_plan_id} ({pdf_path})")
+        if cpu_profiler:
+            result['metadata']['cpu_profile'] = {**cpu_profiler.as_dict(), 'path': cpu_profiler.path}
+        
+        self.metrics.record_run(result['metadata'])
+        return result
+    
+    def _run_stages(
+        self,
+        timer: StageTimer,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date],
+        default_points: int,
+        cancel_event: Optional[threading.Event],
+        stage_store: Optional[StageStore] = None,
+        latency_budget: Optional[float] = None,
+        recurring_missions: bool = False
+    ) -> Dict[str, Any]:
+        start_date = start_date or date.today()
+        if stage_store is not None:
+            return self._run_incremental(
+                timer, stage_store, pdf_path, patient_id, treatment_plan_id, start_date, default_points, cancel_event,
+                recurring_missions
+            )
+        if self.cache is None:
+            analysis = self._analyze_document(timer, pdf_path, cancel_event, latency_budget)
+            return self._build_result(
+                timer, pdf_path, analysis, patient_id, treatment_plan_id, start_date, default_points, cancel_event,
+                recurring_missions
+            )
+        
+        with timer.stage('cache_lookup'):
+            key = self.cache.document_key(pdf_path, self.cache_version)
+            params = (patient_id, treatment_plan_id, start_date.isoformat(), default_points, recurring_missions)
+            result = self.cache.get_result(key, params)
+            analysis = None if result is not None else self.cache.get_document(key)
+        
+        if result is not None:
+            # Exact duplicate submission
+            result['metadata']['cache'] = 'full_hit'
+            result['metadata']['timings'] = timer.as_dict()
+            logger.info("Returning cached result for %s", pdf_path)
+            return result
+        
+        if analysis is None:
+            outcome = 'miss'
+            analysis = self._analyze_document(timer, pdf_path, cancel_event, latency_budget)
+        else:
+            # Same PDF, different plan parameters: only missions are redone
+            outcome = 'document_hit'
+        
+        result = self._build_result(
+            timer, pdf_path, analysis, patient_id, treatment_plan_id, start_date, default_points, cancel_event,
+            recurring_missions
+        )
+        result['metadata']['cache'] = outcome
+        if outcome == 'miss' and analysis.get('degradations'):
+            # Serve it, but keep the cache for full-quality analyses
+            return result
+        if outcome == 'miss':
+            self.cache.put_document(key, analysis)
+        self.cache.put_result(key, params, result)
+        return result
+    
+    @property
+    def cache_version(self) -> str:
+        """Everything besides the PDF bytes that determines the document analysis"""
+        stage_versions = {**PDFParser.STAGE_VERSIONS, **NLPExtractor.STAGE_VERSIONS}
+        return f"{EXTRACTOR_VERSION}:{self.nlp_extractor.model_name}:{content_digest(stage_versions)[:12]}"
+    
+    def _run_incremental(
+        self,
+        timer: StageTimer,
+        stage_store: StageStore,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: date,
+        default_points: int,
+        cancel_event: Optional[threading.Event],
+        recurring_missions: bool = False
+    ) -> Dict[str, Any]:
+        """Re-run only the stages whose version or input changed since the plan's stored record"""
+        record = stage_store.load(treatment_plan_id)
+        parser_versions = PDFParser.STAGE_VERSIONS
+        
+        with timer.stage('stage_lookup'):
+            pdf_digest = file_digest(pdf_path)
+        
+        def extract_text():
+            with timer.stage('extract_text'):
+                return self.pdf_parser.extract_text(pdf_path)
+        
+        pdf_data = self._incremental_stage(
+            record, 'extract_text', parser_versions['extract_text'], pdf_digest, extract_text
+        )
+        
+        def clean_text():
+            with timer.stage('clean_text'):
+                return self.pdf_parser.clean_text(pdf_data['full_text'])
+        
+        cleaned_text = self._incremental_stage(
+            record, 'clean_text', parser_versions['clean_text'], content_digest(pdf_data['full_text']), clean_text
+        )
+        self._check_cancelled(cancel_event)
+        
+        # NLP: each sub-extractor is versioned separately, so a rule change in
+        # one of them does not re-run the others
+        text_digest = content_digest(cleaned_text)
+        model = self.nlp_extractor.model_name
+        parts = {}
+        stale = []
+        for part, version in NLPExtractor.STAGE_VERSIONS.items():
+            entry = record.current(f'nlp.{part}', f'{version}:{model}', text_digest)
+            if entry is None:
+                stale.append(part)
+            else:
+                parts[part] = entry['output']
+        metadata_entry = record.current('nlp.metadata', model, text_digest)
+        if stale or metadata_entry is None:
+            with timer.stage('nlp'):
+                fresh = self.nlp_extractor.extract_parts(cleaned_text, stale)
+                if metadata_entry is None:
+                    nlp_metadata = self.nlp_extractor.extraction_metadata(cleaned_text)
+            for part in stale:
+                record.put(f'nlp.{part}', f'{NLPExtractor.STAGE_VERSIONS[part]}:{model}', text_digest, fresh[part])
+            parts.update(fresh)
+            if metadata_entry is None:
+                record.put('nlp.metadata', model, text_digest, nlp_metadata)
+        if metadata_entry is not None:
+            nlp_metadata = metadata_entry['output']
+        self._check_cancelled(cancel_event)
+        
+        def sections():
+            with timer.stage('sections'):
+                return self.pdf_parser.identify_sections(cleaned_text)
+        
+        analysis = {
+            'extracted_data': {
+                **{part: parts[part] for part in NLPExtractor.STAGE_VERSIONS},
+                'extraction_metadata': nlp_metadata
+            },
+            'sections': self._incremental_stage(
+                record, 'sections', parser_versions['sections'], text_digest, sections
+            ),
+            'document': {
+                'total_pages': pdf_data['total_pages'],
+                'extraction_method': pdf_data['extraction_method'],
+                'text_length': len(cleaned_text),
+                'paragraph_count': self.pdf_parser.count_paragraphs(pdf_data['full_text'])
+            }
+        }
+        
+        def missions():
+            return self._generate_missions(
+                timer, analysis['extracted_data'], patient_id, treatment_plan_id, start_date, default_points,
+                recurring_missions=recurring_missions
+            )
+        
+        # Missions depend on the extracted parts (not the metadata timestamp),
+        # on the plan parameters and on the output form
+        missions_input = content_digest(
+            parts, patient_id, treatment_plan_id, start_date.isoformat(), default_points,
+            *(['recurring_missions'] if recurring_missions else [])
+        )
+        generated = self._incremental_stage(
+            record, 'missions', MissionGenerator.VERSION, missions_input, missions
+        )
+        
+        stage_store.save(treatment_plan_id, record)
+        result = self._assemble_result(timer, pdf_path, analysis, generated)
+        result['metadata']['stages'] = record.summary()
+        logger.info(
+            "Reprocessed %s: re-ran %s",
             treatment_plan_id,
-            patient_id,
-            default_points
+            ', '.join(record.rerun) or 'nothing'
         )
+        return result
+    
+    @staticmethod
+    def _incremental_stage(record: StageRecord, stage: str, version: str, input_digest: str, compute):
+        """Stored output of stage if current, else compute() (which is recorded)"""
+        entry = record.current(stage, version, input_digest)
+        if entry is not None:
+            return entry['output']
+        output = compute()
+        record.put(stage, version, input_digest, output)
+        return output
+    
+    def _analyze_document(
+        self,
+        timer: StageTimer,
+        pdf_path: str,
+        cancel_event: Optional[threading.Event] = None,
+        latency_budget: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Run the document-level stages (everything that does not depend on the plan parameters)"""
+        plan = None
+        if latency_budget is not None:
+            with timer.stage('plan'):
+                plan = self.latency_planner.plan(self.pdf_parser.count_pages(pdf_path), latency_budget)
         
-        # Step 4: Generate calendar events
-        print("Step 4: Generating calendar events...")
-        calendar_events = self.mission_generator.generate_calendar_events(missions)
+        pdf_data, cleaned_text = self._parse_document(timer, pdf_path, plan)
+        self._check_cancelled(cancel_event)
         
-        # Step 5: Extract sections for database storage
-        sections = self.pdf_parser.identify_sections(cleaned_text)
+        if plan is not None:
+            self.latency_planner.check_before_nlp(plan, pdf_data['total_pages'])
+        extracted_data = self._extract_structured_data(timer, cleaned_text, plan)
+        self._check_cancelled(cancel_event)
         
-        result = {
+        analysis = self._document_analysis(timer, pdf_data, cleaned_text, extracted_data)
+        if plan is not None:
+            self.latency_planner.observe(plan, pdf_data['total_pages'], timer.as_dict())
+            if plan.degradations:
+                analysis['degradations'] = list(plan.degradations)
+                logger.info("Degraded %s to fit %.2fs: %s", pdf_path, latency_budget, ', '.join(plan.degradations))
+        return analysis
+    
+    def _parse_document(self, timer: StageTimer, pdf_path: str, plan: Optional[QualityPlan] = None):
+        """Stages extract_text and clean_text; returns (pdf_data, cleaned_text)"""
+        # Step 1: Extract text from PDF
+        logger.debug("Extracting text from PDF: %s", pdf_path)
+        with timer.stage('extract_text'):
+            if plan is None:
+                pdf_data = self.pdf_parser.extract_text(pdf_path)
+            else:
+                pdf_data = self.pdf_parser.extract_text(pdf_path, engine=plan.pdf_engine, max_pages=plan.max_pages)
+        
+        # Clean text
+        with timer.stage('clean_text'):
+            cleaned_text = self.pdf_parser.clean_text(pdf_data['full_text'])
+        return pdf_data, cleaned_text
+    
+    def _extract_structured_data(
+        self,
+        timer: StageTimer,
+        cleaned_text: str,
+        plan: Optional[QualityPlan] = None
+    ) -> Dict[str, Any]:
+        """Stage nlp"""
+        # Step 2: Extract structured data using NLP
+        logger.debug("Extracting structured data using NLP")
+        with timer.stage('nlp'):
+            return self.nlp_extractor.extract_all(cleaned_text, use_pos=plan is None or plan.use_pos)
+    
+    def _document_analysis(
+        self,
+        timer: StageTimer,
+        pdf_data: Dict[str, Any],
+        cleaned_text: str,
+        extracted_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Stage sections; bundles the document-level outputs (the cacheable part)"""
+        # Step 3: Extract sections for database storage
+        with timer.stage('sections'):
+            sections = self.pdf_parser.identify_sections(cleaned_text)
+        
+        return {
             'extracted_data': extracted_data,
             'sections': sections,
-            'missions': missions,
-            'calendar_events': calendar_events,
-            'metadata': {
-                'pdf_path': pdf_path,
+            'document': {
                 'total_pages': pdf_data['total_pages'],
                 'extraction_method': pdf_data['extraction_method'],
                 'text_length': len(cleaned_text),
-                'missions_generated': len(missions),
+                # Counted before clean_text, which collapses the blank lines
+                'paragraph_count': self.pdf_parser.count_paragraphs(pdf_data['full_text'])
+            }
+        }
+    
+    def _build_result(
+        self,
+        timer: StageTimer,
+        pdf_path: str,
+        analysis: Dict[str, Any],
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date],
+        default_points: int,
+        cancel_event: Optional[threading.Event] = None,
+        recurring_missions: bool = False
+    ) -> Dict[str, Any]:
+        """Stages missions and calendar; assembles the result"""
+        generated = self._generate_missions(
+            timer,
+            analysis['extracted_data'],
+            patient_id,
+            treatment_plan_id,
+            start_date,
+            default_points,
+            cancel_event,
+            recurring_missions
+        )
+        return self._assemble_result(timer, pdf_path, analysis, generated)
+    
+    def _generate_missions(
+        self,
+        timer: StageTimer,
+        extracted_data: Dict[str, Any],
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date],
+        default_points: int,
+        cancel_event: Optional[threading.Event] = None,
+        recurring_missions: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Stages missions and calendar; returns 'missions' (or, with
+        recurring_missions, the records in 'recurring_missions') and
+        'calendar_events'
+        """
+        # Step 4: Generate missions
+        logger.debug("Generating missions from extracted data")
+        start_date = start_date or date.today()
+        # Step 5: Calendar events are generated in the same pass
+        with timer.stage('missions'):
+            # Per-call: start_date must not leak between concurrent runs
+            mission_generator = MissionGenerator(start_date)
+            records = mission_generator.generate_recurring_missions(
+                extracted_data,
+                treatment_plan_id,
+                patient_id,
+                default_points
+            )
+            # Recurring records are returned as they are; only the calendar
+            # event series are expanded then
+            missions, calendar_events = mission_generator.expand_with_events(records, expand=not recurring_missions)
+        self._check_cancelled(cancel_event)
+        if recurring_missions:
+            return {'recurring_missions': records, 'calendar_events': calendar_events}
+        return {'missions': missions, 'calendar_events': calendar_events}
+    
+    def _assemble_result(
+        self,
+        timer: StageTimer,
+        pdf_path: str,
+        analysis: Dict[str, Any],
+        generated: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Build the process_pdf result from the stage outputs"""
+        extracted_data = analysis['extracted_data']
+        document = analysis['document']
+        degradations = analysis.get('degradations', [])
+        nlp_metadata = extracted_data.get('extraction_metadata', {})
+        calendar_events = generated['calendar_events']
+        missions_key = 'recurring_missions' if 'recurring_missions' in generated else 'missions'
+        missions = generated[missions_key]
+        mission_count = len(missions) if missions_key == 'missions' else occurrence_count(missions)
+        result = {
+            'extracted_data': extracted_data,
+            'sections': analysis['sections'],
+            missions_key: missions,
+            'calendar_events': calendar_events,
+            'metadata': {
+                'pdf_path': str(pdf_path),
+                'total_pages': document['total_pages'],
+                'extraction_method': document['extraction_method'],
+                'text_length': document['text_length'],
+                'missions_generated': mission_count,
                 'calendar_events_generated': len(calendar_events),
                 'extraction_timestamp': date.today().isoformat(),
-                'confidence': self._calculate_confidence(extracted_data, missions)
+                'confidence': self._calculate_confidence(extracted_data, missions, degradations),
+                'degradations': degradations,
+                'counts': {
+                    'pages': document['total_pages'],
+                    'tokens': nlp_metadata.get('token_count', 0),
+                    'paragraphs': document.get('paragraph_count', 0),
+                    'missions': mission_count,
+                    'calendar_events': len(calendar_events)
+                },
+                'timings': timer.as_dict()
             }
         }
         
-        print(f"✓ Extraction complete!")
-        print(f"  - {len(missions)} missions generated")
-        print(f"  - {len(calendar_events)} calendar events generated")
-        print(f"  - {len(extracted_data.get('exercises', []))} exercises extracted")
-        print(f"  - Confidence: {result['metadata']['confidence']:.2%}")
+        logger.info(
+            "Extracted %s: %d exercises, %d missions, %d calendar events, "
+            "confidence %.2f, %.0f ms",
+            pdf_path,
+            len(extracted_data.get('exercises', [])),
+            mission_count,
+            len(calendar_events),
+            result['metadata']['confidence'],
+            result['metadata']['timings']['total']['wall_ms']
+        )
         
         return result
     
+    @staticmethod
+    def _write_cpu_profile(
+        profiler: 'cpu_profiling.SamplingProfiler',
+        path: Optional[str],
+        treatment_plan_id: str
+    ):
+        """Write a CPU profile to path or the configured directory, if any"""
+        if path is None:
+            directory = cpu_profiling.profile_dir_from_env()
+            if directory is None:
+                return
+            path = cpu_profiling.default_profile_path(directory, treatment_plan_id)
+        try:
+            profiler.path = cpu_profiling.write_collapsed(profiler, path)
+            logger.info("CPU profile for %s written to %s", treatment_plan_id, profiler.path)
+        except OSError as e:
+            logger.warning("Could not write CPU profile to %s: %s", path, e)
+    
+    @staticmethod
+    def _check_cancelled(cancel_event: Optional[threading.Event]):
+        """Abort the run if its caller has gone away"""
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExtractionCancelledError("PDF extraction was cancelled")
+    
     def _calculate_confidence(
         self,
         extracted_data: Dict[str, Any],
-        missions: list
+        missions: list,
+        degradations: list = ()
     ) -> float:
         """Calculate extraction confidence score"""
         # Base confidence
@@ -131,7 +778,11 @@ class PDFTreatmentPlanExtractor:
         if missions:
             confidence += 0.05
         
-        return min(confidence, 1.0)
+        # Reduced-quality strategies chosen to meet a latency budget
+        for degradation in degradations:
+            confidence -= CONFIDENCE_PENALTIES.get(degradation, 0.0)
+        
+        return max(min(confidence, 1.0), 0.0)
     
     def save_results(
         self,
@@ -139,16 +790,17 @@ class PDFTreatmentPlanExtractor:
         output_path: str,
         format: str = 'json'
     ):
-        """Save extraction results to file"""
-        output_path = Path(output_path)
-        
-        if format == 'json':
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False, default=str)
-        else:
-            raise ValueError(f"Unsupported format: {format}")
+        """
+        Save extraction results to file
         
-        print(f"Results saved to: {output_path}")
+        Args:
+            results: Result of process_pdf
+            output_path: Destination file
+            format: 'json' (pretty-printed), 'json-compact', 'msgpack' or
+                'ndjson' (see serialization.py; read back with load_results)
+        """
+        write_results(results, str(output_path), format)
+        logger.info("Results saved to: %s", output_path)
     
     def find_similar_users(
         self,
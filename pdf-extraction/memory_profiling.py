@@ -0,0 +1,156 @@
+"""
+Memory Profiling - Opt-in tracemalloc profiling of pipeline stages
+
+For each stage of a run, records:
+- peak_bytes: highest traced memory above the stage's starting point
+- net_bytes: memory still allocated when the stage ends (what it hands on)
+- top_allocations: the source lines that allocated the most net memory
+
+Enabled per extractor (PDFTreatmentPlanExtractor(profile_memory=True)) or
+per call (process_pdf(..., profile_memory=True)). The profile is added to
+result['metadata']['memory_profile'] and can be written as a standalone
+report. Profiling slows a run down noticeably; it is meant for sizing worker
+memory limits and tracking down OOMs, not for every production run.
+"""
+
+import json
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Iterator
+
+# tracemalloc is process-wide, so concurrent profiled runs would see each
+# other's allocations; profiled runs are serialized on this lock.
+PROFILE_LOCK = threading.Lock()
+
+# Allocation sites that belong to the profiler itself
+_IGNORED_SITES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class MemoryProfiler:
+    """
+    Per-stage tracemalloc profile of one pipeline run
+    
+    Used as a StageTimer hook: StageTimer(hooks=[profiler]). Call start()
+    before the first stage and stop() after the last one.
+    """
+    
+    def __init__(self, top_n: int = 10, frames: int = 1):
+        """
+        Args:
+            top_n: Number of allocation sites to keep per stage
+            frames: Traceback depth recorded per allocation (1 = the
+                allocating line only; more frames cost more memory and time)
+        """
+        self.top_n = top_n
+        self.frames = frames
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._started_tracing = False
+        self._run_start_bytes = 0
+        self._run_peak_bytes = 0
+    
+    def start(self):
+        """Begin tracing (acquires PROFILE_LOCK until stop())"""
+        PROFILE_LOCK.acquire()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self._run_start_bytes = tracemalloc.get_traced_memory()[0]
+        self._run_peak_bytes = 0
+    
+    def stop(self):
+        """End tracing started by start()"""
+        try:
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        finally:
+            PROFILE_LOCK.release()
+    
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        before = tracemalloc.take_snapshot().filter_traces(_IGNORED_SITES)
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(_IGNORED_SITES)
+            self._run_peak_bytes = max(self._run_peak_bytes, peak_bytes - self._run_start_bytes)
+            self.stages[name] = {
+                'peak_bytes': peak_bytes - start_bytes,
+                'net_bytes': end_bytes - start_bytes,
+                'top_allocations': self._top_allocations(after, before)
+            }
+    
+    def _top_allocations(self, after, before) -> List[Dict[str, Any]]:
+        growth = [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0]
+        growth.sort(key=lambda stat: stat.size_diff, reverse=True)
+        
+        sites = []
+        for stat in growth[:self.top_n]:
+            frame = stat.traceback[0]
+            sites.append({
+                'file': frame.filename,
+                'line': frame.lineno,
+                'size_diff_bytes': stat.size_diff,
+                'count_diff': stat.count_diff
+            })
+        return sites
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """Profile in the metadata['memory_profile'] format"""
+        return {
+            'stages': self.stages,
+            'run_peak_bytes': self._run_peak_bytes,
+            'largest_stage_peak': max(self.stages, key=lambda s: self.stages[s]['peak_bytes'], default=None)
+        }
+
+
+def format_memory_report(profile: Dict[str, Any], title: str = '') -> str:
+    """Render a memory profile as a human-readable text report"""
+    lines = [f"Memory profile{': ' + title if title else ''}"]
+    lines.append(f"Run peak above baseline: {_format_bytes(profile['run_peak_bytes'])}")
+    if profile.get('largest_stage_peak'):
+        lines.append(f"Largest stage peak: {profile['largest_stage_peak']}")
+    lines.append('')
+    lines.append(f"{'stage':<14}{'peak':>12}{'net':>12}")
+    for name, stage in profile['stages'].items():
+        lines.append(f"{name:<14}{_format_bytes(stage['peak_bytes']):>12}{_format_bytes(stage['net_bytes']):>12}")
+    
+    for name, stage in profile['stages'].items():
+        if not stage['top_allocations']:
+            continue
+        lines.append('')
+        lines.append(f"Top allocation sites in {name}:")
+        for site in stage['top_allocations']:
+            lines.append(
+                f"  {_format_bytes(site['size_diff_bytes']):>10}  "
+                f"{site['count_diff']:>7} blocks  {site['file']}:{site['line']}"
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def write_memory_report(profile: Dict[str, Any], path: str, title: str = ''):
+    """Write a memory profile to path (JSON if it ends in .json, text otherwise)"""
+    path = Path(path)
+    if path.suffix == '.json':
+        path.write_text(json.dumps({'title': title, **profile}, indent=2), encoding='utf-8')
+    else:
+        path.write_text(format_memory_report(profile, title), encoding='utf-8')
@@ -0,0 +1,157 @@
+"""
+Mission Diff - Minimal insert/update/delete operations for reprocessed plans
+
+Replacing a reprocessed plan's missions wholesale deletes and re-inserts
+every row, and resets the status of missions the patient already completed
+even when the new extraction produced the very same schedule. diff_missions()
+compares the regenerated missions with the stored ones instead:
+
+1. Missions are fingerprinted by title, type, date, time, duration and
+   points. A stored and a new mission with the same fingerprint are the same
+   mission: it keeps its ID and status, and is only rewritten (update) if
+   another field changed, e.g. the description or due time
+2. Remaining missions are paired by title, type and date: the mission moved
+   within the day or changed duration or points. It is updated in place and
+   keeps its ID and status
+3. Whatever is left is deleted (stored) or inserted (new)
+
+Missions with identical fingerprints (several sessions on one day) are
+paired exact-content first, so a reordered list yields no updates. Write
+volume therefore follows what changed, not the plan length.
+
+MissionStore.sync_plan() applies a diff in one transaction.
+
+Usage:
+    diff = diff_missions(store.missions_for_plan(plan_id), results['missions'])
+    diff.summary()   # {'inserts': 3, 'updates': 1, 'deletes': 3, 'unchanged': 172}
+
+    store.sync_plan(plan_id, results['missions'])
+"""
+
+from collections import defaultdict
+from typing import Dict, Any, List, Iterable, Tuple
+
+# Fields that identify a mission occurrence
+FINGERPRINT_FIELDS = ('title', 'mission_type', 'scheduled_date', 'scheduled_time', 'duration_minutes', 'points')
+
+# Fields that pair a changed mission with its stored version
+SLOT_FIELDS = ('title', 'mission_type', 'scheduled_date')
+
+# Fields kept from the stored mission
+PRESERVED_FIELDS = ('id', 'status')
+
+
+def fingerprint(mission: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Hashable fingerprint of a mission (FINGERPRINT_FIELDS values)"""
+    return tuple(mission.get(field) for field in FINGERPRINT_FIELDS)
+
+
+def _slot(mission: Dict[str, Any]) -> Tuple[Any, ...]:
+    return tuple(mission.get(field) for field in SLOT_FIELDS)
+
+
+def _content(mission: Dict[str, Any], fields: Iterable[str]) -> Tuple[Any, ...]:
+    return tuple(repr(mission.get(field)) for field in fields)
+
+
+class MissionDiff:
+    """
+    Operations turning a stored mission set into a regenerated one
+    
+    Attributes:
+        inserts: New missions (no ID yet)
+        updates: Regenerated missions carrying the ID and status of the
+            stored mission they replace
+        deletes: IDs of stored missions to remove
+        unchanged: Number of stored missions left as they are
+    """
+    
+    def __init__(self):
+        self.inserts: List[Dict[str, Any]] = []
+        self.updates: List[Dict[str, Any]] = []
+        self.deletes: List[Any] = []
+        self.unchanged = 0
+    
+    def __bool__(self) -> bool:
+        return bool(self.inserts or self.updates or self.deletes)
+    
+    def summary(self) -> Dict[str, int]:
+        return {
+            'inserts': len(self.inserts),
+            'updates': len(self.updates),
+            'deletes': len(self.deletes),
+            'unchanged': self.unchanged
+        }
+
+
+def diff_missions(stored: Iterable[Dict[str, Any]], regenerated: Iterable[Dict[str, Any]]) -> MissionDiff:
+    """
+    Compare stored missions (with IDs) with regenerated ones
+    
+    Args:
+        stored: The plan's stored missions, each with an 'id'
+        regenerated: MissionGenerator output for the plan
+        
+    Returns:
+        MissionDiff; regenerated missions are not modified (updates are copies)
+    """
+    diff = MissionDiff()
+    stored = list(stored)
+    regenerated = list(regenerated)
+    # Fields compared for "changed": those the generator sets and the store keeps,
+    # except the preserved ones
+    stored_fields = set(stored[0]) if stored else set()
+    compared = [
+        field for field in dict.fromkeys(key for mission in regenerated for key in mission)
+        if field in stored_fields and field not in PRESERVED_FIELDS
+    ]
+    
+    by_fingerprint: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for mission in stored:
+        by_fingerprint[fingerprint(mission)].append(mission)
+    
+    # 1. Same fingerprint: exact content first, then in order
+    unmatched: List[Dict[str, Any]] = []
+    pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    new_by_fingerprint: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for mission in regenerated:
+        new_by_fingerprint[fingerprint(mission)].append(mission)
+    for key, new_group in new_by_fingerprint.items():
+        old_group = by_fingerprint.pop(key, [])
+        if not old_group:
+            unmatched.extend(new_group)
+            continue
+        old_by_content: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = defaultdict(list)
+        for old in old_group:
+            old_by_content[_content(old, compared)].append(old)
+        rest = []
+        for new in new_group:
+            same = old_by_content.get(_content(new, compared))
+            if same:
+                same.pop(0)
+                diff.unchanged += 1
+            else:
+                rest.append(new)
+        leftover = [old for olds in old_by_content.values() for old in olds]
+        pairs.extend(zip(leftover, rest))
+        unmatched.extend(rest[len(leftover):])
+        by_fingerprint[key] = leftover[len(rest):]
+    
+    # 2. Same title, type and date
+    by_slot: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for olds in by_fingerprint.values():
+        for old in olds:
+            by_slot[_slot(old)].append(old)
+    for new in unmatched:
+        olds = by_slot.get(_slot(new))
+        if olds:
+            pairs.append((olds.pop(0), new))
+        else:
+            diff.inserts.append(new)
+    
+    for old, new in pairs:
+        diff.updates.append(dict(new, **{field: old.get(field) for field in PRESERVED_FIELDS}))
+    
+    # 3. Stored missions nobody claimed
+    diff.deletes = [old['id'] for olds in by_slot.values() for old in olds]
+    return diff
@@ -3,12 +3,12 @@ Mission Generator - Converts extracted treatment plan data into daily missions
 with calendar integration
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Tuple
 from datetime import datetime, timedelta, date, time
-from dateutil.parser import parse as parse_date
-from dateutil.relativedelta import relativedelta
 import re
 
+from recurrence import RecurrenceRule, recurring_mission, iter_expanded, iter_occurrences
+
 
 class MissionGenerator:
     """
@@ -18,8 +18,18 @@ class MissionGenerator:
     - Daily missions with due dates
     - Calendar events
     - Recurring missions
+    
+    An instance is bound to one start_date; create one per plan rather
+    than sharing it between concurrent requests.
     """
     
+    # Logic version of mission and calendar generation; bump it whenever a
+    # rule change alters the output (see stage_store.py)
+    VERSION = '1'
+    
+    # Mission types that get a calendar event
+    CALENDAR_EVENT_TYPES = ('therapy', 'checkup', 'appointment')
+    
     def __init__(self, start_date: Optional[date] = None):
         """
         Initialize mission generator
@@ -48,17 +58,111 @@ class MissionGenerator:
         Returns:
             List of mission dictionaries ready for database insertion
         """
-        missions = []
+        return list(self.iter_missions(extracted_data, treatment_plan_id, patient_id, default_points))
+    
+    def iter_missions(
+        self,
+        extracted_data: Dict[str, Any],
+        treatment_plan_id: str,
+        patient_id: str,
+        default_points: int = 50
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Same missions as generate_missions(), yielded as they are expanded
+        
+        Lets a MissionStore insert the first chunks while later missions are
+        still being materialized.
+        """
+        return iter_expanded(
+            self.generate_recurring_missions(extracted_data, treatment_plan_id, patient_id, default_points)
+        )
+    
+    def generate_missions_and_events(
+        self,
+        extracted_data: Dict[str, Any],
+        treatment_plan_id: str,
+        patient_id: str,
+        default_points: int = 50
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        generate_missions() and generate_calendar_events() in one pass
+        
+        Events are built from each occurrence's date and the series' parsed
+        scheduled_time instead of re-parsing every mission's ISO strings.
+        
+        Returns:
+            (missions, calendar_events)
+        """
+        records = self.generate_recurring_missions(extracted_data, treatment_plan_id, patient_id, default_points)
+        return self.expand_with_events(records)
+    
+    def expand_with_events(
+        self,
+        records: List[Dict[str, Any]],
+        expand: bool = True
+    ) -> Tuple[Optional[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Missions and calendar events of recurring records in one pass
+        
+        Args:
+            records: generate_recurring_missions() output
+            expand: Return the expanded missions too; if False only the
+                series that get calendar events are expanded and missions
+                is None
+                
+        Returns:
+            (missions, calendar_events)
+        """
+        missions = [] if expand else None
+        calendar_events = []
+        if not expand:
+            records = [
+                record for record in records
+                if record['template'].get('mission_type') in self.CALENDAR_EVENT_TYPES
+            ]
+        current, scheduled_time = None, None
+        for record, day, mission in iter_occurrences(records):
+            if expand:
+                missions.append(mission)
+            if mission['mission_type'] not in self.CALENDAR_EVENT_TYPES:
+                continue
+            if record is not current:
+                current, scheduled_time = record, time.fromisoformat(mission['scheduled_time'])
+            calendar_events.append(self.calendar_event_for(mission, day, scheduled_time))
+        return missions, calendar_events
+    
+    def generate_recurring_missions(
+        self,
+        extracted_data: Dict[str, Any],
+        treatment_plan_id: str,
+        patient_id: str,
+        default_points: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Missions as compact recurring records (see recurrence.py)
+        
+        One record per exercise, DO item and appointment series instead of
+        one mission per day; recurrence.expand_missions() turns them into
+        the generate_missions() list, or just the missions of a date window.
+        
+        Args:
+            (as for generate_missions)
+            
+        Returns:
+            List of recurring mission records
+        """
+        records = []
         
         # Generate missions from exercises
         for exercise in extracted_data.get('exercises', []):
-            exercise_missions = self._create_exercise_missions(
+            record = self._create_exercise_record(
                 exercise,
                 treatment_plan_id,
                 patient_id,
                 default_points
             )
-            missions.extend(exercise_missions)
+            if record:
+                records.append(record)
         
         # Generate check missions from DOs
         for do_item in extracted_data.get('dos_and_donts', {}).get('dos', []):
@@ -69,28 +173,26 @@ class MissionGenerator:
                 default_points
             )
             if check_mission:
-                missions.append(check_mission)
+                records.append(recurring_mission(check_mission, RecurrenceRule(self.start_date, count=1)))
         
         # Generate appointment missions
         for appointment in extracted_data.get('appointments', []):
-            appointment_missions = self._create_appointment_missions(
+            records.extend(self._create_appointment_records(
                 appointment,
                 treatment_plan_id,
                 patient_id
-            )
-            missions.extend(appointment_missions)
+            ))
         
-        return missions
+        return records
     
-    def _create_exercise_missions(
+    def _create_exercise_record(
         self,
         exercise: Dict[str, Any],
         treatment_plan_id: str,
         patient_id: str,
         default_points: int
-    ) -> List[Dict[str, Any]]:
-        """Create missions for an exercise"""
-        missions = []
+    ) -> Optional[Dict[str, Any]]:
+        """Recurring mission for an exercise (None if it has no occurrences)"""
         frequency = exercise.get('frequency', {})
         
         # Determine schedule
@@ -102,30 +204,30 @@ class MissionGenerator:
         if frequency.get('duration_seconds'):
             duration_minutes = frequency['duration_seconds'] // 60
         
-        # Create missions based on schedule
+        mission_type = exercise.get('type', 'exercise')
+        mission = {
+            'title': exercise['name'],
+            'description': exercise.get('instructions', ''),
+            'mission_type': mission_type,
+            'scheduled_date': self.start_date.isoformat(),
+            'scheduled_time': self._get_default_time(mission_type),
+            'due_datetime': self._calculate_due_datetime(self.start_date, mission_type),
+            'duration_minutes': duration_minutes,
+            'points': default_points,
+            'status': 'pending',
+            'treatment_plan_id': treatment_plan_id,
+            'patient_id': patient_id
+        }
+        
+        # Recur based on schedule
         if schedule == 'daily':
-            # Create daily missions for the duration
-            current_date = self.start_date
-            for day in range(duration_days):
-                mission = {
-                    'title': exercise['name'],
-                    'description': exercise.get('instructions', ''),
-                    'mission_type': exercise.get('type', 'exercise'),
-                    'scheduled_date': current_date.isoformat(),
-                    'scheduled_time': self._get_default_time(exercise.get('type', 'exercise')),
-                    'due_datetime': self._calculate_due_datetime(current_date, exercise.get('type', 'exercise')),
-                    'duration_minutes': duration_minutes,
-                    'points': default_points,
-                    'status': 'pending',
-                    'treatment_plan_id': treatment_plan_id,
-                    'patient_id': patient_id,
-                    'recurrence_pattern': {
-                        'frequency': 'daily',
-                        'end_date': (self.start_date + timedelta(days=duration_days - 1)).isoformat()
-                    }
-                }
-                missions.append(mission)
-                current_date += timedelta(days=1)
+            # One mission per day for the duration
+            days_between = 1
+            count = duration_days
+            mission['recurrence_pattern'] = {
+                'frequency': 'daily',
+                'end_date': (self.start_date + timedelta(days=duration_days - 1)).isoformat()
+            }
         
         elif 'weekly' in schedule or 'per week' in schedule:
             # Extract frequency (e.g., "2x per week" -> 2)
@@ -134,33 +236,24 @@ class MissionGenerator:
             # Calculate days per week (e.g., 2x per week = every 3-4 days)
             days_between = 7 // weekly_frequency if weekly_frequency > 0 else 7
             
-            current_date = self.start_date
-            mission_count = 0
             max_missions = duration_days // (7 // weekly_frequency) if weekly_frequency > 0 else 0
-            
-            for _ in range(min(max_missions, duration_days)):
-                mission = {
-                    'title': exercise['name'],
-                    'description': exercise.get('instructions', ''),
-                    'mission_type': exercise.get('type', 'exercise'),
-                    'scheduled_date': current_date.isoformat(),
-                    'scheduled_time': self._get_default_time(exercise.get('type', 'exercise')),
-                    'due_datetime': self._calculate_due_datetime(current_date, exercise.get('type', 'exercise')),
-                    'duration_minutes': duration_minutes,
-                    'points': default_points,
-                    'status': 'pending',
-                    'treatment_plan_id': treatment_plan_id,
-                    'patient_id': patient_id,
-                    'recurrence_pattern': {
-                        'frequency': 'weekly',
-                        'count': max_missions,
-                        'interval': days_between
-                    }
-                }
-                missions.append(mission)
-                current_date += timedelta(days=days_between)
+            count = min(max_missions, duration_days)
+            mission['recurrence_pattern'] = {
+                'frequency': 'weekly',
+                'count': max_missions,
+                'interval': days_between
+            }
         
-        return missions
+        else:
+            return None
+        
+        if count <= 0:
+            return None
+        return recurring_mission(
+            mission,
+            RecurrenceRule(self.start_date, days_between, count=count),
+            due_time=datetime.fromisoformat(mission['due_datetime']).time().isoformat()
+        )
     
     def _create_check_mission(
         self,
@@ -190,15 +283,13 @@ class MissionGenerator:
             'patient_id': patient_id
         }
     
-    def _create_appointment_missions(
+    def _create_appointment_records(
         self,
         appointment: Dict[str, Any],
         treatment_plan_id: str,
         patient_id: str
     ) -> List[Dict[str, Any]]:
-        """Create missions for appointments"""
-        missions = []
-        
+        """Recurring missions for an appointment series"""
         frequency = appointment.get('frequency_per_period', 1)
         period = appointment.get('period', 'week')
         timeframe = appointment.get('timeframe_duration', 6)
@@ -213,29 +304,42 @@ class MissionGenerator:
             total_appointments = frequency * timeframe
             days_between = 7 // frequency if frequency > 0 else 7
         
-        current_date = self.start_date
-        
-        for i in range(total_appointments):
-            mission = {
-                'title': appointment.get('type', 'Therapy Session'),
-                'description': f"{appointment.get('type', 'Therapy')} session {i+1}",
-                'mission_type': 'therapy',
-                'scheduled_date': current_date.isoformat(),
-                'scheduled_time': '14:00:00',  # Default afternoon time
-                'due_datetime': datetime.combine(
-                    current_date,
-                    time(16, 0)
-                ).isoformat(),
-                'duration_minutes': 60,  # Default therapy session duration
-                'points': 100,  # Therapy sessions worth more points
-                'status': 'pending',
-                'treatment_plan_id': treatment_plan_id,
-                'patient_id': patient_id
-            }
-            missions.append(mission)
-            current_date += timedelta(days=days_between)
+        if total_appointments <= 0:
+            return []
         
-        return missions
+        session = f"{appointment.get('type', 'Therapy')} session {{n}}"
+        mission = {
+            'title': appointment.get('type', 'Therapy Session'),
+            'description': session.replace('{n}', '1'),
+            'mission_type': 'therapy',
+            'scheduled_date': self.start_date.isoformat(),
+            'scheduled_time': '14:00:00',  # Default afternoon time
+            'due_datetime': datetime.combine(
+                self.start_date,
+                time(16, 0)
+            ).isoformat(),
+            'duration_minutes': 60,  # Default therapy session duration
+            'points': 100,  # Therapy sessions worth more points
+            'status': 'pending',
+            'treatment_plan_id': treatment_plan_id,
+            'patient_id': patient_id
+        }
+        
+        if days_between == 0:
+            # More than 7 per week: every session falls on the start date
+            return [
+                recurring_mission(
+                    dict(mission, description=session.replace('{n}', str(i + 1))),
+                    RecurrenceRule(self.start_date, count=1)
+                )
+                for i in range(total_appointments)
+            ]
+        return [recurring_mission(
+            mission,
+            RecurrenceRule(self.start_date, days_between, count=total_appointments),
+            due_time='16:00:00',
+            numbered={'description': session}
+        )]
     
     def _calculate_duration(self, exercise: Dict[str, Any], schedule: str) -> int:
         """Calculate treatment duration in days"""
@@ -295,29 +399,46 @@ class MissionGenerator:
         calendar_events = []
         
         for mission in missions:
-            # Only create calendar events for certain mission types
-            if mission['mission_type'] in ['therapy', 'checkup', 'appointment']:
-                scheduled_date = date.fromisoformat(mission['scheduled_date'])
-                scheduled_time = time.fromisoformat(mission['scheduled_time'])
-                
-                start_datetime = datetime.combine(scheduled_date, scheduled_time)
-                end_datetime = start_datetime + timedelta(minutes=mission.get('duration_minutes', 60))
-                
-                event = {
-                    'title': mission['title'],
-                    'description': mission.get('description', ''),
-                    'event_type': mission['mission_type'],
-                    'start_datetime': start_datetime.isoformat(),
-                    'end_datetime': end_datetime.isoformat(),
-                    'mission_id': mission.get('id'),  # Will be set after mission creation
-                    'patient_id': mission['patient_id'],
-                    'is_all_day': False,
-                    'reminder_minutes': [1440, 60]  # 1 day and 1 hour before
-                }
-                
+            event = self.calendar_event_for(mission)
+            if event:
                 calendar_events.append(event)
         
         return calendar_events
+    
+    @classmethod
+    def calendar_event_for(
+        cls,
+        mission: Dict[str, Any],
+        scheduled_date: Optional[date] = None,
+        scheduled_time: Optional[time] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Calendar event for a mission, or None if its type gets no event
+        
+        scheduled_date and scheduled_time, when given, are the mission's
+        already parsed values.
+        """
+        # Only create calendar events for certain mission types
+        if mission['mission_type'] not in cls.CALENDAR_EVENT_TYPES:
+            return None
+        
+        scheduled_date = scheduled_date or date.fromisoformat(mission['scheduled_date'])
+        scheduled_time = scheduled_time or time.fromisoformat(mission['scheduled_time'])
+        
+        start_datetime = datetime.combine(scheduled_date, scheduled_time)
+        end_datetime = start_datetime + timedelta(minutes=mission.get('duration_minutes', 60))
+        
+        return {
+            'title': mission['title'],
+            'description': mission.get('description', ''),
+            'event_type': mission['mission_type'],
+            'start_datetime': start_datetime.isoformat(),
+            'end_datetime': end_datetime.isoformat(),
+            'mission_id': mission.get('id'),  # Will be set after mission creation
+            'patient_id': mission['patient_id'],
+            'is_all_day': False,
+            'reminder_minutes': [1440, 60]  # 1 day and 1 hour before
+        }
 
 
 if __name__ == '__main__':
@@ -0,0 +1,262 @@
+"""
+Mission Model - Compact, slotted missions with shared templates
+
+A mission dict repeats everything about its exercise (title, the full
+instructions text, type, points, patient and plan IDs, recurrence pattern)
+in every one of its occurrences. For workloads that hold many patients'
+missions at once (bulk regeneration, lobby matching) a MissionSet stores:
+
+- one MissionTemplate per series: the shared field values as a tuple, with
+  the key layout (key order and positions) shared by all templates of the
+  same shape
+- one Mission per occurrence: a __slots__ object with only the
+  per-occurrence fields (id, scheduled date, due time, status, occurrence
+  number); dates and times are interned process-wide, so all occurrences
+  on the same day share one date object
+
+MissionSet.from_recurring() builds the set straight from recurring mission
+records (recurrence.py), one template per series - including numbered
+series such as "Physiotherapy session {n}". from_dicts() accepts existing
+mission dicts and groups those whose shared fields are identical.
+
+Mission is a read-only Mapping, so code that reads mission dicts (such as
+UserMatcher) works on it unchanged; status can be updated in place.
+to_dict() and MissionSet.to_dicts() convert back losslessly, with keys in
+the original order.
+
+Usage:
+    missions = MissionSet.from_recurring(generator.generate_recurring_missions(...))
+    missions.extend(other_plan_mission_dicts)
+    missions[0]['title'], missions[0].status = 'completed'
+    assert missions.to_dicts() == generator.generate_missions(...)
+"""
+
+import copy
+from collections.abc import Mapping, Sequence
+from datetime import date, datetime, time
+from functools import lru_cache
+from sys import intern
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Tuple
+
+from recurrence import RecurrenceRule
+
+# Fields stored per occurrence; everything else lives in the template
+OCCURRENCE_FIELDS = ('id', 'scheduled_date', 'due_datetime', 'status')
+
+# Key order -> key positions, shared by every template with that layout
+_LAYOUTS: Dict[Tuple[str, ...], Dict[str, int]] = {}
+
+
+def _layout(keys: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Dict[str, int]]:
+    index = _LAYOUTS.get(keys)
+    if index is None:
+        keys = tuple(intern(key) for key in keys)
+        index = _LAYOUTS.setdefault(keys, {key: position for position, key in enumerate(keys)})
+    return tuple(index), index
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable form of a JSON-like value (1, 1.0 and True stay distinct)"""
+    if isinstance(value, str) or value is None:
+        return value
+    if isinstance(value, dict):
+        return ('dict', tuple((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_freeze(item) for item in value))
+    return (type(value).__name__, value)
+
+
+def _copy_nested(value: Any) -> Any:
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+@lru_cache(maxsize=8192)
+def _parse_date(value: str) -> Any:
+    """Shared date for an ISO date string (the string itself if it is not one)"""
+    try:
+        parsed = date.fromisoformat(value)
+    except ValueError:
+        return value
+    # Only round-trippable forms (not e.g. the basic format 20260301)
+    return parsed if parsed.isoformat() == value else value
+
+
+@lru_cache(maxsize=1024)
+def _parse_time(value: str) -> Any:
+    """Shared time for an ISO time string (the string itself if it is not one)"""
+    try:
+        parsed = time.fromisoformat(value)
+    except ValueError:
+        return value
+    return parsed if parsed.isoformat() == value else value
+
+
+def _due(value: Any, scheduled_date: Any) -> Any:
+    """Shared time if value is scheduled_date at some time of day (value otherwise)"""
+    if not isinstance(value, str) or not isinstance(scheduled_date, date):
+        return value
+    day, _, clock = value.partition('T')
+    if day != scheduled_date.isoformat():
+        return value
+    parsed = _parse_time(clock)
+    return parsed if isinstance(parsed, time) else value
+
+
+def _interned(value: Any) -> Any:
+    return intern(value) if isinstance(value, str) else value
+
+
+class MissionTemplate:
+    """
+    Fields shared by a series of occurrences
+    
+    values is aligned with keys (occurrence fields hold None); numbered
+    maps fields that vary with the occurrence number to {n} patterns.
+    """
+    
+    __slots__ = ('keys', 'index', 'values', 'numbered')
+    
+    def __init__(self, mission: Dict[str, Any], numbered: Optional[Dict[str, str]] = None):
+        self.keys, self.index = _layout(tuple(mission))
+        self.values = tuple(
+            None if key in OCCURRENCE_FIELDS else _copy_nested(value) for key, value in mission.items()
+        )
+        self.numbered = dict(numbered) if numbered else None
+
+
+class Mission(Mapping):
+    """
+    One occurrence: a template reference plus per-occurrence fields
+    
+    scheduled_date is a date (or the original value if it was not an ISO
+    date string); due is a time on scheduled_date, or the original
+    due_datetime value if it was not of that form. Nested values of shared
+    fields belong to the template: use to_dict() for a private copy.
+    """
+    
+    __slots__ = ('template', 'id', 'scheduled_date', 'due', 'status', 'number')
+    
+    def __init__(self, template: MissionTemplate, id, scheduled_date, due, status, number: Optional[int] = None):
+        self.template = template
+        self.id = id
+        self.scheduled_date = scheduled_date
+        self.due = due
+        self.status = status
+        self.number = number
+    
+    def __getitem__(self, key: str) -> Any:
+        template = self.template
+        position = template.index[key]
+        if key == 'scheduled_date':
+            value = self.scheduled_date
+            return value.isoformat() if isinstance(value, date) else value
+        if key == 'due_datetime':
+            if isinstance(self.due, time):
+                return datetime.combine(self.scheduled_date, self.due).isoformat()
+            return self.due
+        if key == 'status':
+            return self.status
+        if key == 'id':
+            return self.id
+        if template.numbered and key in template.numbered:
+            return template.numbered[key].replace('{n}', str(self.number))
+        return template.values[position]
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.template.keys)
+    
+    def __len__(self) -> int:
+        return len(self.template.keys)
+    
+    def __contains__(self, key) -> bool:
+        return key in self.template.index
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """The mission as a plain dict (nested values copied, not shared)"""
+        return {key: _copy_nested(self[key]) for key in self.template.keys}
+    
+    def __repr__(self) -> str:
+        return f"Mission({self.get('title')!r}, {self.get('scheduled_date')!r})"
+
+
+class MissionSet(Sequence):
+    """Compact collection of missions, possibly of many patients and plans"""
+    
+    def __init__(self, missions: Iterable[Dict[str, Any]] = ()):
+        self._missions: List[Mission] = []
+        # Templates of missions added as dicts, by key order and shared values
+        self._templates: Dict[Any, MissionTemplate] = {}
+        self._series = 0
+        self.extend(missions)
+    
+    @classmethod
+    def from_dicts(cls, missions: Iterable[Dict[str, Any]]) -> 'MissionSet':
+        return cls(missions)
+    
+    @classmethod
+    def from_recurring(cls, records: Iterable[Dict[str, Any]]) -> 'MissionSet':
+        missions = cls()
+        missions.extend_recurring(records)
+        return missions
+    
+    def add(self, mission: Dict[str, Any]) -> Mission:
+        """Add a mission dict; returns its compact form"""
+        identity = (
+            tuple(mission),
+            tuple(None if key in OCCURRENCE_FIELDS else _freeze(value) for key, value in mission.items())
+        )
+        template = self._templates.get(identity)
+        if template is None:
+            template = self._templates[identity] = MissionTemplate(mission)
+        
+        scheduled_date = mission.get('scheduled_date')
+        if isinstance(scheduled_date, str):
+            scheduled_date = _parse_date(scheduled_date)
+        compact = Mission(
+            template,
+            mission.get('id'),
+            scheduled_date,
+            _due(mission.get('due_datetime'), scheduled_date),
+            _interned(mission.get('status'))
+        )
+        self._missions.append(compact)
+        return compact
+    
+    def extend(self, missions: Iterable[Dict[str, Any]]):
+        for mission in missions:
+            self.add(mission)
+    
+    def extend_recurring(self, records: Iterable[Dict[str, Any]]):
+        """
+        Add the occurrences of recurring mission records, one template per record
+        
+        Same missions as extend(recurrence.expand_missions(records)), without
+        building the intermediate dicts.
+        """
+        for record in records:
+            mission = record['template']
+            template = MissionTemplate(mission, record.get('numbered'))
+            rule = RecurrenceRule.parse(record['rrule'], record['dtstart'], record.get('exdates', ()))
+            due_time = _parse_time(record['due_time']) if record.get('due_time') else None
+            status = _interned(mission.get('status'))
+            for index, day in rule.occurrences():
+                scheduled_date = _parse_date(day.isoformat())
+                due = due_time if due_time is not None else _due(mission.get('due_datetime'), scheduled_date)
+                self._missions.append(Mission(template, mission.get('id'), scheduled_date, due, status, index + 1))
+            self._series += 1
+    
+    def __getitem__(self, index):
+        return self._missions[index]
+    
+    def __len__(self) -> int:
+        return len(self._missions)
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """All missions as plain dicts, in insertion order"""
+        return [mission.to_dict() for mission in self._missions]
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'missions': len(self._missions),
+            'templates': len(self._templates) + self._series
+        }
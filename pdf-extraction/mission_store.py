@@ -0,0 +1,460 @@
+"""
+Mission Store - Batched, transactional storage for generated missions
+
+Inserting missions and calendar events one statement (and one round trip)
+at a time makes an 8-week daily plan cost hundreds of round trips per upload.
+A MissionStore writes a plan's missions in chunks with one prepared INSERT
+per table and executemany(), inside a single transaction: the plan's
+missions become visible all at once, and replacing a reprocessed plan never
+shows a half-written mix of old and new missions.
+
+Mission IDs are assigned client-side (UUIDs), so calendar events can
+reference their mission in the same chunk without reading IDs back.
+
+write_plan() accepts any iterable, so MissionGenerator.iter_missions() can
+be passed directly and chunks are written while later missions are still
+being generated. SQLiteMissionStore is the reference implementation; other
+databases subclass MissionStore and provide the transaction and statement
+hooks.
+
+Usage:
+    store = SQLiteMissionStore('missions.db')
+    counts = store.write_plan(plan_id, results['missions'])
+    # or stream: store.write_plan(plan_id, generator.iter_missions(data, plan_id, patient_id))
+
+    python mission_store.py plan.pdf missions.db --patient-id p1 --plan-id plan1
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date
+from itertools import islice
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from mission_diff import diff_missions
+from mission_generator import MissionGenerator
+
+logger = logging.getLogger(__name__)
+
+MISSION_COLUMNS = (
+    'id', 'treatment_plan_id', 'patient_id', 'title', 'description', 'mission_type',
+    'scheduled_date', 'scheduled_time', 'due_datetime', 'duration_minutes', 'points',
+    'status', 'recurrence_pattern'
+)
+CALENDAR_EVENT_COLUMNS = (
+    'id', 'mission_id', 'treatment_plan_id', 'patient_id', 'title', 'description',
+    'event_type', 'start_datetime', 'end_datetime', 'is_all_day', 'reminder_minutes'
+)
+# Columns holding nested values, stored as JSON text
+_JSON_COLUMNS = {'recurrence_pattern', 'reminder_minutes'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS missions (
+    id TEXT PRIMARY KEY,
+    treatment_plan_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    mission_type TEXT NOT NULL,
+    scheduled_date TEXT NOT NULL,
+    scheduled_time TEXT,
+    due_datetime TEXT,
+    duration_minutes INTEGER,
+    points INTEGER,
+    status TEXT NOT NULL,
+    recurrence_pattern TEXT
+);
+CREATE INDEX IF NOT EXISTS missions_plan ON missions (treatment_plan_id);
+CREATE INDEX IF NOT EXISTS missions_patient_date ON missions (patient_id, scheduled_date);
+CREATE TABLE IF NOT EXISTS calendar_events (
+    id TEXT PRIMARY KEY,
+    mission_id TEXT REFERENCES missions (id) ON DELETE CASCADE,
+    treatment_plan_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    event_type TEXT NOT NULL,
+    start_datetime TEXT NOT NULL,
+    end_datetime TEXT NOT NULL,
+    is_all_day INTEGER NOT NULL DEFAULT 0,
+    reminder_minutes TEXT
+);
+CREATE INDEX IF NOT EXISTS calendar_events_plan ON calendar_events (treatment_plan_id);
+CREATE INDEX IF NOT EXISTS calendar_events_mission ON calendar_events (mission_id);
+CREATE INDEX IF NOT EXISTS calendar_events_patient_start ON calendar_events (patient_id, start_datetime);
+"""
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Consecutive lists of up to size items, pulled lazily from items"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _row(record: Dict[str, Any], columns: Tuple[str, ...]) -> Tuple[Any, ...]:
+    return tuple(
+        json.dumps(record.get(column)) if column in _JSON_COLUMNS and record.get(column) is not None
+        else record.get(column)
+        for column in columns
+    )
+
+
+def plan_rows(
+    treatment_plan_id: str,
+    missions: Iterable[Dict[str, Any]],
+    calendar_events: bool = True
+) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]:
+    """
+    Insert rows for missions and their calendar events
+    
+    Missions without an 'id' get a UUID (set on the dict); events get their
+    own and reference their mission's.
+    
+    Returns:
+        (mission_rows, event_rows) in MISSION_COLUMNS / CALENDAR_EVENT_COLUMNS order
+    """
+    mission_rows = []
+    event_rows = []
+    for mission in missions:
+        mission.setdefault('id', str(uuid.uuid4()))
+        mission_rows.append(_row(dict(mission, treatment_plan_id=treatment_plan_id), MISSION_COLUMNS))
+        event = MissionGenerator.calendar_event_for(mission) if calendar_events else None
+        if event:
+            event.update(id=str(uuid.uuid4()), treatment_plan_id=treatment_plan_id)
+            event_rows.append(_row(event, CALENDAR_EVENT_COLUMNS))
+    return mission_rows, event_rows
+
+
+class MissionStore:
+    """
+    Storage adapter for MissionGenerator output
+    
+    write_plan() does the chunking, ID assignment and calendar event
+    derivation; subclasses supply a transaction and the statements:
+    delete_plan(), insert_missions() and insert_calendar_events(), each
+    called with the transaction's connection and a whole chunk of rows.
+    sync_plan() additionally needs stored_missions(), update_missions(),
+    delete_missions() and delete_calendar_events().
+    """
+    
+    def __init__(self, chunk_size: int = 500):
+        """
+        Args:
+            chunk_size: Missions per executemany() call
+        """
+        self.chunk_size = chunk_size
+    
+    @contextmanager
+    def transaction(self) -> Iterator[Any]:
+        raise NotImplementedError
+    
+    def delete_plan(self, db, treatment_plan_id: str):
+        raise NotImplementedError
+    
+    def insert_missions(self, db, rows: List[Tuple[Any, ...]]):
+        """Insert rows (MISSION_COLUMNS order)"""
+        raise NotImplementedError
+    
+    def insert_calendar_events(self, db, rows: List[Tuple[Any, ...]]):
+        """Insert rows (CALENDAR_EVENT_COLUMNS order)"""
+        raise NotImplementedError
+    
+    def stored_missions(self, db, treatment_plan_id: str) -> List[Dict[str, Any]]:
+        """The plan's missions as dicts, read within the transaction"""
+        raise NotImplementedError
+    
+    def update_missions(self, db, rows: List[Tuple[Any, ...]]):
+        """Overwrite missions by id with rows (MISSION_COLUMNS order)"""
+        raise NotImplementedError
+    
+    def delete_missions(self, db, mission_ids: List[Any]):
+        """Delete missions and their calendar events"""
+        raise NotImplementedError
+    
+    def delete_calendar_events(self, db, mission_ids: List[Any]):
+        """Delete the calendar events of missions"""
+        raise NotImplementedError
+    
+    def write_plan(
+        self,
+        treatment_plan_id: str,
+        missions: Iterable[Dict[str, Any]],
+        calendar_events: bool = True,
+        replace: bool = True
+    ) -> Dict[str, int]:
+        """
+        Store a plan's missions (and their calendar events) in one transaction
+        
+        Args:
+            treatment_plan_id: Plan the missions belong to
+            missions: Mission dicts as produced by MissionGenerator; a
+                generator is consumed chunk by chunk. Missions without an
+                'id' get a UUID (set on the dict).
+            calendar_events: Also store MissionGenerator.calendar_event_for()
+                of each mission, linked by mission_id
+            replace: Delete the plan's previously stored missions and events
+                first (reprocessing)
+                
+        Returns:
+            {'missions': n, 'calendar_events': n, 'chunks': n}
+        """
+        counts = {'missions': 0, 'calendar_events': 0, 'chunks': 0}
+        with self.transaction() as db:
+            if replace:
+                self.delete_plan(db, treatment_plan_id)
+            for chunk in chunked(missions, self.chunk_size):
+                mission_rows, event_rows = plan_rows(treatment_plan_id, chunk, calendar_events)
+                self._insert(db, mission_rows, event_rows, counts)
+        return counts
+    
+    def write_rows(
+        self,
+        plans: Iterable[Tuple[str, List[Tuple[Any, ...]], List[Tuple[Any, ...]]]],
+        replace: bool = True
+    ) -> Dict[str, int]:
+        """
+        Store several plans' prepared rows (see plan_rows()) in one transaction
+        
+        For bulk writers: rows can be built in other processes, leaving only
+        the inserts to the writer.
+        
+        Args:
+            plans: (treatment_plan_id, mission_rows, event_rows) per plan
+            replace: As for write_plan()
+            
+        Returns:
+            Totals over all plans: {'missions': n, 'calendar_events': n, 'chunks': n}
+        """
+        counts = {'missions': 0, 'calendar_events': 0, 'chunks': 0}
+        with self.transaction() as db:
+            for treatment_plan_id, mission_rows, event_rows in plans:
+                if replace:
+                    self.delete_plan(db, treatment_plan_id)
+                # All missions first: events reference them
+                for i in range(0, len(mission_rows), self.chunk_size):
+                    self._insert(db, mission_rows[i:i + self.chunk_size], [], counts)
+                for i in range(0, len(event_rows), self.chunk_size):
+                    self._insert(db, [], event_rows[i:i + self.chunk_size], counts)
+        return counts
+    
+    def sync_plan(
+        self,
+        treatment_plan_id: str,
+        missions: Iterable[Dict[str, Any]],
+        calendar_events: bool = True
+    ) -> Dict[str, int]:
+        """
+        Bring a plan's stored missions in line with regenerated ones, in one
+        transaction, writing only what changed (see mission_diff.py)
+        
+        Unchanged missions are not touched and keep their status; changed
+        ones are updated in place and keep their ID and status. Updated
+        missions get their calendar events re-derived.
+        
+        Returns:
+            {'inserts': n, 'updates': n, 'deletes': n, 'unchanged': n}
+        """
+        return self.sync_plans([(treatment_plan_id, missions)], calendar_events)
+    
+    def sync_plans(
+        self,
+        plans: Iterable[Tuple[str, Iterable[Dict[str, Any]]]],
+        calendar_events: bool = True
+    ) -> Dict[str, int]:
+        """sync_plan() for several (treatment_plan_id, missions) pairs in one transaction; returns totals"""
+        totals = {'inserts': 0, 'updates': 0, 'deletes': 0, 'unchanged': 0}
+        counts = {'missions': 0, 'calendar_events': 0, 'chunks': 0}
+        with self.transaction() as db:
+            for treatment_plan_id, missions in plans:
+                diff = diff_missions(self.stored_missions(db, treatment_plan_id), missions)
+                for chunk in chunked(diff.deletes, self.chunk_size):
+                    self.delete_missions(db, chunk)
+                for chunk in chunked(diff.updates, self.chunk_size):
+                    mission_rows, event_rows = plan_rows(treatment_plan_id, chunk, calendar_events)
+                    self.delete_calendar_events(db, [mission['id'] for mission in chunk])
+                    self.update_missions(db, mission_rows)
+                    if event_rows:
+                        self.insert_calendar_events(db, event_rows)
+                for chunk in chunked(diff.inserts, self.chunk_size):
+                    self._insert(db, *plan_rows(treatment_plan_id, chunk, calendar_events), counts)
+                for operation, count in diff.summary().items():
+                    totals[operation] += count
+        return totals
+    
+    def _insert(self, db, mission_rows, event_rows, counts: Dict[str, int]):
+        if mission_rows:
+            self.insert_missions(db, mission_rows)
+        if event_rows:
+            self.insert_calendar_events(db, event_rows)
+        counts['missions'] += len(mission_rows)
+        counts['calendar_events'] += len(event_rows)
+        counts['chunks'] += 1
+
+
+class SQLiteMissionStore(MissionStore):
+    """
+    Reference MissionStore on a local SQLite file
+    
+    Each thread gets its own connection; write_plan() runs under BEGIN
+    IMMEDIATE, so concurrent writers serialize per plan write instead of
+    interleaving. sqlite3 caches the prepared INSERTs per connection, so every
+    chunk reuses them.
+    """
+    
+    _INSERT_MISSION = (
+        f"INSERT INTO missions ({', '.join(MISSION_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(MISSION_COLUMNS))})"
+    )
+    _UPDATE_MISSION = (
+        f"UPDATE missions SET {', '.join(f'{column} = ?' for column in MISSION_COLUMNS[1:])} WHERE id = ?"
+    )
+    _INSERT_CALENDAR_EVENT = (
+        f"INSERT INTO calendar_events ({', '.join(CALENDAR_EVENT_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(CALENDAR_EVENT_COLUMNS))})"
+    )
+    
+    def __init__(self, path: str, chunk_size: int = 500):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            chunk_size: Missions per executemany() call
+        """
+        super().__init__(chunk_size)
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+    
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            # WAL lets the app read missions while a plan is being written
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA foreign_keys=ON')
+            self._local.db = db
+        return db
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+    
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+    
+    def delete_plan(self, db, treatment_plan_id: str):
+        db.execute('DELETE FROM calendar_events WHERE treatment_plan_id = ?', (treatment_plan_id,))
+        db.execute('DELETE FROM missions WHERE treatment_plan_id = ?', (treatment_plan_id,))
+    
+    def insert_missions(self, db, rows: List[Tuple[Any, ...]]):
+        db.executemany(self._INSERT_MISSION, rows)
+    
+    def insert_calendar_events(self, db, rows: List[Tuple[Any, ...]]):
+        db.executemany(self._INSERT_CALENDAR_EVENT, rows)
+    
+    def stored_missions(self, db, treatment_plan_id: str) -> List[Dict[str, Any]]:
+        return self._select('SELECT * FROM missions WHERE treatment_plan_id = ?', (treatment_plan_id,), db)
+    
+    def update_missions(self, db, rows: List[Tuple[Any, ...]]):
+        # MISSION_COLUMNS starts with id, which goes last for the WHERE clause
+        db.executemany(self._UPDATE_MISSION, [row[1:] + row[:1] for row in rows])
+    
+    def delete_missions(self, db, mission_ids: List[Any]):
+        placeholders = ', '.join('?' * len(mission_ids))
+        db.execute(f'DELETE FROM calendar_events WHERE mission_id IN ({placeholders})', mission_ids)
+        db.execute(f'DELETE FROM missions WHERE id IN ({placeholders})', mission_ids)
+    
+    def delete_calendar_events(self, db, mission_ids: List[Any]):
+        placeholders = ', '.join('?' * len(mission_ids))
+        db.execute(f'DELETE FROM calendar_events WHERE mission_id IN ({placeholders})', mission_ids)
+    
+    def _select(self, sql: str, params: Tuple[Any, ...], db: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        records = []
+        for row in (db or self._connection()).execute(sql, params):
+            record = dict(row)
+            for column in _JSON_COLUMNS.intersection(record):
+                if record[column] is not None:
+                    record[column] = json.loads(record[column])
+            records.append(record)
+        return records
+    
+    def missions_for_plan(self, treatment_plan_id: str) -> List[Dict[str, Any]]:
+        return self._select(
+            'SELECT * FROM missions WHERE treatment_plan_id = ? ORDER BY scheduled_date, scheduled_time',
+            (treatment_plan_id,)
+        )
+    
+    def missions_for_patient(self, patient_id: str, on_date: Optional[date] = None) -> List[Dict[str, Any]]:
+        """A patient's missions, optionally only those scheduled on on_date"""
+        if on_date is None:
+            return self._select(
+                'SELECT * FROM missions WHERE patient_id = ? ORDER BY scheduled_date, scheduled_time',
+                (patient_id,)
+            )
+        return self._select(
+            'SELECT * FROM missions WHERE patient_id = ? AND scheduled_date = ? ORDER BY scheduled_time',
+            (patient_id, on_date.isoformat())
+        )
+    
+    def calendar_events_for_plan(self, treatment_plan_id: str) -> List[Dict[str, Any]]:
+        return self._select(
+            'SELECT * FROM calendar_events WHERE treatment_plan_id = ? ORDER BY start_datetime',
+            (treatment_plan_id,)
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('pdf', help='Treatment plan PDF')
+    parser.add_argument('database', help='SQLite file to write missions to')
+    parser.add_argument('--patient-id', required=True)
+    parser.add_argument('--plan-id', required=True)
+    parser.add_argument('--start-date', type=date.fromisoformat, help='YYYY-MM-DD (default: today)')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model')
+    args = parser.parse_args(argv)
+    
+    from main_extractor import PDFTreatmentPlanExtractor
+    
+    extractor = PDFTreatmentPlanExtractor(nlp_model=args.model)
+    results = extractor.process_pdf(args.pdf, args.patient_id, args.plan_id, start_date=args.start_date)
+    
+    store = SQLiteMissionStore(args.database, chunk_size=args.chunk_size)
+    started = time.perf_counter()
+    counts = store.write_plan(args.plan_id, results['missions'])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"Stored {counts['missions']} missions and {counts['calendar_events']} calendar events "
+        f"in {counts['chunks']} chunks ({elapsed_ms:.1f} ms)"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
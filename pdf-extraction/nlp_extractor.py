@@ -3,19 +3,23 @@ NLP Extractor - Uses spaCy and custom patterns to extract structured data
 from treatment plan text
 """
 
+import logging
 import re
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-import dateparser
+import threading
+from importlib.util import find_spec
+from typing import Dict, List, Optional, Any, TYPE_CHECKING
+from datetime import datetime
 
-try:
-    import spacy
-    from spacy.matcher import Matcher
-    from spacy.tokens import Doc, Span
-    SPACY_AVAILABLE = True
-except ImportError:
-    SPACY_AVAILABLE = False
-    print("Warning: spaCy not available. Install with: pip install spacy")
+# spaCy takes seconds to import, so only check that it is installed here and
+# import it when the model is first needed (see NLPExtractor.load).
+SPACY_AVAILABLE = find_spec('spacy') is not None
+
+logger = logging.getLogger(__name__)
+if not SPACY_AVAILABLE:
+    logger.warning("spaCy not available. Install with: pip install spacy")
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
 
 
 class NLPExtractor:
@@ -26,8 +30,29 @@ class NLPExtractor:
     - Named Entity Recognition (NER) for medical terms
     - Dependency parsing for relationship extraction
     - Custom pattern matching for domain-specific extraction
+    
+    The spaCy model is loaded lazily on first use; call load() to pay that
+    cost up front (e.g. when warming a worker).
+    
+    Thread safety: the load is guarded by a lock, and afterwards the
+    extractor only reads its own state. The spaCy pipeline is shared by
+    concurrent extract_all calls; spaCy does not document nlp() as
+    thread-safe, so this is only verified empirically, per model, by
+    stress_concurrency.py. If a model fails it, use ExtractorWorkerPool
+    (one pipeline per process) instead.
     """
     
+    # Logic version of each sub-extractor. Bump an entry whenever a change
+    # alters that part's output, so stored results are re-extracted on
+    # reprocessing (see stage_store.py).
+    STAGE_VERSIONS = {
+        'exercises': '1',
+        'goals': '1',
+        'dos_and_donts': '1',
+        'appointments': '1',
+        'conditions': '1'
+    }
+    
     def __init__(self, model_name: str = 'en_core_web_sm'):
         """
         Initialize NLP extractor
@@ -41,17 +66,10 @@ class NLPExtractor:
                 "python -m spacy download en_core_web_sm"
             )
         
-        try:
-            self.nlp = spacy.load(model_name)
-        except OSError:
-            raise OSError(
-                f"spaCy model '{model_name}' not found. "
-                f"Download with: python -m spacy download {model_name}"
-            )
-        
-        # Initialize matcher for custom patterns
-        self.matcher = Matcher(self.nlp.vocab)
-        self._setup_patterns()
+        self.model_name = model_name
+        self._nlp = None
+        self._matcher = None
+        self._load_lock = threading.Lock()
         
         # Exercise type keywords
         self.exercise_types = {
@@ -61,6 +79,50 @@ class NLPExtractor:
             'check': ['check', 'monitor', 'track', 'log', 'measure']
         }
     
+    @property
+    def nlp(self):
+        """The spaCy pipeline, loaded on first access"""
+        if self._nlp is None:
+            self.load()
+        return self._nlp
+    
+    @property
+    def matcher(self):
+        """Matcher with the custom patterns, built on first access"""
+        if self._matcher is None:
+            self.load()
+        return self._matcher
+    
+    def load(self) -> 'NLPExtractor':
+        """Import spaCy and load the model if that has not happened yet"""
+        if self._nlp is not None:
+            return self
+        
+        with self._load_lock:
+            if self._nlp is None:
+                import spacy
+                from spacy.matcher import Matcher
+                
+                try:
+                    nlp = spacy.load(self.model_name)
+                except OSError:
+                    raise OSError(
+                        f"spaCy model '{self.model_name}' not found. "
+                        f"Download with: python -m spacy download {self.model_name}"
+                    )
+                
+                # Initialize matcher for custom patterns
+                self._matcher = Matcher(nlp.vocab)
+                self._setup_patterns()
+                self._nlp = nlp
+        
+        return self
+    
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the spaCy model has been loaded"""
+        return self._nlp is not None
+    
     def _setup_patterns(self):
         """Setup custom patterns for extraction"""
         
@@ -73,7 +135,7 @@ class NLPExtractor:
             {'LOWER': {'IN': ['seconds', 'minutes', 'hours', 'reps', 'repetitions']}, 'OP': '?'},
             {'LOWER': {'IN': ['daily', 'per day', 'each day', 'weekly', 'per week']}}
         ]
-        self.matcher.add('FREQUENCY', [frequency_pattern])
+        self._matcher.add('FREQUENCY', [frequency_pattern])
         
         # Goal pattern: "Lift 20 kg overhead pain-free"
         goal_pattern = [
@@ -82,7 +144,7 @@ class NLPExtractor:
             {'LOWER': {'IN': ['kg', 'pounds', 'lb', '%']}, 'OP': '?'},
             {'LOWER': {'IN': ['pain-free', 'painless', 'without pain', 'freely']}, 'OP': '?'}
         ]
-        self.matcher.add('GOAL', [goal_pattern])
+        self._matcher.add('GOAL', [goal_pattern])
         
         # Time reference pattern: "in two weeks", "within 6-8 weeks"
         time_pattern = [
@@ -90,17 +152,21 @@ class NLPExtractor:
             {'LIKE_NUM': True},
             {'LOWER': {'IN': ['weeks', 'days', 'months', 'week', 'day', 'month']}}
         ]
-        self.matcher.add('TIME_REFERENCE', [time_pattern])
+        self._matcher.add('TIME_REFERENCE', [time_pattern])
     
-    def extract_exercises(self, text: str) -> List[Dict[str, Any]]:
+    def extract_exercises(self, text: str, use_pos: bool = True) -> List[Dict[str, Any]]:
         """
         Extract exercise information from text
         
+        Args:
+            text: Treatment plan text
+            use_pos: Find instructions by POS tagging (False: use the whole
+                paragraph, skipping spaCy's tagger and parser)
+                
         Returns:
             List of exercise dictionaries with name, instructions, frequency, etc.
         """
         exercises = []
-        doc = self.nlp(text)
         
         # Find exercise sections
         exercise_keywords = [
@@ -118,8 +184,6 @@ class NLPExtractor:
             if not para_clean or len(para_clean) < 10:
                 continue
             
-            doc_para = self.nlp(para_clean)
-            
             # Check if paragraph contains exercise keywords
             para_lower = para_clean.lower()
             is_exercise_section = any(keyword in para_lower for keyword in exercise_keywords)
@@ -137,6 +201,7 @@ class NLPExtractor:
                 frequency = self._extract_frequency(para_clean)
                 
                 # Extract instructions
+                doc_para = self.nlp(para_clean) if use_pos else None
                 instructions = self._extract_instructions(para_clean, doc_para)
                 
                 # Extract importance/benefit
@@ -196,8 +261,11 @@ class NLPExtractor:
         
         return frequency
     
-    def _extract_instructions(self, text: str, doc: Doc) -> str:
-        """Extract exercise instructions"""
+    def _extract_instructions(self, text: str, doc: Optional['Doc']) -> str:
+        """Extract exercise instructions (the whole text when doc is None)"""
+        if doc is None:
+            return text
+        
         # Instructions usually follow the exercise name
         # Look for imperative verbs (commands)
         instruction_sentences = []
@@ -245,7 +313,6 @@ class NLPExtractor:
     def extract_goals(self, text: str) -> List[Dict[str, Any]]:
         """Extract treatment goals and milestones"""
         goals = []
-        doc = self.nlp(text)
         
         # Look for goal sections
         goal_patterns = [
@@ -354,7 +421,6 @@ class NLPExtractor:
     def extract_conditions(self, text: str) -> List[Dict[str, Any]]:
         """Extract medical conditions/diagnoses"""
         conditions = []
-        doc = self.nlp(text)
         
         # Look for condition sections
         condition_pattern = r'(?i)(?:diagnosis|condition|injury)[:\s]+(.+?)(?:\n|$)'
@@ -379,19 +445,42 @@ class NLPExtractor:
         
         return conditions
     
-    def extract_all(self, text: str) -> Dict[str, Any]:
-        """Extract all structured data from treatment plan text"""
+    def extract_all(self, text: str, use_pos: bool = True) -> Dict[str, Any]:
+        """Extract all structured data from treatment plan text (see extract_exercises for use_pos)"""
+        extracted = self.extract_parts(text, use_pos=use_pos)
+        extracted['extraction_metadata'] = self.extraction_metadata(text)
+        return extracted
+    
+    def extract_parts(self, text: str, parts: Optional[List[str]] = None, use_pos: bool = True) -> Dict[str, Any]:
+        """
+        Run only the named sub-extractors
+        
+        Args:
+            text: Cleaned treatment plan text
+            parts: Keys of STAGE_VERSIONS to run (default: all)
+            use_pos: See extract_exercises
+            
+        Returns:
+            Dictionary with one entry per requested part
+        """
+        extractors = {
+            'exercises': lambda text: self.extract_exercises(text, use_pos),
+            'goals': self.extract_goals,
+            'dos_and_donts': self.extract_dos_and_donts,
+            'appointments': self.extract_appointment_schedule,
+            'conditions': self.extract_conditions
+        }
+        if parts is None:
+            parts = list(self.STAGE_VERSIONS)
+        return {part: extractors[part](text) for part in parts}
+    
+    def extraction_metadata(self, text: str) -> Dict[str, Any]:
+        """Text statistics recorded alongside the extracted data"""
         return {
-            'exercises': self.extract_exercises(text),
-            'goals': self.extract_goals(text),
-            'dos_and_donts': self.extract_dos_and_donts(text),
-            'appointments': self.extract_appointment_schedule(text),
-            'conditions': self.extract_conditions(text),
-            'extraction_metadata': {
-                'timestamp': datetime.now().isoformat(),
-                'text_length': len(text),
-                'confidence': 0.85  # Can be calculated based on extraction success
-            }
+            'timestamp': datetime.now().isoformat(),
+            'text_length': len(text),
+            'token_count': len(self.nlp.tokenizer(text)),
+            'confidence': 0.85  # Can be calculated based on extraction success
         }
 
 
@@ -0,0 +1,320 @@
+"""
+PDF Fetcher - Pooled, concurrent downloads of stored PDFs ahead of extraction
+
+Reprocessing stored plans one download at a time makes a backfill as slow as
+the sum of its network round trips. The fetcher keeps a pool of keep-alive
+HTTP(S) connections per host, downloads up to max_connections PDFs at once,
+retries transient failures (connection errors, 429 and 5xx) with exponential
+backoff, and streams each response straight into an in-memory buffer that
+the parser reads directly - no temporary files.
+
+prefetch() runs the downloads ahead of a consumer: while the extraction
+workers parse document N, documents N+1 ... N+ahead are already downloading.
+job_queue.py consumers use it for jobs whose payload has a pdf_url instead of
+a pdf_path.
+
+Standard library only (http.client). Any server that answers GET with the
+PDF bytes works, including presigned object storage URLs.
+
+Usage:
+    fetcher = PDFFetcher(max_connections=8)
+    pdf = fetcher.fetch(plan['pdf_url'])          # FetchedPDF (a BytesIO)
+    results = extractor.process_pdf(pdf, patient_id, plan_id)
+
+    for plan, pdf in fetcher.prefetch(plans, url=lambda plan: plan['pdf_url']):
+        if isinstance(pdf, Exception):
+            ...
+
+    python pdf_fetcher.py URL [URL ...]           # download and report timings
+"""
+
+import argparse
+import collections
+import http.client
+import io
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple, Callable, Union
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: throttling and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(RuntimeError):
+    """Raised when a PDF cannot be downloaded"""
+    
+    def __init__(self, url: str, reason: str, status: Optional[int] = None):
+        super().__init__(f"Could not fetch {url}: {reason}")
+        self.url = url
+        self.status = status
+
+
+class _TransientError(Exception):
+    """A failed attempt that is worth retrying"""
+
+
+class FetchedPDF(io.BytesIO):
+    """Downloaded PDF bytes; str() is the source URL (used in logs and metadata)"""
+    
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+    
+    def __str__(self) -> str:
+        return self.url
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections, reused per (scheme, host, port)
+    
+    At most max_connections are in use at once; further callers wait for a
+    free one. Connections are only returned to the pool after their response
+    was read completely, and dropped after any error.
+    """
+    
+    def __init__(self, max_connections: int = 8, timeout: float = 30.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'reused': 0}
+    
+    @contextmanager
+    def connection(self, scheme: str, host: str, port: Optional[int]) -> Iterator[http.client.HTTPConnection]:
+        """
+        Borrow a connection; it goes back to the pool when the block exits
+        normally, unless it was marked with keep = False
+        """
+        key = (scheme, host, port or (443 if scheme == 'https' else 80))
+        self._slots.acquire()
+        try:
+            with self._lock:
+                idle = self._idle[key]
+                conn = idle.pop() if idle else None
+                self._stats['reused' if conn else 'opened'] += 1
+            if conn is None:
+                connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+                conn = connection_class(host, port, timeout=self.timeout)
+            conn.keep = True
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            if conn.keep:
+                with self._lock:
+                    self._idle[key].append(conn)
+            else:
+                conn.close()
+        finally:
+            self._slots.release()
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, idle=sum(len(idle) for idle in self._idle.values()))
+    
+    def close(self):
+        """Close idle connections (borrowed ones are closed when returned)"""
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+
+class PDFFetcher:
+    """
+    Concurrent PDF downloader with a connection pool and retries
+    
+    Thread-safe. fetch() downloads in the calling thread; submit() and
+    prefetch() use the fetcher's own max_connections download threads.
+    """
+    
+    def __init__(
+        self,
+        max_connections: int = 8,
+        timeout: float = 30.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_bytes: int = 100 * 1024 * 1024,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        """
+        Args:
+            max_connections: Downloads (and open connections) at once
+            timeout: Socket timeout per connect/read, in seconds
+            retries: Retries after a transient failure
+            backoff: Delay before the first retry; doubles per retry (with jitter)
+            max_bytes: Refuse responses larger than this
+            headers: Extra request headers (e.g. Authorization)
+        """
+        self.pool = ConnectionPool(max_connections, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        self.headers = dict(headers or {})
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+    
+    def fetch(self, url: str) -> FetchedPDF:
+        """
+        Download url into memory
+        
+        Raises:
+            FetchError: Permanent failure (4xx, oversized response) or
+                transient failures on every attempt
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError(url, "only http(s) URLs are supported")
+        target = parts.path or '/'
+        if parts.query:
+            target += f"?{parts.query}"
+        
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch_once(url, parts, target)
+            except _TransientError as e:
+                if attempt == self.retries:
+                    raise FetchError(url, f"{e} (after {attempt + 1} attempts)") from None
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                logger.info("Retrying %s in %.2fs: %s", url, delay, e)
+                time.sleep(delay)
+    
+    def _fetch_once(self, url: str, parts, target: str) -> FetchedPDF:
+        try:
+            with self.pool.connection(parts.scheme, parts.hostname, parts.port) as conn:
+                conn.request('GET', target, headers=self.headers)
+                response = conn.getresponse()
+                conn.keep = not response.will_close
+                if response.status != 200:
+                    response.read()
+                    if response.status in RETRY_STATUSES:
+                        raise _TransientError(f"HTTP {response.status}")
+                    raise FetchError(url, f"HTTP {response.status} {response.reason}", response.status)
+                
+                length = response.getheader('Content-Length')
+                if length is not None and int(length) > self.max_bytes:
+                    conn.keep = False
+                    raise FetchError(url, f"{length} bytes exceeds max_bytes")
+                pdf = FetchedPDF(url)
+                for chunk in iter(lambda: response.read(_CHUNK_SIZE), b''):
+                    if pdf.tell() + len(chunk) > self.max_bytes:
+                        conn.keep = False
+                        raise FetchError(url, "response exceeds max_bytes")
+                    pdf.write(chunk)
+                if length is not None and pdf.tell() != int(length):
+                    raise _TransientError(f"truncated response ({pdf.tell()} of {length} bytes)")
+        except (OSError, http.client.HTTPException) as e:
+            # Includes timeouts, resets and keep-alive connections the server closed
+            raise _TransientError(f"{type(e).__name__}: {e}") from None
+        pdf.seek(0)
+        return pdf
+    
+    def submit(self, url: str) -> Future:
+        """Start downloading url on the fetcher's threads; the future holds the FetchedPDF"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.pool.max_connections, thread_name_prefix='pdf-fetch')
+            return self._executor.submit(self.fetch, url)
+    
+    def prefetch(
+        self,
+        items: Iterable[Any],
+        url: Callable[[Any], str],
+        ahead: Optional[int] = None
+    ) -> Iterator[Tuple[Any, Union[FetchedPDF, Exception]]]:
+        """
+        Download the PDFs of items ahead of the consumer, yielding in input order
+        
+        At most ahead downloads are buffered or running at once (defaults to
+        2x max_connections), so memory stays bounded; items is consumed
+        lazily. A failed download is yielded as its exception.
+        
+        Args:
+            items: Anything; url(item) gives the PDF's URL
+            url: Maps an item to its URL
+            ahead: Downloads kept in flight ahead of the consumer
+        """
+        ahead = ahead or 2 * self.pool.max_connections
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append((item, self.submit(url(item))))
+                if len(pending) >= ahead:
+                    yield self._settled(*pending.popleft())
+            while pending:
+                yield self._settled(*pending.popleft())
+        finally:
+            # Consumer stopped early: drop the downloads nobody will read
+            for _, future in pending:
+                future.cancel()
+    
+    @staticmethod
+    def _settled(item: Any, future: Future) -> Tuple[Any, Union[FetchedPDF, Exception]]:
+        try:
+            return item, future.result()
+        except Exception as e:
+            return item, e
+    
+    def stats(self) -> Dict[str, int]:
+        """Connection pool counters: opened, reused, idle"""
+        return self.pool.stats()
+    
+    def close(self):
+        """Stop the download threads and close pooled connections"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.pool.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('urls', nargs='+', help='PDF URLs')
+    parser.add_argument('--max-connections', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    
+    failures = 0
+    started = time.perf_counter()
+    with PDFFetcher(max_connections=args.max_connections, retries=args.retries) as fetcher:
+        for url, pdf in fetcher.prefetch(args.urls, url=lambda url: url):
+            if isinstance(pdf, Exception):
+                failures += 1
+                print(f"FAILED {url}: {pdf}")
+            else:
+                print(f"{len(pdf.getbuffer()):>10} bytes  {url}")
+        stats = fetcher.stats()
+    print(
+        f"{len(args.urls)} downloads in {time.perf_counter() - started:.2f}s "
+        f"({stats['opened']} connections opened, {stats['reused']} reused)"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
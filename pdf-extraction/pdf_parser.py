@@ -3,33 +3,44 @@ PDF Parser - Extracts text from treatment plan PDFs
 Handles both text-based PDFs and scanned images with OCR
 """
 
-import io
+import logging
 import re
+from contextlib import nullcontext
+from importlib.util import find_spec
 from typing import Optional, Dict, List
 from pathlib import Path
 
-try:
-    import pdfplumber
-    PDFPLUMBER_AVAILABLE = True
-except ImportError:
-    PDFPLUMBER_AVAILABLE = False
+# Backends are only probed here; the (slow) imports happen on first use so
+# that importing this module stays cheap for short-lived workers and CLIs.
+PDFPLUMBER_AVAILABLE = find_spec('pdfplumber') is not None
+PYPDF2_AVAILABLE = find_spec('PyPDF2') is not None
+OCR_AVAILABLE = find_spec('pytesseract') is not None and find_spec('PIL') is not None
 
-try:
-    import PyPDF2
-    PYPDF2_AVAILABLE = True
-except ImportError:
-    PYPDF2_AVAILABLE = False
+logger = logging.getLogger(__name__)
 
-try:
-    import pytesseract
-    from PIL import Image
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
+
+def _open_binary(pdf):
+    """Binary file for a path, or the given file object rewound (left open)"""
+    if hasattr(pdf, 'read'):
+        pdf.seek(0)
+        return nullcontext(pdf)
+    return open(pdf, 'rb')
 
 
 class PDFParser:
-    """Extract text content from PDF treatment plans"""
+    """
+    Extract text content from PDF treatment plans
+    
+    Stateless after construction, so one instance can be shared by threads.
+    """
+    
+    # Logic version of each parser stage; bump an entry whenever a change
+    # alters that stage's output (see stage_store.py)
+    STAGE_VERSIONS = {
+        'extract_text': '1',
+        'clean_text': '1',
+        'sections': '1'
+    }
     
     def __init__(self):
         self.supported_formats = []
@@ -40,51 +51,66 @@ class PDFParser:
         if OCR_AVAILABLE:
             self.supported_formats.append('ocr')
     
-    def extract_text(self, pdf_path: str, use_ocr: bool = False) -> Dict[str, any]:
+    def extract_text(
+        self,
+        pdf_path: str,
+        use_ocr: bool = False,
+        engine: Optional[str] = None,
+        max_pages: Optional[int] = None
+    ) -> Dict[str, any]:
         """
         Extract text from PDF file
         
         Args:
-            pdf_path: Path to PDF file
+            pdf_path: Path to PDF file, or a seekable binary file object
+                (e.g. a download buffer from pdf_fetcher.py)
             use_ocr: Whether to use OCR for scanned images
+            engine: 'pypdf2' to try the faster PyPDF2 before pdfplumber
+                (default: pdfplumber first, for its better layout handling)
+            max_pages: Only extract the first max_pages pages
             
         Returns:
             Dictionary with extracted text and metadata
         """
-        pdf_path = Path(pdf_path)
-        if not pdf_path.exists():
-            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        if not hasattr(pdf_path, 'read'):
+            pdf_path = Path(pdf_path)
+            if not pdf_path.exists():
+                raise FileNotFoundError(f"PDF file not found: {pdf_path}")
         
+        backends = []
         # Try pdfplumber first (better for structured text)
         if PDFPLUMBER_AVAILABLE:
-            try:
-                return self._extract_with_pdfplumber(pdf_path)
-            except Exception as e:
-                print(f"pdfplumber extraction failed: {e}")
-        
+            backends.append(('pdfplumber', self._extract_with_pdfplumber))
         # Fallback to PyPDF2
         if PYPDF2_AVAILABLE:
+            backends.append(('PyPDF2', self._extract_with_pypdf2))
+        if engine == 'pypdf2':
+            backends.reverse()
+        
+        for name, extract in backends:
             try:
-                return self._extract_with_pypdf2(pdf_path)
+                return extract(pdf_path, max_pages)
             except Exception as e:
-                print(f"PyPDF2 extraction failed: {e}")
+                logger.warning("%s extraction failed for %s: %s", name, pdf_path, e)
         
         # Try OCR if enabled and other methods failed
-        if use_ocr and OCR_AVAILABLE:
+        if use_ocr and OCR_AVAILABLE and isinstance(pdf_path, Path):
             try:
                 return self._extract_with_ocr(pdf_path)
             except Exception as e:
-                print(f"OCR extraction failed: {e}")
+                logger.warning("OCR extraction failed for %s: %s", pdf_path, e)
         
         raise RuntimeError("Failed to extract text from PDF")
     
-    def _extract_with_pdfplumber(self, pdf_path: Path) -> Dict[str, any]:
+    def _extract_with_pdfplumber(self, pdf_path: Path, max_pages: Optional[int] = None) -> Dict[str, any]:
         """Extract text using pdfplumber (best for structured text)"""
+        import pdfplumber
+        
         full_text = []
         pages_data = []
         
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
+        with _open_binary(pdf_path) as file, pdfplumber.open(file) as pdf:
+            for page_num, page in enumerate(pdf.pages[:max_pages], 1):
                 text = page.extract_text()
                 if text:
                     full_text.append(text)
@@ -106,15 +132,17 @@ class PDFParser:
             }
         }
     
-    def _extract_with_pypdf2(self, pdf_path: Path) -> Dict[str, any]:
+    def _extract_with_pypdf2(self, pdf_path: Path, max_pages: Optional[int] = None) -> Dict[str, any]:
         """Extract text using PyPDF2 (fallback method)"""
+        import PyPDF2
+        
         full_text = []
         pages_data = []
         
-        with open(pdf_path, 'rb') as file:
+        with _open_binary(pdf_path) as file:
             pdf_reader = PyPDF2.PdfReader(file)
             
-            for page_num, page in enumerate(pdf_reader.pages, 1):
+            for page_num, page in enumerate(pdf_reader.pages[:max_pages], 1):
                 text = page.extract_text()
                 if text:
                     full_text.append(text)
@@ -131,6 +159,21 @@ class PDFParser:
             'metadata': pdf_reader.metadata if hasattr(pdf_reader, 'metadata') else {}
         }
     
+    def count_pages(self, pdf_path: str) -> Optional[int]:
+        """Number of pages, read from the page tree without extracting text (None if unreadable)"""
+        try:
+            if PYPDF2_AVAILABLE:
+                import PyPDF2
+                with _open_binary(pdf_path) as file:
+                    return len(PyPDF2.PdfReader(file).pages)
+            if PDFPLUMBER_AVAILABLE:
+                import pdfplumber
+                with _open_binary(pdf_path) as file, pdfplumber.open(file) as pdf:
+                    return len(pdf.pages)
+        except Exception as e:
+            logger.debug("Could not count pages of %s: %s", pdf_path, e)
+        return None
+    
     def _extract_with_ocr(self, pdf_path: Path) -> Dict[str, any]:
         """Extract text using OCR (for scanned PDFs)"""
         # This would require converting PDF pages to images first
@@ -147,6 +190,11 @@ class PDFParser:
         text = re.sub(r'\r\n', '\n', text)
         return text.strip()
     
+    @staticmethod
+    def count_paragraphs(full_text: str) -> int:
+        """Paragraphs (blocks of at least 10 characters) of extracted, uncleaned text"""
+        return sum(1 for para in re.split(r'\n\s*\n', full_text) if len(para.strip()) >= 10)
+    
     def identify_sections(self, text: str) -> List[Dict[str, str]]:
         """Identify document sections based on headings"""
         sections = []
@@ -0,0 +1,289 @@
+"""
+Pipeline Executor - Overlaps the stages of consecutive documents
+
+process_pdf runs all stages of one document before starting the next. For
+batch work the pipeline executor splits a run into three stage groups with
+bounded queues between them:
+    
+    parse (extract_text, clean_text) -> nlp -> finish (sections, missions, calendar)
+
+Each group has its own worker threads, so while document N is in NLP,
+document N+1 is being parsed and document N-1 is generating missions. Full
+queues block the stage that feeds them (backpressure), so memory stays
+bounded however long the input is, and the input iterable is consumed lazily.
+
+Parsing is mostly pure Python and holds the GIL; with parse_processes > 0 it
+runs in a process pool instead, so it overlaps with spaCy for real and the
+throughput approaches that of the slowest stage.
+
+Usage:
+    executor = PipelineExecutor(nlp_model='en_core_web_sm', parse_processes=2)
+    for job, result in executor.run(jobs):
+        if isinstance(result, Exception):
+            ...
+"""
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Iterable, Iterator, Tuple, Union
+
+from main_extractor import PDFTreatmentPlanExtractor
+from instrumentation import StageTimer
+
+logger = logging.getLogger(__name__)
+
+STAGE_GROUPS = ('parse', 'nlp', 'finish')
+
+# Queue sentinel: one per downstream worker once a stage group has drained
+_STOP = object()
+
+# Parser for parse_processes workers (created in each child on first use)
+_child_extractor: Optional[PDFTreatmentPlanExtractor] = None
+
+
+def _parse_in_child(pdf_path: str):
+    """Run the parse stages in a pool process; returns (pdf_data, cleaned_text, stage timings)"""
+    global _child_extractor
+    if _child_extractor is None:
+        # Only the parser is used; the spaCy model is never loaded here
+        _child_extractor = PDFTreatmentPlanExtractor()
+    timer = StageTimer()
+    pdf_data, cleaned_text = _child_extractor._parse_document(timer, pdf_path)
+    return pdf_data, cleaned_text, timer.stages
+
+
+class _Item:
+    """One document travelling through the pipeline"""
+    
+    __slots__ = ('job', 'timer', 'pdf_data', 'cleaned_text', 'extracted_data', 'result', 'error', 'enqueued')
+    
+    def __init__(self, job: Dict[str, Any]):
+        self.job = job
+        self.timer = StageTimer()
+        self.pdf_data = None
+        self.cleaned_text = None
+        self.extracted_data = None
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.enqueued = time.perf_counter()
+
+
+class PipelineExecutor:
+    """
+    Runs many process_pdf jobs with their stages overlapped
+    
+    Results are identical to process_pdf; they come back in completion
+    order, paired with the job they belong to. Memory/CPU profiling options
+    are not supported here (use process_pdf for a profiled run).
+    """
+    
+    def __init__(
+        self,
+        extractor: Optional[PDFTreatmentPlanExtractor] = None,
+        nlp_model: str = 'en_core_web_sm',
+        parse_workers: int = 2,
+        nlp_workers: int = 1,
+        finish_workers: int = 1,
+        queue_size: int = 4,
+        parse_processes: int = 0
+    ):
+        """
+        Args:
+            extractor: Extractor whose components run the stages (a new one
+                for nlp_model is created if omitted)
+            nlp_model: spaCy model name or path
+            parse_workers: Threads running the parse stages (at least
+                parse_processes when parsing in processes)
+            nlp_workers: Threads running NLP (they share one loaded model)
+            finish_workers: Threads identifying sections and generating missions
+                and calendar events
+            queue_size: Capacity of each inter-stage queue
+            parse_processes: Parse in this many worker processes (0: in threads)
+        """
+        if min(parse_workers, nlp_workers, finish_workers, queue_size) < 1:
+            raise ValueError("worker counts and queue_size must be at least 1")
+        
+        self.extractor = extractor or PDFTreatmentPlanExtractor(nlp_model)
+        self.workers = {
+            'parse': max(parse_workers, parse_processes),
+            'nlp': nlp_workers,
+            'finish': finish_workers
+        }
+        self.queue_size = queue_size
+        self.parse_processes = parse_processes
+        self.stats: Dict[str, Dict[str, float]] = {}
+    
+    def run(
+        self,
+        jobs: Iterable[Dict[str, Any]]
+    ) -> Iterator[Tuple[Dict[str, Any], Union[Dict[str, Any], Exception]]]:
+        """
+        Process jobs and yield (job, result) pairs as documents finish
+        
+        Args:
+            jobs: Dictionaries of process_pdf arguments (pdf_path, patient_id,
+                treatment_plan_id, optional start_date and default_points)
+                
+        Yields:
+            (job, result) where result is the process_pdf dictionary, or the
+            exception that stopped this document
+        """
+        self.extractor.warm_up()
+        self.stats = {
+            group: {'documents': 0, 'busy_seconds': 0.0, 'blocked_seconds': 0.0}
+            for group in STAGE_GROUPS
+        }
+        abort = threading.Event()
+        queues = [queue.Queue(self.queue_size) for _ in STAGE_GROUPS]
+        outputs = queue.Queue(self.queue_size)
+        process_pool = None
+        if self.parse_processes:
+            # Not fork: the pool starts while pipeline threads hold locks.
+            # Importing the parser in a fresh interpreter is cheap.
+            process_pool = ProcessPoolExecutor(
+                self.parse_processes,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        
+        handlers = {
+            'parse': lambda item: self._parse(item, process_pool),
+            'nlp': self._nlp,
+            'finish': self._finish
+        }
+        threads = [threading.Thread(
+            target=self._feed, args=(jobs, queues[0], abort), name='pipeline-feed', daemon=True
+        )]
+        for index, group in enumerate(STAGE_GROUPS):
+            downstream = queues[index + 1] if index + 1 < len(STAGE_GROUPS) else outputs
+            next_workers = self.workers[STAGE_GROUPS[index + 1]] if index + 1 < len(STAGE_GROUPS) else 1
+            remaining = [self.workers[group]]
+            lock = threading.Lock()
+            for n in range(self.workers[group]):
+                threads.append(threading.Thread(
+                    target=self._stage_worker,
+                    args=(group, handlers[group], queues[index], downstream, next_workers, remaining, lock, abort),
+                    name=f'pipeline-{group}-{n + 1}',
+                    daemon=True
+                ))
+        
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = outputs.get()
+                if item is _STOP:
+                    break
+                yield item.job, item.error if item.error is not None else item.result
+        finally:
+            # Reached on exhaustion and when the caller stops iterating early
+            abort.set()
+            for thread in threads:
+                thread.join()
+            if process_pool is not None:
+                process_pool.shutdown(cancel_futures=True)
+    
+    def stage_utilization(self) -> Dict[str, Dict[str, float]]:
+        """Per stage group: documents, busy and blocked seconds of the last run"""
+        return {group: dict(stats) for group, stats in self.stats.items()}
+    
+    @staticmethod
+    def _put(target: queue.Queue, item, abort: threading.Event) -> bool:
+        """Blocking put that gives up when the run is aborted"""
+        while not abort.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _feed(self, jobs: Iterable[Dict[str, Any]], target: queue.Queue, abort: threading.Event):
+        try:
+            for job in jobs:
+                if not self._put(target, _Item(job), abort):
+                    return
+        except Exception as e:
+            logger.error("Pipeline input failed: %s", e)
+        finally:
+            for _ in range(self.workers['parse']):
+                self._put(target, _STOP, abort)
+    
+    def _stage_worker(self, group, handler, source, target, next_workers, remaining, lock, abort):
+        stats = self.stats[group]
+        while not abort.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+            
+            if item.error is None:
+                started = time.perf_counter()
+                try:
+                    handler(item)
+                except Exception as e:
+                    item.error = e
+                    self.extractor.metrics.record_run({}, status='error')
+                busy = time.perf_counter() - started
+                with lock:
+                    stats['documents'] += 1
+                    stats['busy_seconds'] += busy
+            
+            started = time.perf_counter()
+            if not self._put(target, item, abort):
+                return
+            with lock:
+                stats['blocked_seconds'] += time.perf_counter() - started
+        
+        # The last worker of a group to finish tells the next group to stop
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(target, _STOP, abort)
+    
+    def _parse(self, item: _Item, process_pool: Optional[ProcessPoolExecutor]):
+        pdf_path = item.job['pdf_path']
+        if process_pool is None:
+            item.pdf_data, item.cleaned_text = self.extractor._parse_document(item.timer, pdf_path)
+        else:
+            item.pdf_data, item.cleaned_text, stages = process_pool.submit(_parse_in_child, pdf_path).result()
+            item.timer.stages.update(stages)
+    
+    def _nlp(self, item: _Item):
+        item.extracted_data = self.extractor._extract_structured_data(item.timer, item.cleaned_text)
+    
+    def _finish(self, item: _Item):
+        job = item.job
+        analysis = self.extractor._document_analysis(
+            item.timer,
+            item.pdf_data,
+            item.cleaned_text,
+            item.extracted_data
+        )
+        item.result = self.extractor._build_result(
+            item.timer,
+            job['pdf_path'],
+            analysis,
+            job['patient_id'],
+            job['treatment_plan_id'],
+            job.get('start_date'),
+            job.get('default_points', 50)
+        )
+        
+        timings = item.result['metadata']['timings']
+        # Stages ran on different threads, so the timer's own CPU total does
+        # not apply; total wall time includes time spent waiting in queues
+        timings['total'] = {
+            'wall_ms': round((time.perf_counter() - item.enqueued) * 1000, 3),
+            'cpu_ms': round(sum(stage['cpu_ms'] for stage in timings['stages'].values()), 3)
+        }
+        self.extractor.metrics.record_run(item.result['metadata'])
+        # Drop intermediates as soon as the result exists
+        item.pdf_data = item.cleaned_text = item.extracted_data = None
@@ -0,0 +1,40 @@
+"""
+Pool Preload - Loads the extractor model in the worker pool's fork server
+
+ExtractorWorkerPool starts its workers from a multiprocessing fork server
+(start method 'forkserver'). The fork server imports this module once, at
+startup: the model named in PDF_EXTRACTION_PRELOAD_MODEL is loaded in that
+single-threaded process and moved out of the garbage collector's reach
+(gc.freeze), and every worker forked from it shares the model copy-on-write.
+
+The process that creates the pool never loads the model, and gc.freeze()
+never runs there: its own objects stay collectable, and no fork happens
+while its threads are running.
+"""
+
+import gc
+import logging
+import os
+
+import worker_pool
+from main_extractor import PDFTreatmentPlanExtractor
+
+logger = logging.getLogger(__name__)
+
+
+def preload(nlp_model: str):
+    """Load nlp_model for the workers forked from this process"""
+    try:
+        extractor = PDFTreatmentPlanExtractor(nlp_model).warm_up()
+    except Exception:
+        # Workers load the model themselves (and report the error per job)
+        logger.exception("Could not preload %s in the fork server", nlp_model)
+        return
+    worker_pool._PRELOADED[nlp_model] = extractor
+    # Collections in the workers would otherwise write to (and un-share)
+    # the model's pages
+    gc.freeze()
+
+
+if os.environ.get(worker_pool.PRELOAD_ENV):
+    preload(os.environ[worker_pool.PRELOAD_ENV])
@@ -0,0 +1,242 @@
+"""
+Recurrence - Compact recurring missions and date-window expansion
+
+A daily exercise over the default 8 weeks is 56 missions that differ only in
+their dates. A recurring mission record stores the mission once, with an
+RFC 5545-style rule (FREQ=DAILY|WEEKLY, INTERVAL, COUNT, UNTIL) and
+exception dates:
+    
+    {
+        'template': {...mission, dated on the first occurrence...},
+        'rrule': 'FREQ=DAILY;INTERVAL=1;COUNT=56',
+        'dtstart': '2026-10-19',
+        'exdates': [],
+        'due_time': '09:00:00',                                  # optional
+        'numbered': {'description': 'Physiotherapy session {n}'}  # optional
+    }
+
+Each occurrence is the template with scheduled_date set to the occurrence,
+due_datetime to that date at due_time, and every 'numbered' field to its
+pattern with {n} replaced by the occurrence number (1-based, counted over the
+rule before exdates are removed, as COUNT is).
+
+expand_missions() materializes concrete missions, optionally only those in a
+date window (computed arithmetically, without walking the plan from its
+start). Expanding all records of a plan gives exactly the list that
+MissionGenerator.generate_missions() returns, in the same order.
+
+Usage:
+    records = generator.generate_recurring_missions(data, plan_id, patient_id)
+    this_week = expand_missions(records, start=monday, end=sunday)
+    everything = expand_missions(records)
+"""
+
+import copy
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple, Union
+
+# Days per FREQ unit
+FREQUENCIES = {'DAILY': 1, 'WEEKLY': 7}
+
+
+def _as_date(value: Union[str, date]) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def copy_template(template: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A template as a new mission dict; nested values (recurrence_pattern) are
+    copied too, so occurrences never share them
+    """
+    mission = dict(template)
+    for field, value in mission.items():
+        if isinstance(value, (dict, list)):
+            mission[field] = copy.deepcopy(value)
+    return mission
+
+
+class RecurrenceRule:
+    """Occurrences every interval days from dtstart, bounded by count and/or until"""
+    
+    __slots__ = ('dtstart', 'interval', 'count', 'until', 'exdates')
+    
+    def __init__(
+        self,
+        dtstart: date,
+        interval: int = 1,
+        count: Optional[int] = None,
+        until: Optional[date] = None,
+        exdates: Iterable[Union[str, date]] = ()
+    ):
+        """
+        Args:
+            dtstart: First occurrence
+            interval: Days between occurrences
+            count: Number of occurrences (before exdates are removed)
+            until: Last possible occurrence date (inclusive)
+            exdates: Occurrence dates to skip
+            
+        Raises:
+            ValueError: interval below 1, or neither count nor until given
+        """
+        if interval < 1:
+            raise ValueError(f"Recurrence interval must be at least one day, got {interval}")
+        if count is None and until is None:
+            raise ValueError("Recurrence needs COUNT or UNTIL")
+        self.dtstart = dtstart
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.exdates = frozenset(_as_date(exdate) for exdate in exdates)
+    
+    @classmethod
+    def parse(cls, rrule: str, dtstart: Union[str, date], exdates: Iterable[Union[str, date]] = ()) -> 'RecurrenceRule':
+        """
+        Rule from an RRULE string
+        
+        Raises:
+            ValueError: Malformed rule, or parts other than FREQ (DAILY or
+                WEEKLY), INTERVAL, COUNT and UNTIL
+        """
+        try:
+            parts = dict(part.split('=', 1) for part in rrule.split(';') if part)
+        except ValueError:
+            raise ValueError(f"Malformed RRULE: {rrule!r}") from None
+        unsupported = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL'}
+        if unsupported or parts.get('FREQ') not in FREQUENCIES:
+            raise ValueError(f"Unsupported RRULE: {rrule!r}")
+        until = parts.get('UNTIL')
+        return cls(
+            _as_date(dtstart),
+            interval=FREQUENCIES[parts['FREQ']] * int(parts.get('INTERVAL', 1)),
+            count=int(parts['COUNT']) if 'COUNT' in parts else None,
+            until=datetime.strptime(until[:8], '%Y%m%d').date() if until else None,
+            exdates=exdates
+        )
+    
+    def to_rrule(self) -> str:
+        if self.interval % 7 == 0:
+            parts = ['FREQ=WEEKLY', f'INTERVAL={self.interval // 7}']
+        else:
+            parts = ['FREQ=DAILY', f'INTERVAL={self.interval}']
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until.strftime('%Y%m%d')}")
+        return ';'.join(parts)
+    
+    def _last_index(self, end: Optional[date] = None) -> int:
+        last = self.count - 1 if self.count is not None else None
+        for bound in (self.until, end):
+            if bound is not None:
+                index = (bound - self.dtstart).days // self.interval
+                last = index if last is None else min(last, index)
+        return last
+    
+    def occurrences(self, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[Tuple[int, date]]:
+        """
+        (index, date) of each occurrence between start and end (inclusive)
+        
+        Only the occurrences inside the window are computed. index is
+        0-based over the rule, exdates included.
+        """
+        first = 0
+        if start is not None and start > self.dtstart:
+            first = -(-(start - self.dtstart).days // self.interval)
+        for index in range(first, self._last_index(end) + 1):
+            day = self.dtstart + timedelta(days=index * self.interval)
+            if day not in self.exdates:
+                yield index, day
+    
+    def __len__(self) -> int:
+        """Number of occurrences, exdates excluded"""
+        return sum(1 for _ in self.occurrences())
+
+
+def recurring_mission(
+    template: Dict[str, Any],
+    rule: RecurrenceRule,
+    due_time: Optional[str] = None,
+    numbered: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Recurring mission record
+    
+    Args:
+        template: Mission for the first occurrence
+        rule: When it recurs
+        due_time: Time of day (HH:MM:SS) of each occurrence's due_datetime
+        numbered: Fields whose value varies with the occurrence number, as
+            patterns containing {n}
+    """
+    record = {
+        'template': template,
+        'rrule': rule.to_rrule(),
+        'dtstart': rule.dtstart.isoformat(),
+        'exdates': sorted(exdate.isoformat() for exdate in rule.exdates)
+    }
+    if due_time is not None:
+        record['due_time'] = due_time
+    if numbered:
+        record['numbered'] = numbered
+    return record
+
+
+def iter_occurrences(
+    records: Iterable[Dict[str, Any]],
+    start: Optional[Union[str, date]] = None,
+    end: Optional[Union[str, date]] = None
+) -> Iterator[Tuple[Dict[str, Any], date, Dict[str, Any]]]:
+    """(record, date, mission) of each occurrence within [start, end], record by record"""
+    start = _as_date(start) if start is not None else None
+    end = _as_date(end) if end is not None else None
+    for record in records:
+        rule = RecurrenceRule.parse(record['rrule'], record['dtstart'], record.get('exdates', ()))
+        due_time = time.fromisoformat(record['due_time']) if record.get('due_time') else None
+        numbered = record.get('numbered', {})
+        for index, day in rule.occurrences(start, end):
+            mission = copy_template(record['template'])
+            mission['scheduled_date'] = day.isoformat()
+            if due_time is not None:
+                mission['due_datetime'] = datetime.combine(day, due_time).isoformat()
+            for field, pattern in numbered.items():
+                mission[field] = pattern.replace('{n}', str(index + 1))
+            yield record, day, mission
+
+
+def iter_expanded(
+    records: Iterable[Dict[str, Any]],
+    start: Optional[Union[str, date]] = None,
+    end: Optional[Union[str, date]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Concrete missions of records within [start, end], record by record"""
+    for _, _, mission in iter_occurrences(records, start, end):
+        yield mission
+
+
+def expand_missions(
+    records: Iterable[Dict[str, Any]],
+    start: Optional[Union[str, date]] = None,
+    end: Optional[Union[str, date]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Materialize recurring mission records
+    
+    Args:
+        records: Recurring mission records
+        start: First date to include (default: from each rule's start)
+        end: Last date to include (default: to each rule's end)
+        
+    Returns:
+        Missions in record order (not sorted by date); without a window,
+        exactly MissionGenerator.generate_missions() for the same plan
+    """
+    return list(iter_expanded(records, start, end))
+
+
+def occurrence_count(records: Iterable[Dict[str, Any]]) -> int:
+    """Number of concrete missions records expand to"""
+    return sum(
+        len(RecurrenceRule.parse(record['rrule'], record['dtstart'], record.get('exdates', ())))
+        for record in records
+    )
@@ -0,0 +1,178 @@
+"""
+Result Cache - Reuse extraction work for re-submitted PDFs
+
+Splits a result into two layers:
+- the document analysis (extracted_data, sections, page/text facts), which
+  depends only on the PDF bytes, the extractor version and the spaCy model
+- the plan-specific outputs (missions, calendar events), which also depend on
+  patient_id, treatment_plan_id, start_date and default_points
+
+A re-submitted PDF with new plan parameters skips parsing and NLP and only
+regenerates missions; an exact duplicate submission returns the stored
+result. Document analyses can optionally be persisted to a directory so that
+worker processes and restarts share them.
+"""
+
+import copy
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from serialization import dumps_compact, loads
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents (path or seekable binary file object)"""
+    digest = hashlib.sha256()
+    if hasattr(path, 'read'):
+        position = path.tell()
+        path.seek(0)
+        for chunk in iter(lambda: path.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        path.seek(position)
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-layer LRU cache of document analyses and full results
+    
+    Thread-safe; values are deep-copied on the way in and out so callers can
+    modify what they get back.
+    """
+    
+    def __init__(
+        self,
+        max_documents: int = 256,
+        max_results_per_document: int = 8,
+        directory: Optional[str] = None
+    ):
+        """
+        Args:
+            max_documents: Document analyses kept in memory
+            max_results_per_document: Full results kept per document (one per
+                distinct set of plan parameters)
+            directory: Also persist document analyses here (one JSON file each)
+        """
+        self.max_documents = max_documents
+        self.max_results_per_document = max_results_per_document
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'full_hits': 0, 'document_hits': 0, 'misses': 0}
+    
+    @staticmethod
+    def document_key(pdf_path: str, version: str) -> str:
+        """Cache key for a PDF: content hash plus extractor version"""
+        return f"{file_digest(pdf_path)}-{hashlib.sha256(version.encode()).hexdigest()[:12]}"
+    
+    def get_result(self, key: str, params: Tuple) -> Optional[Dict[str, Any]]:
+        """Stored full result for key and plan parameters, if any"""
+        with self._lock:
+            entry = self._entries.get(key)
+            result = entry['results'].get(params) if entry else None
+            if result is None:
+                return None
+            self._entries.move_to_end(key)
+            entry['results'].move_to_end(params)
+            self._stats['full_hits'] += 1
+        return copy.deepcopy(result)
+    
+    def get_document(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored document analysis for key, if any (counts a miss otherwise)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['document_hits'] += 1
+                return copy.deepcopy(entry['analysis'])
+        
+        analysis = self._load_from_disk(key)
+        with self._lock:
+            if analysis is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['document_hits'] += 1
+            self._insert(key, analysis)
+        return copy.deepcopy(analysis)
+    
+    def put_document(self, key: str, analysis: Dict[str, Any]):
+        """Store a document analysis"""
+        analysis = copy.deepcopy(analysis)
+        with self._lock:
+            self._insert(key, analysis)
+        self._save_to_disk(key, analysis)
+    
+    def put_result(self, key: str, params: Tuple, result: Dict[str, Any]):
+        """Store a full result (the document analysis must be stored first)"""
+        result = copy.deepcopy(result)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['results'][params] = result
+            entry['results'].move_to_end(params)
+            while len(entry['results']) > self.max_results_per_document:
+                entry['results'].popitem(last=False)
+    
+    def _insert(self, key: str, analysis: Dict[str, Any]):
+        """Add or replace an entry (caller holds the lock)"""
+        self._entries[key] = {'analysis': analysis, 'results': OrderedDict()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_documents:
+            self._entries.popitem(last=False)
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+    
+    def _load_from_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.directory:
+            return None
+        try:
+            return loads(self._path(key).read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cache entry %s: %s", key, e)
+            return None
+    
+    def _save_to_disk(self, key: str, analysis: Dict[str, Any]):
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(dumps_compact(analysis))
+            tmp_path.replace(path)  # Atomic, so concurrent readers never see a partial file
+        except OSError as e:
+            logger.warning("Could not persist cache entry %s: %s", key, e)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters and hit rate since creation"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['documents'] = len(self._entries)
+        lookups = stats['full_hits'] + stats['document_hits'] + stats['misses']
+        stats['lookups'] = lookups
+        stats['hit_rate'] = round((stats['full_hits'] + stats['document_hits']) / lookups, 4) if lookups else None
+        return stats
+    
+    def clear(self):
+        """Drop all in-memory entries (persisted files are left alone)"""
+        with self._lock:
+            self._entries.clear()
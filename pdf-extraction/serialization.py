@@ -0,0 +1,195 @@
+"""
+Serialization - Writers and loaders for extraction results
+
+Formats:
+- json:         pretty-printed JSON (indent=2), the original save_results output
+- json-compact: minified JSON, encoded with orjson when installed
+- msgpack:      MessagePack (requires the msgpack package)
+- ndjson:       one JSON record per line: a 'result' header record followed
+                by one record per mission (or recurring mission record) and
+                per calendar event, so consumers can stream missions without
+                loading the rest
+
+All writers stream: the top-level keys and the elements of the large lists
+(missions, recurring mission records, calendar events) are encoded and written one at a time instead of
+building the whole document in memory first.
+"""
+
+import json
+from datetime import date, datetime
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Dict, Any, Iterator, IO, Optional
+
+ORJSON_AVAILABLE = find_spec('orjson') is not None
+MSGPACK_AVAILABLE = find_spec('msgpack') is not None
+
+FORMATS = ('json', 'json-compact', 'msgpack', 'ndjson')
+
+# Lists that are written element by element (and split into NDJSON records)
+STREAMED_LISTS = ('missions', 'recurring_missions', 'calendar_events')
+
+_EXTENSIONS = {
+    '.json': 'json',
+    '.msgpack': 'msgpack',
+    '.mpk': 'msgpack',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+def _default(value):
+    """Fallback encoder for non-JSON types (matches json.dump(default=str))"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+if ORJSON_AVAILABLE:
+    import orjson
+    
+    def dumps_compact(value) -> bytes:
+        """Minified UTF-8 JSON"""
+        return orjson.dumps(value, default=_default)
+    
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+    
+    def dumps_compact(value) -> bytes:
+        """Minified UTF-8 JSON"""
+        return _encoder.encode(value).encode('utf-8')
+    
+    loads = json.loads
+
+
+def format_for_path(path: str) -> str:
+    """Infer the format from a file extension (defaults to json)"""
+    return _EXTENSIONS.get(Path(path).suffix.lower(), 'json')
+
+
+def _write_json_compact(results: Dict[str, Any], f: IO[bytes]):
+    f.write(b'{')
+    for index, (key, value) in enumerate(results.items()):
+        if index:
+            f.write(b',')
+        f.write(dumps_compact(key) + b':')
+        if key in STREAMED_LISTS and isinstance(value, list):
+            f.write(b'[')
+            for item_index, item in enumerate(value):
+                if item_index:
+                    f.write(b',')
+                f.write(dumps_compact(item))
+            f.write(b']')
+        else:
+            f.write(dumps_compact(value))
+    f.write(b'}')
+
+
+def _write_json_pretty(results: Dict[str, Any], f: IO[bytes]):
+    encoder = json.JSONEncoder(indent=2, ensure_ascii=False, default=_default)
+    for chunk in encoder.iterencode(results):
+        f.write(chunk.encode('utf-8'))
+
+
+def _write_msgpack(results: Dict[str, Any], f: IO[bytes]):
+    import msgpack
+    
+    packer = msgpack.Packer(default=_default, use_bin_type=True)
+    f.write(packer.pack_map_header(len(results)))
+    for key, value in results.items():
+        f.write(packer.pack(key))
+        if key in STREAMED_LISTS and isinstance(value, list):
+            f.write(packer.pack_array_header(len(value)))
+            for item in value:
+                f.write(packer.pack(item))
+        else:
+            f.write(packer.pack(value))
+
+
+def _write_ndjson(results: Dict[str, Any], f: IO[bytes]):
+    # Streamed lists stay in the header as empty placeholders, so the loader
+    # recreates exactly the keys the result had
+    header = {
+        key: [] if key in STREAMED_LISTS and isinstance(value, list) else value
+        for key, value in results.items()
+    }
+    f.write(dumps_compact({'record_type': 'result', **header}) + b'\n')
+    for key in STREAMED_LISTS:
+        record_type = key[:-1]  # missions -> mission
+        value = results.get(key)
+        for item in value if isinstance(value, list) else []:
+            f.write(dumps_compact({'record_type': record_type, **item}) + b'\n')
+
+
+_WRITERS = {
+    'json': _write_json_pretty,
+    'json-compact': _write_json_compact,
+    'msgpack': _write_msgpack,
+    'ndjson': _write_ndjson,
+}
+
+
+def write_results(results: Dict[str, Any], output_path: str, format: Optional[str] = None):
+    """
+    Write extraction results to a file
+    
+    Args:
+        results: process_pdf result dictionary
+        output_path: Destination file
+        format: One of FORMATS (default: inferred from the extension)
+    """
+    format = format or format_for_path(output_path)
+    if format not in _WRITERS:
+        raise ValueError(f"Unsupported format: {format}")
+    if format == 'msgpack' and not MSGPACK_AVAILABLE:
+        raise RuntimeError("msgpack format requires the msgpack package (pip install msgpack)")
+    
+    with open(output_path, 'wb') as f:
+        _WRITERS[format](results, f)
+
+
+def iter_ndjson_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the records of an NDJSON results file one at a time"""
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def load_results(path: str, format: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Load results written by write_results
+    
+    Args:
+        path: File to read
+        format: One of FORMATS (default: inferred from the extension)
+        
+    Returns:
+        The result dictionary (NDJSON files are reassembled)
+    """
+    format = format or format_for_path(path)
+    
+    if format in ('json', 'json-compact'):
+        with open(path, 'rb') as f:
+            return loads(f.read())
+    
+    if format == 'msgpack':
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("msgpack format requires the msgpack package (pip install msgpack)")
+        import msgpack
+        with open(path, 'rb') as f:
+            return msgpack.unpack(f, raw=False)
+    
+    if format == 'ndjson':
+        results: Dict[str, Any] = {}
+        list_keys = {key[:-1]: key for key in STREAMED_LISTS}
+        for record in iter_ndjson_records(path):
+            record_type = record.pop('record_type', None)
+            if record_type == 'result':
+                results.update(record)
+            elif record_type in list_keys:
+                results.setdefault(list_keys[record_type], []).append(record)
+        return results
+    
+    raise ValueError(f"Unsupported format: {format}")
@@ -0,0 +1,122 @@
+"""
+Stage Store - Persisted per-stage outputs for incremental reprocessing
+
+Every pipeline stage has a logic version (PDFParser.STAGE_VERSIONS,
+NLPExtractor.STAGE_VERSIONS per sub-extractor, MissionGenerator.VERSION).
+For each treatment plan the store keeps every stage's output together with
+the version that produced it and a digest of the stage's input. When the plan
+is reprocessed, a stage whose version and input digest are unchanged returns
+its stored output and only the rest is re-run.
+
+Input digests are computed from the upstream stages' outputs, not their
+versions, so bumping a version only cascades downstream if the stage's output
+actually changed.
+
+Usage:
+    store = StageStore('stage-store/')
+    results = extractor.process_pdf(pdf_path, patient_id, plan_id, stage_store=store)
+    results['metadata']['stages']   # {'rerun': [...], 'reused': [...]}
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from serialization import dumps_compact, loads
+
+logger = logging.getLogger(__name__)
+
+# Bump when the record layout changes; older records are ignored
+RECORD_FORMAT = 1
+
+
+def content_digest(*values) -> str:
+    """Stable SHA-256 of JSON-serializable values (key order does not matter)"""
+    encoded = json.dumps(values, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class StageRecord:
+    """
+    Stored stage outputs of one plan, plus bookkeeping for the current run
+    
+    Stages are looked up with current(); re-computed outputs are stored with
+    put(). rerun and reused list the stages of this run in order.
+    """
+    
+    def __init__(self, stages: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.stages = stages or {}
+        self.rerun: List[str] = []
+        self.reused: List[str] = []
+    
+    def current(self, stage: str, version: str, input_digest: str) -> Optional[Dict[str, Any]]:
+        """Stored entry for stage if it was produced by this version from this input"""
+        entry = self.stages.get(stage)
+        if entry and entry['version'] == version and entry['input'] == input_digest:
+            self.reused.append(stage)
+            return entry
+        return None
+    
+    def put(self, stage: str, version: str, input_digest: str, output: Any):
+        """Store a freshly computed stage output"""
+        self.stages[stage] = {'version': version, 'input': input_digest, 'output': output}
+        self.rerun.append(stage)
+    
+    def summary(self) -> Dict[str, List[str]]:
+        return {'rerun': list(self.rerun), 'reused': list(self.reused)}
+
+
+class StageStore:
+    """
+    Directory of stage records, one file per treatment plan
+    
+    Writes are atomic (temporary file + rename), so a crashed run leaves the
+    previous record intact.
+    """
+    
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Where records are kept (created if missing)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+    
+    def _path(self, key: str) -> Path:
+        # Plan IDs come from callers; hash them rather than trusting them as file names
+        return self.directory / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json"
+    
+    def load(self, key: str) -> StageRecord:
+        """Record for key (empty if there is none or it is unreadable)"""
+        try:
+            data = loads(self._path(key).read_bytes())
+        except FileNotFoundError:
+            return StageRecord()
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable stage record for %s: %s", key, e)
+            return StageRecord()
+        if data.get('format') != RECORD_FORMAT or data.get('key') != key:
+            return StageRecord()
+        return StageRecord(data['stages'])
+    
+    def save(self, key: str, record: StageRecord):
+        """Persist record for key"""
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        data = {'format': RECORD_FORMAT, 'key': key, 'stages': record.stages}
+        try:
+            tmp_path.write_bytes(dumps_compact(data))
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning("Could not persist stage record for %s: %s", key, e)
+    
+    def delete(self, key: str):
+        """Forget key, forcing a full run next time"""
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,154 @@
+"""
+Concurrency Stress Test - Many concurrent process_pdf calls on one extractor
+
+Runs process_pdf from a thread pool against a single shared
+PDFTreatmentPlanExtractor, each call with its own start_date, patient and
+plan ID, and checks every result against a sequential reference run with the
+same arguments. Any cross-talk between calls (e.g. missions scheduled from
+another call's start_date) or exception in a concurrent call is reported
+and fails the run. The interpreter's thread switch interval is shortened
+during the concurrent phase so that threads interleave far more often than
+in normal operation.
+
+Exit status: 0 if every concurrent result matches its sequential reference,
+1 otherwise, so the script can gate a deployment or a CI job. spaCy does not
+document nlp() as thread-safe; a passing run shows that the model and PDF
+given here produced no divergence, not that every model is safe. Run it
+against the model you deploy.
+
+Usage:
+    python stress_concurrency.py path/to/plan.pdf --threads 8 --calls 64
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, Any, List
+
+from main_extractor import PDFTreatmentPlanExtractor
+
+
+def _comparable(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a result that must be identical for identical inputs"""
+    extracted = {k: v for k, v in result['extracted_data'].items() if k != 'extraction_metadata'}
+    return {
+        'extracted_data': extracted,
+        'sections': result['sections'],
+        'missions': result['missions'],
+        'calendar_events': result['calendar_events']
+    }
+
+
+def _check_result(result: Dict[str, Any], call: Dict[str, Any], expected: Dict[str, Any]) -> List[str]:
+    """Return a list of problems with one concurrent call's result"""
+    problems = []
+    missions = result['missions']
+    
+    if missions:
+        first_date = min(m['scheduled_date'] for m in missions)
+        if first_date != call['start_date'].isoformat():
+            problems.append(f"first mission on {first_date}, expected {call['start_date'].isoformat()}")
+    
+    wrong_owner = [
+        m for m in missions
+        if m['patient_id'] != call['patient_id'] or m['treatment_plan_id'] != call['treatment_plan_id']
+    ]
+    if wrong_owner:
+        problems.append(f"{len(wrong_owner)} missions carry another call's patient/plan ID")
+    
+    if _comparable(result) != expected:
+        problems.append("result differs from the sequential reference run")
+    
+    return problems
+
+
+def run_stress(
+    pdf_path: str,
+    threads: int = 8,
+    calls: int = 64,
+    nlp_model: str = 'en_core_web_sm',
+    switch_interval: float = 1e-5
+) -> Dict[str, Any]:
+    """
+    Run the stress test
+    
+    Returns:
+        Summary with timings and a list of failures (empty on success)
+    """
+    extractor = PDFTreatmentPlanExtractor(nlp_model).warm_up()
+    base_date = date(2025, 1, 1)
+    
+    call_args = [
+        {
+            'pdf_path': pdf_path,
+            'patient_id': f'patient-{i}',
+            'treatment_plan_id': f'plan-{i}',
+            'start_date': base_date + timedelta(days=7 * i + i % 5),
+            'default_points': 10 + i % 7
+        }
+        for i in range(calls)
+    ]
+    
+    # Sequential reference results
+    started = time.perf_counter()
+    expected = [_comparable(extractor.process_pdf(**args)) for args in call_args]
+    sequential_seconds = time.perf_counter() - started
+    
+    # Same calls, concurrently, on the same instance
+    previous_interval = sys.getswitchinterval()
+    sys.setswitchinterval(switch_interval)
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [pool.submit(extractor.process_pdf, **args) for args in call_args]
+            results = [f.exception() or f.result() for f in futures]
+        concurrent_seconds = time.perf_counter() - started
+    finally:
+        sys.setswitchinterval(previous_interval)
+    
+    failures = []
+    for args, result, reference in zip(call_args, results, expected):
+        if isinstance(result, BaseException):
+            failures.append(f"{args['treatment_plan_id']}: raised {type(result).__name__}: {result}")
+            continue
+        for problem in _check_result(result, args, reference):
+            failures.append(f"{args['treatment_plan_id']}: {problem}")
+    
+    return {
+        'calls': calls,
+        'threads': threads,
+        'sequential_seconds': sequential_seconds,
+        'concurrent_seconds': concurrent_seconds,
+        'failures': failures
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf_path', help='treatment plan PDF to process')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=64)
+    parser.add_argument('--model', default='en_core_web_sm', help='spaCy model name or path')
+    parser.add_argument('--switch-interval', type=float, default=1e-5,
+                        help='sys.setswitchinterval() value for the concurrent phase')
+    args = parser.parse_args(argv)
+    
+    summary = run_stress(args.pdf_path, args.threads, args.calls, args.model, args.switch_interval)
+    
+    print(f"{summary['calls']} calls on {summary['threads']} threads")
+    print(f"  sequential: {summary['sequential_seconds']:.2f}s")
+    print(f"  concurrent: {summary['concurrent_seconds']:.2f}s")
+    if summary['failures']:
+        print(f"FAIL: {len(summary['failures'])} problems")
+        for failure in summary['failures'][:20]:
+            print(f"  - {failure}")
+        return 1
+    
+    print("OK: every concurrent result matches its sequential reference")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
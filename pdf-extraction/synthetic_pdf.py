@@ -0,0 +1,286 @@
+"""
+Synthetic PDF - Generates realistic treatment-plan PDFs for benchmarks
+
+Writes PDF files directly (no reportlab or other dependency) with:
+- a diagnosis, exercises with frequency/instructions/importance, goals,
+  appointment schedule and DOs/DON'Ts in the layout the NLP patterns expect
+- a configurable number of text pages (padded with clinical notes)
+- "scanned" pages that carry only an image and no text layer
+- clinic boilerplate: running headers/footers and legal disclaimers
+
+Output is deterministic for a given seed, so benchmark runs are comparable.
+
+Usage:
+    python synthetic_pdf.py out.pdf --exercises 12 --pages 6 --scanned-pages 2
+"""
+
+import argparse
+import random
+import textwrap
+import zlib
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+LINES_PER_PAGE = 48
+LINE_WIDTH = 90
+
+EXERCISES = [
+    ('Pec Stretch', 'Neck, Right Shoulder', 'Stand in a doorway with your arm at a 90-degree angle. Gently lean forward until you feel a stretch in your chest.', 'Helps relieve tension in the pectoral muscles and improve posture.'),
+    ('Neck Retractions', 'Neck', 'Sit or stand with your back straight. Gently pull your head back, keeping your chin tucked.', 'Improves neck posture and reduces strain on the cervical spine.'),
+    ('Shoulder Blade Squeeze', 'Upper Back', 'Sit tall and squeeze your shoulder blades together. Hold, then relax slowly.', 'Strengthens the rhomboids and supports an upright posture.'),
+    ('Wall Angels', 'Shoulders, Upper Back', 'Stand with your back against a wall and slide your arms up and down keeping contact.', 'Restores overhead mobility of the shoulder.'),
+    ('Pendulum Exercise', 'Right Shoulder', 'Lean forward supported on a table and let the arm swing in small circles.', 'Reduces stiffness and keeps the joint moving without load.'),
+    ('External Rotation with Band', 'Right Shoulder', 'Keep the elbow at your side and rotate the forearm outward against the band.', 'Builds rotator cuff strength needed for overhead lifting.'),
+    ('Hamstring Stretch', 'Left Leg', 'Lie on your back and raise the straight leg until a stretch is felt behind the thigh.', 'Improves flexibility and reduces lower back strain.'),
+    ('Bridging Exercise', 'Lower Back, Hips', 'Lie on your back with knees bent and lift your hips until in line with your shoulders.', 'Strengthens the gluteal muscles and stabilises the pelvis.'),
+    ('Cat-Camel Mobility', 'Spine', 'On hands and knees, alternately round and arch your back in a slow rhythm.', 'Maintains spinal mobility and eases morning stiffness.'),
+    ('Calf Raise Strength', 'Ankles', 'Stand on a step and rise onto your toes, then lower slowly below the step.', 'Rebuilds calf strength after the ankle sprain.'),
+    ('Quad Sets', 'Right Knee', 'Sit with the leg straight and tighten the thigh muscle, pressing the knee down.', 'Activates the quadriceps without loading the knee joint.'),
+    ('Thoracic Rotation Stretch', 'Upper Back', 'Lie on your side with knees bent and rotate the top arm open towards the floor.', 'Improves rotation through the mid back.'),
+]
+
+FREQUENCIES = [
+    '{sets} sets x {seconds} seconds daily',
+    '{sets} sets x {reps} reps daily',
+    '{sets} sets x {reps} reps per day',
+    '{sets} sets x {seconds} seconds weekly',
+]
+
+GOALS = [
+    'Lift {kg} kg overhead pain-free in {weeks} weeks',
+    'Walk {km} km without pain within {weeks} weeks',
+    'Return to full range of motion by {weeks} weeks',
+]
+
+NOTES = [
+    'Patient reports intermittent pain rated 4/10, worse in the evening and after prolonged sitting.',
+    'Range of motion improved compared with the initial assessment; flexion remains limited at end range.',
+    'Reviewed posture at the workstation and discussed the height of the monitor and chair.',
+    'No red flags identified. Neurological screen unremarkable. Continue with the current plan.',
+    'Discussed pacing of daily activities and the expected timeline for recovery.',
+]
+
+BOILERPLATE = [
+    'This document is confidential and intended solely for the named patient and their care team.',
+    'If you experience severe pain, numbness or swelling, stop the exercises and contact the clinic.',
+    'The information in this plan does not replace an in-person assessment by a qualified clinician.',
+    'Please bring this plan to every appointment so that progress can be recorded accurately.',
+]
+
+
+def build_plan_lines(
+    exercises: int = 8,
+    boilerplate: int = 2,
+    seed: int = 0,
+    clinic: str = 'Riverside Physiotherapy Clinic'
+) -> List[str]:
+    """
+    Build the text lines of a treatment plan
+    
+    Args:
+        exercises: Number of exercises (the library repeats with numbered
+            variants when more are requested than it holds)
+        boilerplate: Number of disclaimer paragraphs
+        seed: Random seed for frequencies, goals and notes
+        clinic: Clinic name used in the letterhead
+        
+    Returns:
+        List of lines, blank strings separating paragraphs
+    """
+    rng = random.Random(seed)
+    lines = [clinic.upper(), 'TREATMENT PLAN', '', 'Diagnosis: Right shoulder impingement with postural neck pain', '']
+    
+    for i in range(exercises):
+        name, region, instructions, importance = EXERCISES[i % len(EXERCISES)]
+        if i >= len(EXERCISES):
+            name = f"{name} {i // len(EXERCISES) + 1}"
+        frequency = rng.choice(FREQUENCIES).format(
+            sets=rng.randint(2, 4), seconds=rng.choice([20, 30, 45, 60]), reps=rng.choice([8, 10, 12, 15])
+        )
+        lines.append(f"{i + 1}. {name} ({region})")
+        lines.append(f"Frequency: {frequency}")
+        lines.extend(textwrap.wrap(f"Instructions: {instructions}", LINE_WIDTH))
+        lines.extend(textwrap.wrap(f"Importance: {importance}", LINE_WIDTH))
+        lines.append('')
+    
+    lines.append('GOALS')
+    for template in rng.sample(GOALS, k=2):
+        lines.append('Goal: ' + template.format(kg=rng.randint(2, 10), km=rng.randint(2, 8), weeks=rng.randint(2, 8)))
+    lines.append('')
+    lines.append(f"Physiotherapy sessions {rng.randint(1, 3)}x per week for first {rng.randint(2, 6)} weeks")
+    lines.append('')
+    lines.append('DOs: Apply ice after exercising every evening. Keep moving within a comfortable range.')
+    lines.append("DON'Ts: Avoid heavy lifting above shoulder height. Do not sleep on the affected side.")
+    lines.append('')
+    
+    for _ in range(boilerplate):
+        lines.extend(textwrap.wrap(' '.join(rng.sample(BOILERPLATE, k=len(BOILERPLATE))), LINE_WIDTH))
+        lines.append('')
+    
+    return lines
+
+
+def paginate(lines: List[str], pages: Optional[int] = None, seed: int = 0) -> List[List[str]]:
+    """Split lines into pages, padding with clinical notes up to pages if given"""
+    rng = random.Random(seed + 1)
+    result = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    while pages is not None and len(result) < pages:
+        page = ['Clinical notes', '']
+        while len(page) < LINES_PER_PAGE - 3:
+            page.extend(textwrap.wrap(rng.choice(NOTES), LINE_WIDTH))
+            page.append('')
+        result.append(page)
+    return result
+
+
+def _escape(text: str) -> str:
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text_stream(lines: List[str], header: str, footer: str) -> bytes:
+    ops = [f"BT /F1 8 Tf 50 810 Td ({_escape(header)}) Tj ET"]
+    ops.append("BT /F1 11 Tf 14 TL 50 780 Td")
+    ops.extend(f"({_escape(line)}) Tj T*" for line in lines)
+    ops.append("ET")
+    ops.append(f"BT /F1 8 Tf 50 30 Td ({_escape(footer)}) Tj ET")
+    return '\n'.join(ops).encode('latin-1')
+
+
+def _scan_image(seed: int, width: int = 300, height: int = 400) -> bytes:
+    """Grayscale 'scan': light paper noise with dark text-like bars"""
+    rng = random.Random(seed)
+    pixels = bytearray()
+    for y in range(height):
+        is_text_row = (y // 6) % 3 == 0 and 30 < y < height - 30
+        for x in range(width):
+            if is_text_row and 25 < x < width - 25 and rng.random() < 0.6:
+                pixels.append(rng.randint(20, 80))
+            else:
+                pixels.append(rng.randint(225, 255))
+    return zlib.compress(bytes(pixels))
+
+
+def write_pdf(pages: List[Dict[str, Any]], path: str):
+    """
+    Write a PDF from page descriptions
+    
+    Each page is {'lines': [...], 'header': str, 'footer': str} for a text
+    page or {'scan_seed': int} for an image-only page.
+    """
+    objects: List[Optional[bytes]] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages tree, filled in once the page objects exist
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    
+    for page in pages:
+        if 'scan_seed' in page:
+            image = _scan_image(page['scan_seed'])
+            objects.append(
+                b"<< /Type /XObject /Subtype /Image /Width 300 /Height 400 /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n" % len(image)
+                + image + b"\nendstream"
+            )
+            image_id = len(objects)
+            content = b"q 612 0 0 792 0 0 cm /Im1 Do Q"
+            resources = f"<< /XObject << /Im1 {image_id} 0 R >> >>"
+        else:
+            content = _text_stream(page['lines'], page.get('header', ''), page.get('footer', ''))
+            resources = "<< /Font << /F1 3 0 R >> >>"
+        
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources {resources} /Contents {content_id} 0 R >>".encode()
+        )
+        kids.append(len(objects))
+    
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+    
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    
+    Path(path).write_bytes(bytes(out))
+
+
+def generate_plan_pdf(
+    path: str,
+    exercises: int = 8,
+    pages: Optional[int] = None,
+    scanned_pages: int = 0,
+    boilerplate: int = 2,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Generate a synthetic treatment-plan PDF
+    
+    Args:
+        path: Output file
+        exercises: Number of exercises in the plan
+        pages: Minimum number of text pages (padded with clinical notes)
+        scanned_pages: Image-only pages appended after the text pages
+        boilerplate: Disclaimer paragraphs, plus running headers/footers
+            on every page when non-zero
+        seed: Random seed
+        
+    Returns:
+        Description of the generated document
+    """
+    lines = build_plan_lines(exercises, boilerplate, seed)
+    text_pages = paginate(lines, pages, seed)
+    total = len(text_pages) + scanned_pages
+    
+    page_specs = []
+    for number, page_lines in enumerate(text_pages, 1):
+        page_specs.append({
+            'lines': page_lines,
+            'header': 'Riverside Physiotherapy Clinic - Confidential' if boilerplate else '',
+            'footer': f"Page {number} of {total} - Printed copy is uncontrolled" if boilerplate else ''
+        })
+    for i in range(scanned_pages):
+        page_specs.append({'scan_seed': seed * 1000 + i})
+    
+    write_pdf(page_specs, path)
+    
+    return {
+        'path': str(path),
+        'exercises': exercises,
+        'text_pages': len(text_pages),
+        'scanned_pages': scanned_pages,
+        'total_pages': total,
+        'boilerplate': boilerplate,
+        'seed': seed,
+        'size_bytes': Path(path).stat().st_size
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help='PDF file to write')
+    parser.add_argument('--exercises', type=int, default=8)
+    parser.add_argument('--pages', type=int, help='minimum number of text pages')
+    parser.add_argument('--scanned-pages', type=int, default=0)
+    parser.add_argument('--boilerplate', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    info = generate_plan_pdf(
+        args.output, args.exercises, args.pages, args.scanned_pages, args.boilerplate, args.seed
+    )
+    print(f"Wrote {info['path']}: {info['total_pages']} pages "
+          f"({info['scanned_pages']} scanned), {info['exercises']} exercises, {info['size_bytes']} bytes")
+
+
+if __name__ == '__main__':
+    main()
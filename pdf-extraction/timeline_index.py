@@ -0,0 +1,290 @@
+"""
+Timeline Index - Per-patient missions sorted by time for date-window queries
+
+Most reads of a patient's missions ask for a date window: today's missions
+(UserMatcher lobby matching), the missions starting within the next hour
+(reminders), the days of a month (calendar month view). Answering each by
+scanning the whole mission list and parsing every scheduled_date costs
+O(missions) per question and per patient.
+
+A TimelineIndex keeps one patient's missions sorted by scheduled date and
+time:
+
+- keys: an array('q') of seconds since 0001-01-01 (scheduled_date +
+  scheduled_time; untimed missions sort at the start of their day), parsed
+  once per distinct date/time string
+- missions: a parallel list of the missions themselves (dicts or
+  mission_model.Mission), unchanged; missions with the same key keep their
+  insertion order
+
+Window queries are two bisections plus a list slice, O(log n + k). add() and
+remove() keep the order incrementally (bisect + insert), so the index can
+follow status changes, reprocessing (see mission_diff.py) and new missions
+without a rebuild. Missions without a scheduled_date are in no window and
+are not indexed.
+
+Usage:
+    timeline = TimelineIndex.from_missions(results['missions'])
+    timeline.on(date.today())                            # today's missions
+    timeline.upcoming(datetime.now(), timedelta(hours=1))  # reminders
+    timeline.month(2026, 3)                              # {date: [missions]}
+    timeline.add(mission); timeline.remove(mission)
+
+    timelines = build_timelines(all_missions)            # {patient_id: TimelineIndex}
+    matcher.find_matching_users(user_id, timelines[user_id], users, timelines)
+
+    python timeline_index.py extraction.json --patients 2000
+"""
+
+import argparse
+import calendar
+import json
+import sys
+import time as timer
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple, Union
+
+_DAY_SECONDS = 86400
+
+
+@lru_cache(maxsize=8192)
+def _day_seconds(value: str) -> int:
+    """Seconds from 0001-01-01 to the start of an ISO date"""
+    return date.fromisoformat(value).toordinal() * _DAY_SECONDS
+
+
+@lru_cache(maxsize=1024)
+def _time_seconds(value: str) -> int:
+    clock = time.fromisoformat(value)
+    return clock.hour * 3600 + clock.minute * 60 + clock.second
+
+
+def timeline_key(mission: Dict[str, Any]) -> Optional[int]:
+    """Sort key of a mission (None without a scheduled_date)"""
+    scheduled_date = mission.get('scheduled_date')
+    if not scheduled_date:
+        return None
+    scheduled_time = mission.get('scheduled_time')
+    return _day_seconds(scheduled_date) + (_time_seconds(scheduled_time) if scheduled_time else 0)
+
+
+def _moment(value: Union[date, datetime]) -> int:
+    """Key of a window bound (a date is its start of day)"""
+    if isinstance(value, datetime):
+        return (
+            value.toordinal() * _DAY_SECONDS
+            + value.hour * 3600 + value.minute * 60 + value.second
+            + (1 if value.microsecond else 0)
+        )
+    return value.toordinal() * _DAY_SECONDS
+
+
+class TimelineIndex:
+    """
+    Missions of one patient sorted by scheduled date and time
+    
+    Window bounds are dates (start of day) or naive datetimes in the
+    missions' local time; windows are half-open, [start, end).
+    """
+    
+    def __init__(self, missions: Iterable[Dict[str, Any]] = ()):
+        self._keys = array('q')
+        self._missions: List[Dict[str, Any]] = []
+        self.extend(missions)
+    
+    @classmethod
+    def from_missions(cls, missions: Iterable[Dict[str, Any]]) -> 'TimelineIndex':
+        return cls(missions)
+    
+    def __len__(self) -> int:
+        return len(self._missions)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Missions in timeline order"""
+        return iter(self._missions)
+    
+    def add(self, mission: Dict[str, Any]) -> bool:
+        """
+        Insert a mission in order (after missions with the same date and time)
+        
+        Returns:
+            False if the mission has no scheduled_date and was not indexed
+        """
+        key = timeline_key(mission)
+        if key is None:
+            return False
+        position = bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._missions.insert(position, mission)
+        return True
+    
+    def extend(self, missions: Iterable[Dict[str, Any]]):
+        """Add many missions with one sort instead of one insert each"""
+        entries = [(key, mission) for key, mission in ((timeline_key(m), m) for m in missions) if key is not None]
+        if not entries:
+            return
+        if self._missions:
+            entries = list(zip(self._keys, self._missions)) + entries
+        # Stable on the key alone: equal keys keep insertion order
+        entries.sort(key=lambda entry: entry[0])
+        self._keys = array('q', (key for key, _ in entries))
+        self._missions = [mission for _, mission in entries]
+    
+    def remove(self, mission: Dict[str, Any]):
+        """
+        Remove a mission: the same object if indexed, else an equal one
+        
+        Raises:
+            ValueError: If the mission is not in the index
+        """
+        key = timeline_key(mission)
+        if key is not None:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_right(self._keys, key, lo)
+            candidates = self._missions[lo:hi]
+            for offset, candidate in enumerate(candidates):
+                if candidate is mission:
+                    break
+            else:
+                offset = next((i for i, candidate in enumerate(candidates) if candidate == mission), None)
+            if offset is not None:
+                del self._keys[lo + offset]
+                del self._missions[lo + offset]
+                return
+        raise ValueError("Mission not in timeline")
+    
+    def _range(self, start: Union[date, datetime], end: Union[date, datetime]) -> Tuple[int, int]:
+        lo = bisect_left(self._keys, _moment(start))
+        return lo, bisect_left(self._keys, _moment(end), lo)
+    
+    def between(self, start: Union[date, datetime], end: Union[date, datetime]) -> List[Dict[str, Any]]:
+        """Missions scheduled in [start, end), in order"""
+        lo, hi = self._range(start, end)
+        return self._missions[lo:hi]
+    
+    def count_between(self, start: Union[date, datetime], end: Union[date, datetime]) -> int:
+        lo, hi = self._range(start, end)
+        return hi - lo
+    
+    def on(self, day: date) -> List[Dict[str, Any]]:
+        """Missions scheduled on a day"""
+        day = day.date() if isinstance(day, datetime) else day
+        return self.between(day, day + timedelta(days=1))
+    
+    def upcoming(self, now: datetime, within: timedelta = timedelta(hours=1)) -> List[Dict[str, Any]]:
+        """Missions starting in [now, now + within), e.g. for reminders"""
+        return self.between(now, now + within)
+    
+    def by_day(self, start: date, end: date) -> Dict[date, List[Dict[str, Any]]]:
+        """Missions of the days in [start, end) grouped by day (days without missions are left out)"""
+        lo, hi = self._range(start, end)
+        days: Dict[date, List[Dict[str, Any]]] = {}
+        position = lo
+        while position < hi:
+            ordinal = self._keys[position] // _DAY_SECONDS
+            day_end = bisect_left(self._keys, (ordinal + 1) * _DAY_SECONDS, position, hi)
+            days[date.fromordinal(ordinal)] = self._missions[position:day_end]
+            position = day_end
+        return days
+    
+    def month(self, year: int, month: int) -> Dict[date, List[Dict[str, Any]]]:
+        """by_day() for a calendar month view"""
+        first = date(year, month, 1)
+        return self.by_day(first, first + timedelta(days=calendar.monthrange(year, month)[1]))
+    
+    def first_date(self) -> Optional[date]:
+        return date.fromordinal(self._keys[0] // _DAY_SECONDS) if self._keys else None
+    
+    def last_date(self) -> Optional[date]:
+        return date.fromordinal(self._keys[-1] // _DAY_SECONDS) if self._keys else None
+
+
+def build_timelines(missions: Iterable[Dict[str, Any]], key: str = 'patient_id') -> Dict[Any, TimelineIndex]:
+    """
+    One TimelineIndex per patient
+    
+    Args:
+        missions: Missions of any number of patients
+        key: Mission field identifying the patient
+        
+    Returns:
+        Dict mapping patient -> TimelineIndex
+    """
+    by_patient: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    for mission in missions:
+        by_patient[mission.get(key)].append(mission)
+    return {patient: TimelineIndex(patient_missions) for patient, patient_missions in by_patient.items()}
+
+
+def _benchmark(extracted_data: Dict[str, Any], patients: int, queries: int) -> Dict[str, Any]:
+    """Today's missions for every patient: linear scan with parsing vs the index"""
+    from mission_generator import MissionGenerator
+    
+    generator = MissionGenerator(date(2026, 3, 1))
+    template = generator.generate_missions(extracted_data, 'plan', 'patient')
+    step = timedelta(days=1)
+    all_missions = {}
+    for patient in range(patients):
+        # Stagger start dates so patients are at different points of their plans
+        shift = step * (patient % 28)
+        all_missions[patient] = [
+            dict(m, patient_id=patient, scheduled_date=(date.fromisoformat(m['scheduled_date']) + shift).isoformat())
+            for m in template
+        ]
+    days = [date(2026, 3, 1) + step * (i % 56) for i in range(queries)]
+    
+    started = timer.perf_counter()
+    linear = [
+        sum(1 for m in missions if date.fromisoformat(m.get('scheduled_date', '')) == day)
+        for day in days for missions in all_missions.values()
+    ]
+    linear_seconds = timer.perf_counter() - started
+    
+    started = timer.perf_counter()
+    timelines = {patient: TimelineIndex(missions) for patient, missions in all_missions.items()}
+    build_seconds = timer.perf_counter() - started
+    started = timer.perf_counter()
+    indexed = [len(timeline.on(day)) for day in days for timeline in timelines.values()]
+    indexed_seconds = timer.perf_counter() - started
+    
+    return {
+        'patients': patients,
+        'missions': patients * len(template),
+        'queries': len(linear),
+        'linear_seconds': linear_seconds,
+        'build_seconds': build_seconds,
+        'indexed_seconds': indexed_seconds,
+        'identical': linear == indexed
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('extraction', help="result JSON (or its extracted_data) to give every patient")
+    parser.add_argument('--patients', type=int, default=1000, help='number of patients')
+    parser.add_argument('--days', type=int, default=7, help="days to ask every patient's missions for")
+    args = parser.parse_args(argv)
+    
+    with open(args.extraction) as f:
+        extracted_data = json.load(f)
+    extracted_data = extracted_data.get('extracted_data', extracted_data)
+    
+    report = _benchmark(extracted_data, args.patients, args.days)
+    print(f"{report['patients']} patients, {report['missions']} missions, {report['queries']} day queries")
+    print(f"  linear scan  {report['linear_seconds']:>7.3f} s")
+    print(f"  index        {report['indexed_seconds']:>7.3f} s  "
+          f"({report['linear_seconds'] / report['indexed_seconds']:.0f}x; "
+          f"built once in {report['build_seconds']:.3f} s)")
+    print(f"  identical:   {report['identical']}")
+    return 0 if report['identical'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,11 +2,16 @@
 User Matcher - Matches users with similar daily missions for lobby recommendations
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 from datetime import date, timedelta
 from collections import Counter
 import re
 
+from timeline_index import TimelineIndex
+
+# A user's missions: a list, or a TimelineIndex for date lookups without a scan
+Missions = Union[List[Dict[str, Any]], TimelineIndex]
+
 
 class UserMatcher:
     """
@@ -25,19 +30,20 @@ class UserMatcher:
     def find_matching_users(
         self,
         current_user_id: str,
-        current_user_missions: List[Dict[str, Any]],
+        current_user_missions: Missions,
         all_users: List[Dict[str, Any]],
-        all_user_missions: Dict[str, List[Dict[str, Any]]]
+        all_user_missions: Dict[str, Missions]
     ) -> List[Dict[str, Any]]:
         """
         Find users with similar daily missions
         
         Args:
             current_user_id: ID of the current user
-            current_user_missions: List of current user's missions
+            current_user_missions: Current user's missions (list or TimelineIndex)
             all_users: List of all user profiles (with patient_profiles)
-            all_user_missions: Dict mapping user_id -> list of missions
-            
+            all_user_missions: Dict mapping user_id -> missions (list or
+                TimelineIndex; see timeline_index.build_timelines())
+                
         Returns:
             List of matched users with similarity scores and match reasons
         """
@@ -45,10 +51,7 @@ class UserMatcher:
         
         # Get today's missions for current user
         today = date.today()
-        today_missions = [
-            m for m in current_user_missions
-            if date.fromisoformat(m.get('scheduled_date', '')) == today
-        ]
+        today_missions = self._missions_on(current_user_missions, today)
         
         # Extract mission characteristics
         current_mission_features = self._extract_mission_features(today_missions)
@@ -64,10 +67,7 @@ class UserMatcher:
                 continue
             
             # Get today's missions for this user
-            user_today_missions = [
-                m for m in user_missions
-                if date.fromisoformat(m.get('scheduled_date', '')) == today
-            ]
+            user_today_missions = self._missions_on(user_missions, today)
             
             if not user_today_missions:
                 continue
@@ -95,6 +95,13 @@ class UserMatcher:
         
         return matches
     
+    def _missions_on(self, missions: Missions, day: date) -> List[Dict[str, Any]]:
+        """Missions scheduled on a day: an index lookup, or a scan comparing ISO strings"""
+        if isinstance(missions, TimelineIndex):
+            return missions.on(day)
+        day = day.isoformat()
+        return [m for m in missions if m.get('scheduled_date') == day]
+    
     def _extract_mission_features(self, missions: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Extract features from missions for comparison"""
         features = {
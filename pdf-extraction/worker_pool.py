@@ -0,0 +1,572 @@
+"""
+Extractor Worker Pool - Long-lived processes that keep the spaCy model loaded
+
+Constructing PDFTreatmentPlanExtractor per request re-runs spacy.load and the
+Matcher setup every time. The pool starts its workers from a multiprocessing
+fork server that has loaded the model once (see pool_preload.py), so the
+model's memory is shared copy-on-write. The process creating the pool does
+not load the model and is never forked. Jobs wait in a queue in the parent
+and are handed to idle workers one at a time.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from datetime import date
+from multiprocessing.connection import wait as wait_for_ready
+from typing import Dict, Any, Optional
+
+from main_extractor import PDFTreatmentPlanExtractor
+from result_cache import ResultCache
+from instrumentation import METRICS, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised for a job whose worker process died while running it"""
+
+
+class PoolClosedError(RuntimeError):
+    """Raised when submitting to a pool that has been closed"""
+
+
+class JobTimeoutError(RuntimeError):
+    """Raised for a job that ran longer than its timeout (its worker is replaced)"""
+
+
+# Extractors loaded in the fork server (pool_preload.py), keyed by model name.
+# Workers forked from it find their model here; other workers load their own.
+_PRELOADED: Dict[str, PDFTreatmentPlanExtractor] = {}
+
+# Model the fork server preloads (read by pool_preload.py at its startup)
+PRELOAD_ENV = 'PDF_EXTRACTION_PRELOAD_MODEL'
+
+_fork_server_lock = threading.Lock()
+_fork_server_model: Optional[str] = None
+
+
+def _start_fork_server(nlp_model: str) -> bool:
+    """
+    Start the multiprocessing fork server with nlp_model preloaded
+    
+    There is one fork server per process; it is started by the first pool.
+    
+    Returns:
+        False if it is already running without nlp_model, in which case the
+        workers load the model themselves
+    """
+    global _fork_server_model
+    import multiprocessing.forkserver
+    
+    with _fork_server_lock:
+        if _fork_server_model is None:
+            os.environ[PRELOAD_ENV] = nlp_model
+            try:
+                multiprocessing.forkserver.set_forkserver_preload(['pool_preload'])
+                multiprocessing.forkserver.ensure_running()
+            finally:
+                del os.environ[PRELOAD_ENV]
+            _fork_server_model = nlp_model
+        return _fork_server_model == nlp_model
+
+
+def _worker_main(conn, nlp_model, cache_dir=None):
+    """Worker process loop: run jobs received on conn until told to stop"""
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    extractor = _PRELOADED.get(nlp_model)
+    if extractor is None:
+        extractor = PDFTreatmentPlanExtractor(nlp_model).warm_up()
+    if cache_dir:
+        # Workers share cached analyses through the directory
+        extractor.cache = ResultCache(directory=cache_dir)
+    
+    conn.send(('ready', os.getpid()))
+    
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return  # Parent went away
+        if task is None:
+            return
+        
+        job_id, kwargs = task
+        try:
+            result = extractor.process_pdf(**kwargs)
+        except Exception as e:
+            tb = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            conn.send(('failed', job_id, e, tb))
+        else:
+            conn.send(('done', job_id, result))
+
+
+class _WorkerState:
+    """Parent-side bookkeeping for one worker process"""
+    
+    def __init__(self, worker_id: int, process, conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.conn = conn
+        self.pid = process.pid
+        self.ready = False
+        self.stopping = False
+        self.jobs_completed = 0
+        self.current_job = None
+        # current_job's timeout and the time.monotonic() it must finish by
+        self.job_timeout: Optional[float] = None
+        self.job_deadline: Optional[float] = None
+        self.started_at = time.time()
+
+
+class ExtractorWorkerPool:
+    """
+    Pool of warm extractor processes with a submit/result API
+    
+    - The model is loaded once, in the fork server; workers share it
+      copy-on-write (gc.freeze there keeps the collector from touching it).
+      The pool's own process is not forked and its GC is left alone.
+    - Each worker has its own pipe and runs one job at a time, so a worker
+      that dies cannot wedge the others.
+    - Workers are recycled after max_jobs_per_worker jobs.
+    - Crashed workers are replaced; the job they were running fails with
+      WorkerCrashedError.
+    - A job submitted with job_timeout is timed from when a worker starts
+      it (not while it waits in the queue). A worker that overruns is
+      terminated and replaced, and the job fails with JobTimeoutError.
+      
+    Usage:
+        with ExtractorWorkerPool(num_workers=4) as pool:
+            job_id = pool.submit('plan.pdf', 'patient-1', 'plan-1')
+            results = pool.result(job_id, timeout=120)
+    """
+    
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        nlp_model: str = 'en_core_web_sm',
+        max_jobs_per_worker: Optional[int] = 200,
+        start_method: Optional[str] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        cache_dir: Optional[str] = None
+    ):
+        """
+        Start the pool
+        
+        Args:
+            num_workers: Number of worker processes (defaults to CPU count)
+            nlp_model: spaCy model name or path
+            max_jobs_per_worker: Recycle a worker after this many jobs (None: never)
+            start_method: multiprocessing start method; defaults to
+                'forkserver' where available so the preloaded model is
+                shared. With 'spawn' (or 'fork') every worker loads its own
+            metrics: Registry that job results are recorded into (defaults
+                to instrumentation.METRICS of the parent process)
+            cache_dir: Directory for a result cache shared by all workers
+                (see result_cache.py; None disables caching)
+        """
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.nlp_model = nlp_model
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.start_method = start_method
+        self.metrics = metrics if metrics is not None else METRICS
+        self.cache_dir = cache_dir
+        
+        self._ctx = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._futures: Dict[str, Future] = {}
+        self._job_timeouts: Dict[str, float] = {}
+        # (future, result, error) to resolve once the lock is released
+        self._settled = []
+        self._workers: Dict[int, _WorkerState] = {}
+        self._worker_ids = itertools.count(1)
+        self._job_ids = itertools.count(1)
+        self._closed = False
+        self._stats = {
+            'jobs_submitted': 0,
+            'jobs_completed': 0,
+            'jobs_failed': 0,
+            'jobs_timed_out': 0,
+            'workers_recycled': 0,
+            'workers_crashed': 0
+        }
+        
+        if start_method == 'forkserver' and not _start_fork_server(nlp_model):
+            logger.warning("Fork server preloads another model; %s is loaded per worker", nlp_model)
+        
+        with self._lock:
+            for _ in range(self.num_workers):
+                self._spawn_worker()
+        
+        self._collector = threading.Thread(
+            target=self._collect_results,
+            name='extractor-pool-collector',
+            daemon=True
+        )
+        self._collector.start()
+    
+    def _spawn_worker(self):
+        worker_id = next(self._worker_ids)
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.nlp_model, self.cache_dir),
+            name=f'extractor-worker-{worker_id}',
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._workers[worker_id] = _WorkerState(worker_id, process, parent_conn)
+    
+    def submit(
+        self,
+        pdf_path: str,
+        patient_id: str,
+        treatment_plan_id: str,
+        start_date: Optional[date] = None,
+        default_points: int = 50,
+        job_timeout: Optional[float] = None,
+        **options
+    ) -> str:
+        """
+        Queue a process_pdf job
+        
+        Args:
+            job_timeout: Seconds the job may run once a worker has started
+                it; the worker is then replaced and the job fails with
+                JobTimeoutError
+            options: Further process_pdf keyword arguments (e.g. profile_memory,
+                profile_cpu, cpu_profile_path)
+            (other arguments as for process_pdf)
+            
+        Returns:
+            Job ID to pass to result() / future()
+        """
+        with self._lock:
+            if self._closed:
+                raise PoolClosedError("Worker pool is closed")
+            job_id = f"job-{next(self._job_ids)}"
+            self._futures[job_id] = Future()
+            if job_timeout is not None:
+                self._job_timeouts[job_id] = job_timeout
+            self._stats['jobs_submitted'] += 1
+            self._pending.append((job_id, {
+                'pdf_path': pdf_path,
+                'patient_id': patient_id,
+                'treatment_plan_id': treatment_plan_id,
+                'start_date': start_date,
+                'default_points': default_points,
+                **options
+            }))
+            self._dispatch()
+        return job_id
+    
+    def future(self, job_id: str) -> Future:
+        """Future for a submitted job (usable with concurrent.futures / asyncio.wrap_future)"""
+        with self._lock:
+            try:
+                return self._futures[job_id]
+            except KeyError:
+                raise KeyError(f"Unknown job: {job_id}")
+    
+    def result(self, job_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait for a job and return its process_pdf result (or raise its error)"""
+        try:
+            return self.future(job_id).result(timeout)
+        finally:
+            self._forget(job_id)
+    
+    async def aresult(self, job_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Async variant of result()"""
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(self.future(job_id))),
+                timeout
+            )
+        finally:
+            self._forget(job_id)
+    
+    def process_pdf(self, *args, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """Submit a job and wait for its result"""
+        return self.result(self.submit(*args, **kwargs), timeout)
+    
+    def _forget(self, job_id: str):
+        with self._lock:
+            future = self._futures.get(job_id)
+            if future is not None and future.done():
+                del self._futures[job_id]
+    
+    def health(self) -> Dict[str, Any]:
+        """
+        Report pool health
+        
+        Returns:
+            Dictionary with 'healthy', per-worker state, queued job count
+            and lifetime counters
+        """
+        with self._lock:
+            workers = [
+                {
+                    'worker_id': w.worker_id,
+                    'pid': w.pid,
+                    'alive': w.process.is_alive(),
+                    'ready': w.ready,
+                    'jobs_completed': w.jobs_completed,
+                    'current_job': w.current_job,
+                    'uptime_seconds': round(time.time() - w.started_at, 1)
+                }
+                for w in self._workers.values()
+            ]
+            queued = len(self._pending)
+            stats = dict(self._stats)
+        
+        return {
+            'healthy': not self._closed and self._collector.is_alive() and all(w['alive'] for w in workers),
+            'closed': self._closed,
+            'workers': workers,
+            'queued_jobs': queued,
+            'running_jobs': sum(1 for w in workers if w['current_job']),
+            **stats
+        }
+    
+    def _dispatch(self):
+        """Hand queued jobs to idle workers (caller holds the lock)"""
+        for worker in self._workers.values():
+            if not self._pending:
+                break
+            if worker.current_job is not None or worker.stopping:
+                continue
+            
+            job_id, kwargs = self._pending.popleft()
+            future = self._futures.get(job_id)
+            if future is None or not future.set_running_or_notify_cancel():
+                self._job_timeouts.pop(job_id, None)
+                continue  # Cancelled while queued
+            try:
+                worker.conn.send((job_id, kwargs))
+            except (OSError, ValueError):
+                # Worker is gone; requeue and let _reap replace it
+                self._pending.appendleft((job_id, kwargs))
+                continue
+            worker.current_job = job_id
+            worker.job_timeout = self._job_timeouts.pop(job_id, None)
+            worker.job_deadline = time.monotonic() + worker.job_timeout if worker.job_timeout is not None else None
+        
+        if self._closed:
+            # Draining: stop workers that have nothing left to do
+            for worker in self._workers.values():
+                if not self._pending and worker.current_job is None:
+                    self._stop_worker(worker)
+    
+    def _stop_worker(self, worker: _WorkerState):
+        if not worker.stopping:
+            worker.stopping = True
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+    
+    def _collect_results(self):
+        """Collector thread: resolve futures and supervise worker processes"""
+        while True:
+            with self._lock:
+                if self._closed and not self._workers:
+                    return
+                waitables = {}
+                for worker in self._workers.values():
+                    waitables[worker.conn] = worker
+                    waitables[worker.process.sentinel] = worker
+            
+            for ready in wait_for_ready(list(waitables), timeout=0.5):
+                worker = waitables[ready]
+                with self._lock:
+                    if worker.worker_id not in self._workers:
+                        continue
+                    if ready is worker.conn:
+                        try:
+                            message = worker.conn.recv()
+                        except (EOFError, OSError):
+                            message = None
+                        if message is not None:
+                            self._handle_message(worker, message)
+                            continue
+                    self._reap(worker)
+            
+            with self._lock:
+                self._expire_jobs()
+                self._dispatch()
+            self._resolve_settled()
+    
+    def _resolve_settled(self):
+        """
+        Resolve futures finished under the lock
+        
+        Done-callbacks run synchronously in set_result, so futures are only
+        resolved with the lock released; callbacks may call back into the pool.
+        """
+        with self._lock:
+            settled, self._settled = self._settled, []
+        for future, result, error in settled:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+    
+    def _expire_jobs(self):
+        """Fail jobs that overran their timeout and replace their workers (caller holds the lock)"""
+        now = time.monotonic()
+        for worker in list(self._workers.values()):
+            if worker.current_job is None or worker.job_deadline is None or now < worker.job_deadline:
+                continue
+            job_id = worker.current_job
+            logger.warning("%s overran its timeout on worker %d; replacing the worker", job_id, worker.worker_id)
+            self._stats['jobs_failed'] += 1
+            self._stats['jobs_timed_out'] += 1
+            self.metrics.record_run({}, status='timeout')
+            future = self._futures.get(job_id)
+            if future:
+                self._settled.append((future, None, JobTimeoutError(
+                    f"{job_id} did not finish within {worker.job_timeout:g}s"
+                )))
+            # Stopping: _reap does not count it as a crash; its late result is never read
+            worker.stopping = True
+            worker.current_job = None
+            worker.process.terminate()
+            if not self._closed or self._pending:
+                self._spawn_worker()
+    
+    def _handle_message(self, worker: _WorkerState, message):
+        kind = message[0]
+        
+        if kind == 'ready':
+            worker.ready = True
+            return
+        
+        job_id = message[1]
+        if job_id != worker.current_job:
+            return  # Late result of a job that timed out
+        worker.current_job = None
+        worker.job_deadline = None
+        worker.jobs_completed += 1
+        future = self._futures.get(job_id)
+        if kind == 'done':
+            self._stats['jobs_completed'] += 1
+            self.metrics.record_run(message[2]['metadata'])
+            if future:
+                self._settled.append((future, message[2], None))
+        else:
+            self._stats['jobs_failed'] += 1
+            self.metrics.record_run({}, status='error')
+            if future:
+                self._settled.append((future, None, message[2]))
+        
+        if (
+            self.max_jobs_per_worker is not None
+            and worker.jobs_completed >= self.max_jobs_per_worker
+            and not self._closed
+        ):
+            # Recycle to bound memory growth; the replacement starts warm
+            self._stats['workers_recycled'] += 1
+            self._stop_worker(worker)
+            self._spawn_worker()
+    
+    def _reap(self, worker: _WorkerState):
+        """Handle a worker whose process exited (caller holds the lock)"""
+        worker.process.join()
+        worker.conn.close()
+        del self._workers[worker.worker_id]
+        if worker.stopping:
+            return
+        
+        self._stats['workers_crashed'] += 1
+        logger.warning(
+            "Extractor worker %d (pid %s) exited with code %s",
+            worker.worker_id,
+            worker.pid,
+            worker.process.exitcode
+        )
+        if worker.current_job:
+            future = self._futures.get(worker.current_job)
+            if future and not future.done():
+                self._stats['jobs_failed'] += 1
+                self._settled.append((future, None, WorkerCrashedError(
+                    f"Worker {worker.worker_id} died while processing {worker.current_job} "
+                    f"(exit code {worker.process.exitcode})"
+                )))
+        if not self._closed or self._pending:
+            self._spawn_worker()
+    
+    def close(self, wait: bool = True, timeout: Optional[float] = None):
+        """
+        Stop accepting jobs and shut the workers down
+        
+        Args:
+            wait: Let queued and running jobs finish first; if False, queued
+                jobs are cancelled and the workers are terminated
+            timeout: Seconds to wait for the pool to drain when wait is True;
+                afterwards queued jobs are cancelled and running workers are
+                terminated (their jobs fail with PoolClosedError)
+        """
+        cancelled = []
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not wait:
+                cancelled = [self._futures[job_id] for job_id, _ in self._pending]
+                self._pending.clear()
+            self._dispatch()
+        for future in cancelled:
+            future.cancel()
+        
+        if wait:
+            self._collector.join(timeout)
+        
+        with self._lock:
+            # Timed out (or not waiting): nothing more is dispatched, and
+            # _reap treats the terminated workers as stopped, not crashed
+            cancelled = [self._futures[job_id] for job_id, _ in self._pending if job_id in self._futures]
+            self._pending.clear()
+            workers = list(self._workers.values())
+            for worker in workers:
+                worker.stopping = True
+        for future in cancelled:
+            future.cancel()
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._collector.join()
+        self._resolve_settled()
+        
+        with self._lock:
+            unfinished = [future for future in self._futures.values() if not future.done()]
+        for future in unfinished:
+            if not future.done():
+                future.set_exception(PoolClosedError("Worker pool closed before the job finished"))
+    
+    def __enter__(self) -> 'ExtractorWorkerPool':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close(wait=exc_type is None)